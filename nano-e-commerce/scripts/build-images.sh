@@ -135,7 +135,8 @@ build_service() {
     fi
     
     # Build the image
-    if docker build -t "$image_name" "$service_dir"; then
+    # Shared Python packages (instrumentation, idempotency) are copied from the "shared" build context
+    if docker build -t "$image_name" --build-context shared=shared "$service_dir"; then
         print_status "✅ $service built successfully"
         SUCCESSFUL_BUILDS+=("$service")
         
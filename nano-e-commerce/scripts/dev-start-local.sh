@@ -111,8 +111,8 @@ run_service() {
     cd "$service_path"
     source venv/bin/activate
     
-    # Start the service in background
-    nohup python main.py > "../logs/$service_name.log" 2>&1 &
+    # Start the service in background; shared/ provides the instrumentation and idempotency packages
+    PYTHONPATH="../../shared${PYTHONPATH:+:$PYTHONPATH}" nohup python main.py > "../logs/$service_name.log" 2>&1 &
     local pid=$!
     echo "$pid" > "../logs/$service_name.pid"
     
@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlencode
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+
+# Per-route TTLs for anonymous catalog reads (seconds, 0 disables)
+CATALOG_CACHE_TTL_PRODUCTS = int(os.getenv("CATALOG_CACHE_TTL_PRODUCTS", "30"))
+CATALOG_CACHE_TTL_PRODUCT = int(os.getenv("CATALOG_CACHE_TTL_PRODUCT", "60"))
+CATALOG_CACHE_TTL_CATEGORIES = int(os.getenv("CATALOG_CACHE_TTL_CATEGORIES", "300"))
+# Bounds memory when clients vary the query string
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+
+
+def cache_key(request: Request) -> str:
+    """Path without trailing slash plus the query parameters in sorted order"""
+    path = request.url.path.rstrip("/") or "/"
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"{path}?{query}" if query else path
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # Weak comparison, as If-None-Match requires
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """In-process cache of rendered JSON responses with ETags.
+
+    Concurrent misses for the same key share one load, so a burst of identical
+    requests costs a single gRPC call.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (expires_at, body, etag)
+        self._inflight: dict[str, asyncio.Future] = {}
+
+        # Metrics
+        self.hits_total = 0
+        self.misses_total = 0
+        self.coalesced_total = 0
+        self.not_modified_total = 0
+
+    async def serve(self, request: Request, ttl: int, loader: Callable[[], Awaitable[Any]]) -> Response:
+        """Answer from the cache, or call `loader` for the response content and cache it for `ttl` seconds.
+
+        `loader` returns plain dicts/lists (see app.encoding), rendered once with orjson.
+        """
+        if ttl <= 0:
+            return ORJSONResponse(await loader())
+
+        key = cache_key(request)
+        entry = self._get(key)
+        if entry is not None:
+            self.hits_total += 1
+        else:
+            task = self._inflight.get(key)
+            if task is None:
+                self.misses_total += 1
+                task = asyncio.ensure_future(self._load(key, ttl, loader))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            else:
+                self.coalesced_total += 1
+            # A disconnecting client must not cancel the load other requests wait on
+            entry = await asyncio.shield(task)
+
+        expires_at, body, etag = entry
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={max(0, int(expires_at - time.monotonic()))}",
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            self.not_modified_total += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def _load(self, key: str, ttl: int, loader: Callable[[], Awaitable[Any]]):
+        # Errors (HTTPException included) reach every waiter and are not cached
+        body = orjson.dumps(await loader())
+        # Content hash: unchanged data keeps its ETag across refreshes
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = (time.monotonic() + ttl, body, etag)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "inflight": len(self._inflight),
+            "hits_total": self.hits_total,
+            "misses_total": self.misses_total,
+            "coalesced_total": self.coalesced_total,
+            "not_modified_total": self.not_modified_total,
+        }
+
+
+# Global cache instance
+response_cache = ResponseCache()
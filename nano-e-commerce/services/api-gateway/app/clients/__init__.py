@@ -1,6 +1,60 @@
 import grpc
+import itertools
 import os
+from collections import Counter
+from prometheus_client.core import GaugeMetricFamily
 from app.proto import user_pb2_grpc, product_pb2_grpc, cart_pb2_grpc, order_pb2_grpc, payment_pb2_grpc, store_pb2_grpc
+from instrumentation import register_collector
+from instrumentation.tracing import client_interceptors
+from app.clients.policy import PolicyStub
+
+# Channels opened per backend; each has its own HTTP/2 connection(s)
+GRPC_CHANNEL_POOL_SIZE = int(os.getenv("GRPC_CHANNEL_POOL_SIZE", "2"))
+# round_robin spreads calls over every address the target resolves to (use a
+# headless Service in k8s); pick_first pins each channel to one address
+GRPC_LB_POLICY = os.getenv("GRPC_LB_POLICY", "round_robin")
+# Pings detect dead connections (e.g. a pod that vanished) between calls
+GRPC_KEEPALIVE_TIME_MS = int(os.getenv("GRPC_KEEPALIVE_TIME_MS", "30000"))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.getenv("GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))
+
+CHANNEL_OPTIONS = [
+    ("grpc.lb_policy_name", GRPC_LB_POLICY),
+    ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+    ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # Without this, channels with identical arguments share subchannels and
+    # the pool collapses onto the same connections
+    ("grpc.use_local_subchannel_pool", 1),
+]
+
+
+class ChannelPool:
+    """Fixed set of channels to one backend; stubs are handed out round-robin"""
+
+    def __init__(self, target: str, stub_class, size: int = GRPC_CHANNEL_POOL_SIZE):
+        self.target = target
+        self.channels = [
+            grpc.aio.insecure_channel(target, options=CHANNEL_OPTIONS, interceptors=client_interceptors())
+            for _ in range(max(1, size))
+        ]
+        self._stubs = itertools.cycle([stub_class(channel) for channel in self.channels])
+
+    def stub(self):
+        return next(self._stubs)
+
+    def connect(self):
+        """Start connecting every idle channel without waiting"""
+        for channel in self.channels:
+            channel.get_state(try_to_connect=True)
+
+    def states(self) -> Counter:
+        return Counter(channel.get_state().name for channel in self.channels)
+
+    async def close(self):
+        for channel in self.channels:
+            await channel.close()
+
 
 class GRPCClients:
     def __init__(self):
@@ -11,31 +65,93 @@ class GRPCClients:
         self.order_service_addr = os.getenv("ORDER_SERVICE_ADDR", "order-service:50054")
         self.payment_service_addr = os.getenv("PAYMENT_SERVICE_ADDR", "payment-service:50055")
         self.store_service_addr = os.getenv("STORE_SERVICE_ADDR", "store-service:50056")
-        
-        # Initialize channels
-        self.user_channel = grpc.aio.insecure_channel(self.user_service_addr)
-        self.product_channel = grpc.aio.insecure_channel(self.product_service_addr)
-        self.cart_channel = grpc.aio.insecure_channel(self.cart_service_addr)
-        self.order_channel = grpc.aio.insecure_channel(self.order_service_addr)
-        self.payment_channel = grpc.aio.insecure_channel(self.payment_service_addr)
-        self.store_channel = grpc.aio.insecure_channel(self.store_service_addr)
-        
-        # Initialize stubs
-        self.user_stub = user_pb2_grpc.UserServiceStub(self.user_channel)
-        self.product_stub = product_pb2_grpc.ProductServiceStub(self.product_channel)
-        self.cart_stub = cart_pb2_grpc.CartServiceStub(self.cart_channel)
-        self.order_stub = order_pb2_grpc.OrderServiceStub(self.order_channel)
-        self.payment_stub = payment_pb2_grpc.PaymentServiceStub(self.payment_channel)
-        self.store_stub = store_pb2_grpc.StoreServiceStub(self.store_channel)
-    
+
+        # Channel pools are opened by connect() in each worker process
+        self.pools = {}
+        self.stubs = {}
+
+    # Calls go through the pool with the deadline/retry/hedging policy
+    @property
+    def user_stub(self) -> PolicyStub:
+        return self.stubs["user"]
+
+    @property
+    def product_stub(self) -> PolicyStub:
+        return self.stubs["product"]
+
+    @property
+    def cart_stub(self) -> PolicyStub:
+        return self.stubs["cart"]
+
+    @property
+    def order_stub(self) -> PolicyStub:
+        return self.stubs["order"]
+
+    @property
+    def payment_stub(self) -> PolicyStub:
+        return self.stubs["payment"]
+
+    @property
+    def store_stub(self) -> PolicyStub:
+        return self.stubs["store"]
+
+    def connect(self):
+        """Create the channel pools and open connections at startup instead of on the first request.
+
+        Called from the app lifespan, so every gateway worker gets its own
+        channels on its own event loop; none are inherited from the parent.
+        """
+        self.pools = {
+            "user": ChannelPool(self.user_service_addr, user_pb2_grpc.UserServiceStub),
+            "product": ChannelPool(self.product_service_addr, product_pb2_grpc.ProductServiceStub),
+            "cart": ChannelPool(self.cart_service_addr, cart_pb2_grpc.CartServiceStub),
+            "order": ChannelPool(self.order_service_addr, order_pb2_grpc.OrderServiceStub),
+            "payment": ChannelPool(self.payment_service_addr, payment_pb2_grpc.PaymentServiceStub),
+            "store": ChannelPool(self.store_service_addr, store_pb2_grpc.StoreServiceStub),
+        }
+        self.stubs = {service: PolicyStub(service, pool) for service, pool in self.pools.items()}
+        for pool in self.pools.values():
+            pool.connect()
+
     async def close(self):
         """Close all gRPC channels"""
-        await self.user_channel.close()
-        await self.product_channel.close()
-        await self.cart_channel.close()
-        await self.order_channel.close()
-        await self.payment_channel.close()
-        await self.store_channel.close()
+        for pool in self.pools.values():
+            await pool.close()
+        self.pools = {}
+        self.stubs = {}
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": GRPC_CHANNEL_POOL_SIZE,
+            "lb_policy": GRPC_LB_POLICY,
+            "channels": {
+                service: {"target": pool.target, "states": dict(pool.states()), **self.stubs[service].stats()}
+                for service, pool in self.pools.items()
+            },
+        }
+
+
+class ChannelStateCollector:
+    """Reports how many pooled channels per backend are in each connectivity state.
+
+    With several workers this is the pool of the worker answering the scrape.
+    """
+
+    def __init__(self, clients: GRPCClients):
+        self.clients = clients
+
+    def collect(self):
+        family = GaugeMetricFamily(
+            "grpc_client_channels", "Gateway gRPC channels by backend and connectivity state",
+            labels=["service", "state"]
+        )
+        for service, pool in self.clients.pools.items():
+            states = pool.states()
+            for state in grpc.ChannelConnectivity:
+                family.add_metric([service, state.name], states.get(state.name, 0))
+        yield family
+
 
 # Global clients instance
 grpc_clients = GRPCClients()
+register_collector(ChannelStateCollector(grpc_clients))
@@ -0,0 +1,250 @@
+"""Deadlines, retries and hedged requests for the gateway's gRPC calls.
+
+Every call made through a ``grpc_clients.*_stub`` gets a deadline. Idempotent
+reads are retried on UNAVAILABLE on another pooled channel, and the methods in
+HEDGED_METHODS can send a second copy when the first has not answered within
+the method's recent p95 latency. Retries and hedges spend tokens from a
+per-backend RetryBudget, so a struggling backend is not hit with a retry storm.
+Server-streaming methods (STREAM_METHODS) only get a deadline.
+"""
+import asyncio
+import os
+import random
+from collections import deque
+from typing import Optional
+
+import grpc
+from prometheus_client import Counter
+
+
+def parse_method_seconds(value: str) -> dict:
+    """Parse "Method=seconds" pairs separated by commas"""
+    result = {}
+    for entry in value.split(","):
+        method, _, seconds = entry.strip().partition("=")
+        if method and seconds:
+            result[method] = float(seconds)
+    return result
+
+
+# Deadline for any call not listed below
+GRPC_DEFAULT_DEADLINE = float(os.getenv("GRPC_DEFAULT_DEADLINE", "5"))  # seconds
+# Slow by design: password hashing, order creation across services, Stripe
+METHOD_DEADLINES = {
+    "Register": 10.0,
+    "Login": 10.0,
+    "CreateOrder": 10.0,
+    "CreatePayment": 15.0,
+    "CreateRefund": 15.0,
+    # Overrides, e.g. GRPC_DEADLINES="GetProduct=1,CreateOrder=8"
+    **parse_method_seconds(os.getenv("GRPC_DEADLINES", "")),
+}
+
+# Server-streaming exports. They are never retried, because rows may already
+# have been passed on. Their deadline stays within the services'
+# GRPC_MAX_CONNECTION_AGE_GRACE_MS, so a recycled connection does not cut them off
+STREAM_METHODS = frozenset({"ExportStoreOrders", "ExportUserPayments"})
+GRPC_STREAM_DEADLINE = float(os.getenv("GRPC_STREAM_DEADLINE", "120"))  # seconds
+
+# Reads that are safe to send more than once
+READ_METHODS = frozenset({
+    "GetUser", "ValidateToken", "GetAddresses",
+    "GetProduct", "ListProducts", "SearchProducts", "ListStoreProducts", "GetCategories", "CheckStock",
+    "GetCart", "GetCartCount",
+    "GetOrder", "GetUserOrders", "GetStoreOrders",
+    "GetPayment", "GetRefund",
+    "GetStore", "GetStoresByIds", "GetUserStores", "GetStoreStats", "GetStoreProducts",
+})
+RETRYABLE_CODES = frozenset({grpc.StatusCode.UNAVAILABLE})
+
+GRPC_MAX_ATTEMPTS = int(os.getenv("GRPC_MAX_ATTEMPTS", "3"))
+GRPC_RETRY_BACKOFF = float(os.getenv("GRPC_RETRY_BACKOFF_MS", "50")) / 1000
+GRPC_RETRY_BACKOFF_MAX = float(os.getenv("GRPC_RETRY_BACKOFF_MAX_MS", "1000")) / 1000
+# Each call earns RATIO tokens, each retry or hedge spends one; at most MAX saved up
+GRPC_RETRY_BUDGET_RATIO = float(os.getenv("GRPC_RETRY_BUDGET_RATIO", "0.1"))
+GRPC_RETRY_BUDGET_MAX = float(os.getenv("GRPC_RETRY_BUDGET_MAX", "10"))
+
+HEDGED_METHODS = frozenset({"GetProduct", "GetCart"})
+GRPC_HEDGING_ENABLED = os.getenv("GRPC_HEDGING_ENABLED", "false").lower() == "true"
+GRPC_HEDGE_PERCENTILE = float(os.getenv("GRPC_HEDGE_PERCENTILE", "0.95"))
+# Used until the method has enough latency samples
+GRPC_HEDGE_DELAY = float(os.getenv("GRPC_HEDGE_DELAY_MS", "50")) / 1000
+GRPC_HEDGE_MIN_SAMPLES = 100
+GRPC_HEDGE_WINDOW = 1000
+
+RETRIES = Counter(
+    "grpc_client_retries_total", "gRPC call attempts retried after a retryable error", ["service", "method"]
+)
+HEDGES = Counter(
+    "grpc_client_hedges_total", "Hedged gRPC attempts sent", ["service", "method"]
+)
+HEDGE_WINS = Counter(
+    "grpc_client_hedge_wins_total", "Hedged gRPC attempts that answered first", ["service", "method"]
+)
+BUDGET_EXHAUSTED = Counter(
+    "grpc_client_retry_budget_exhausted_total", "Retries or hedges skipped for lack of budget", ["service"]
+)
+DEADLINES_EXCEEDED = Counter(
+    "grpc_client_deadline_exceeded_total", "gRPC calls that ran out of time", ["service", "method"]
+)
+
+
+class RetryBudget:
+    """Token bucket capping retries and hedges to a fraction of calls"""
+
+    def __init__(self, ratio: float = GRPC_RETRY_BUDGET_RATIO, max_tokens: float = GRPC_RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LatencyWindow:
+    """Recent successful call latencies, for the hedge delay"""
+
+    def __init__(self, size: int = GRPC_HEDGE_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._sorted = []
+        self._since_sort = 0
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self._since_sort += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self._samples) < GRPC_HEDGE_MIN_SAMPLES:
+            return None
+        # Re-sorting every call would cost more than the hedge saves
+        if self._since_sort >= len(self._samples) // 10:
+            self._sorted = sorted(self._samples)
+            self._since_sort = 0
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class PolicyStub:
+    """Stub-like object that applies the call policy to every method of one backend"""
+
+    def __init__(self, service: str, pool):
+        self.service = service
+        self.pool = pool
+        self.budget = RetryBudget()
+        self._latency = {}  # method -> LatencyWindow
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        if method in STREAM_METHODS:
+            def stream(request, timeout: Optional[float] = None, metadata=None):
+                # Returns the call itself; iterate it with `async for`
+                timeout = timeout if timeout is not None else METHOD_DEADLINES.get(method, GRPC_STREAM_DEADLINE)
+                return getattr(self.pool.stub(), method)(request, timeout=timeout, metadata=metadata)
+            stream.__name__ = method
+            return stream
+
+        async def call(request, timeout: Optional[float] = None, metadata=None):
+            return await self._call(method, request, timeout, metadata)
+        call.__name__ = method
+        return call
+
+    async def _call(self, method: str, request, timeout: Optional[float], metadata):
+        loop = asyncio.get_running_loop()
+        timeout = timeout if timeout is not None else METHOD_DEADLINES.get(method, GRPC_DEFAULT_DEADLINE)
+        deadline = loop.time() + timeout
+        self.budget.deposit()
+
+        try:
+            if method not in READ_METHODS:
+                return await self._attempt(method, request, deadline, metadata)
+            if GRPC_HEDGING_ENABLED and method in HEDGED_METHODS:
+                return await self._hedged(method, request, deadline, metadata)
+            return await self._with_retries(method, request, deadline, metadata)
+        except grpc.aio.AioRpcError as e:
+            if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                DEADLINES_EXCEEDED.labels(self.service, method).inc()
+            raise
+
+    async def _attempt(self, method: str, request, deadline: float, metadata):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        # Each attempt takes the next pooled channel
+        stub = self.pool.stub()
+        response = await getattr(stub, method)(request, timeout=max(0.0, deadline - start), metadata=metadata)
+        self._window(method).add(loop.time() - start)
+        return response
+
+    async def _with_retries(self, method: str, request, deadline: float, metadata):
+        loop = asyncio.get_running_loop()
+        attempt = 1
+        while True:
+            try:
+                return await self._attempt(method, request, deadline, metadata)
+            except grpc.aio.AioRpcError as e:
+                if e.code() not in RETRYABLE_CODES or attempt >= GRPC_MAX_ATTEMPTS:
+                    raise
+                # Full jitter, and never sleep past the deadline
+                backoff = random.uniform(0, min(GRPC_RETRY_BACKOFF_MAX, GRPC_RETRY_BACKOFF * 2 ** (attempt - 1)))
+                if loop.time() + backoff >= deadline:
+                    raise
+                if not self.budget.withdraw():
+                    BUDGET_EXHAUSTED.labels(self.service).inc()
+                    raise
+                RETRIES.labels(self.service, method).inc()
+                await asyncio.sleep(backoff)
+                attempt += 1
+
+    async def _hedged(self, method: str, request, deadline: float, metadata):
+        delay = self._window(method).percentile(GRPC_HEDGE_PERCENTILE) or GRPC_HEDGE_DELAY
+        # The primary is retried on UNAVAILABLE like any other read; the hedge is one attempt
+        primary = asyncio.ensure_future(self._with_retries(method, request, deadline, metadata))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            if not self.budget.withdraw():
+                BUDGET_EXHAUSTED.labels(self.service).inc()
+                return await primary
+
+            HEDGES.labels(self.service, method).inc()
+            hedge = asyncio.ensure_future(self._attempt(method, request, deadline, metadata))
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            HEDGE_WINS.labels(self.service, method).inc()
+                        return task.result()
+                    error = task.exception()
+            # Both attempts failed
+            raise error
+        finally:
+            # Also runs when the caller is cancelled, so no attempt is left running
+            for task in pending:
+                task.cancel()
+
+    def _window(self, method: str) -> LatencyWindow:
+        window = self._latency.get(method)
+        if window is None:
+            window = self._latency[method] = LatencyWindow()
+        return window
+
+    def stats(self) -> dict:
+        return {
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "hedge_delays_ms": {
+                method: round(p * 1000, 2)
+                for method, window in self._latency.items()
+                if method in HEDGED_METHODS and (p := window.percentile(GRPC_HEDGE_PERCENTILE)) is not None
+            },
+        }
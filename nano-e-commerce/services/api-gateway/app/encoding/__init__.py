@@ -0,0 +1,218 @@
+"""Direct protobuf-to-JSON encoding for hot gateway routes.
+
+Building pydantic response models and letting FastAPI validate and serialize
+them again through ``response_model`` dominates the CPU cost of large pages.
+Hot routes instead turn protobuf messages into plain dicts with the functions
+below and return them in an ``ORJSONResponse``. The routes keep their
+``response_model`` so the OpenAPI schema is unchanged; FastAPI skips response
+validation when a route returns a Response.
+
+Each function must produce exactly the fields of the response model it stands
+in for (see ``benchmarks/encode_responses.py``, which checks this).
+"""
+from app.proto import order_pb2, payment_pb2, store_pb2
+
+
+def product_json(product) -> dict:
+    """product_pb2.Product as a ProductResponse"""
+    return {
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "category_id": product.category_id,
+        "store_id": product.store_id,
+        "stock_quantity": product.stock,
+        "images": list(product.images),
+        "attributes": dict(product.attributes),
+        "is_active": product.status == "active",
+        "created_at": product.created_at,
+    }
+
+
+def category_json(category) -> dict:
+    """product_pb2.Category as a CategoryResponse"""
+    return {
+        "id": category.id,
+        "name": category.name,
+        "description": category.description,
+        "parent_id": category.parent_id if category.parent_id > 0 else None,
+        "image": category.image,
+        "is_active": category.status == "active",
+    }
+
+
+def cart_item_json(item) -> dict:
+    """cart_pb2.CartItem as a CartItemResponse"""
+    return {
+        "id": item.id,
+        "product_id": item.product_id,
+        "product_name": item.product_name,
+        "product_image": item.product_image,
+        "quantity": item.quantity,
+        "price": item.price,
+        "selected": item.selected,
+    }
+
+
+def cart_json(cart) -> dict:
+    """cart_pb2.Cart as a CartResponse"""
+    return {
+        "user_id": cart.user_id,
+        "items": [cart_item_json(item) for item in cart.items],
+        "total_count": cart.total_count,
+        "total_amount": cart.total_amount,
+        "total_selected_count": cart.total_selected_count,
+    }
+
+
+def store_json(store) -> dict:
+    """store_pb2.Store as a StoreSummaryResponse"""
+    return {
+        "id": store.id,
+        "name": store.name,
+        "description": store.description,
+        "logo": store.logo,
+        "banner": store.banner,
+        "status": store_pb2.StoreStatus.Name(store.status).lower(),
+        "business_hours": store.business_hours,
+    }
+
+
+def address_json(address) -> dict:
+    """user_pb2.Address as an AddressResponse"""
+    return {
+        "id": address.id,
+        "name": address.name,
+        "phone": address.phone,
+        "province": address.province,
+        "city": address.city,
+        "district": address.district,
+        "detail": address.detail,
+        "postal_code": address.postal_code,
+        "is_default": address.is_default,
+    }
+
+
+def order_item_json(item) -> dict:
+    """order_pb2.OrderItem as an OrderItemResponse"""
+    return {
+        "product_id": item.product_id,
+        "product_name": item.product_name,
+        "product_image": item.product_image,
+        "quantity": item.quantity,
+        "price": item.price,
+        "total_price": item.total_price,
+    }
+
+
+def order_json(order) -> dict:
+    """order_pb2.Order as an OrderResponse"""
+    address = order.address
+    shipping = order.shipping
+    return {
+        "id": order.id,
+        "order_no": order.order_no,
+        "user_id": order.user_id,
+        "store_id": order.store_id,
+        "status": order_pb2.OrderStatus.Name(order.status).lower(),
+        "items": [order_item_json(item) for item in order.items],
+        "address": {
+            "name": address.name,
+            "phone": address.phone,
+            "province": address.province,
+            "city": address.city,
+            "district": address.district,
+            "detail": address.detail,
+            "postal_code": address.postal_code,
+        },
+        "subtotal": order.subtotal,
+        "shipping_fee": order.shipping_fee,
+        "total_amount": order.total_amount,
+        "payment_method": order.payment_method,
+        "shipping": {
+            "company": shipping.company,
+            "tracking_number": shipping.tracking_number,
+            "status": shipping.status,
+        },
+        "remark": order.remark,
+        "created_at": order.created_at,
+        "paid_at": order.paid_at,
+        "shipped_at": order.shipped_at,
+        "completed_at": order.completed_at,
+    }
+
+
+# One row per order in CSV exports; items are summed up
+ORDER_CSV_COLUMNS = [
+    "id", "order_no", "user_id", "status", "item_count", "subtotal", "shipping_fee", "total_amount",
+    "payment_method", "tracking_number", "created_at", "paid_at", "shipped_at", "completed_at",
+]
+
+
+def order_csv_row(order) -> list:
+    return [
+        order.id,
+        order.order_no,
+        order.user_id,
+        order_pb2.OrderStatus.Name(order.status).lower(),
+        sum(item.quantity for item in order.items),
+        order.subtotal,
+        order.shipping_fee,
+        order.total_amount,
+        order.payment_method,
+        order.shipping.tracking_number,
+        order.created_at,
+        order.paid_at,
+        order.shipped_at,
+        order.completed_at,
+    ]
+
+
+def payment_json(payment) -> dict:
+    """payment_pb2.Payment as a PaymentResponse"""
+    return {
+        "id": payment.id,
+        "payment_id": payment.payment_id,
+        "order_id": payment.order_id,
+        "amount": payment.amount,
+        "method": payment_pb2.PaymentMethod.Name(payment.method).lower(),
+        "status": payment_pb2.PaymentStatus.Name(payment.status).lower(),
+        "created_at": payment.created_at,
+        "paid_at": payment.paid_at,
+    }
+
+
+PAYMENT_CSV_COLUMNS = ["id", "payment_id", "order_id", "amount", "method", "status", "created_at", "paid_at"]
+
+
+def payment_csv_row(payment) -> list:
+    row = payment_json(payment)
+    return [row[column] for column in PAYMENT_CSV_COLUMNS]
+
+
+def store_detail_json(store) -> dict:
+    """store_pb2.Store as a StoreResponse, with the fields only its owner sees"""
+    return {
+        **store_json(store),
+        "owner_id": store.owner_id,
+        "phone": store.phone,
+        "email": store.email,
+        "address": store.address,
+        "business_license": store.business_license,
+        "settings": dict(store.settings),
+        "created_at": store.created_at,
+    }
+
+
+def store_product_json(product) -> dict:
+    """store_pb2.StoreProduct as a StoreProductResponse"""
+    return {
+        "id": product.id,
+        "name": product.name,
+        "price": product.price,
+        "stock": product.stock,
+        "status": product.status,
+        "image": product.image,
+        "created_at": product.created_at,
+    }
@@ -1,59 +1,142 @@
-from fastapi import HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import HTTPException, Depends, Request, status
+from fastapi.security import HTTPBearer
 from jose import JWTError, jwt
+from collections import OrderedDict
 from typing import Optional
 import os
+import time
+
+from app.middleware.revocation import revocation_filter
 
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 
-security = HTTPBearer()
+# Key used for tokens without a "kid" header; same default as user-service
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
+
+# Recently verified tokens whose signature check can be skipped
+JWT_VERIFY_CACHE_SIZE = int(os.getenv("JWT_VERIFY_CACHE_SIZE", "10000"))
+
+
+def load_key_set(value: str) -> dict:
+    """Parse JWT_KEYS, a comma-separated list of kid:secret pairs.
+
+    Shared with user-service, which signs with JWT_ACTIVE_KID. To rotate, add
+    the new key everywhere, switch the active kid, then drop the old key once
+    its tokens have expired.
+    """
+    keys = {}
+    for entry in value.split(","):
+        kid, _, secret = entry.strip().partition(":")
+        if kid and secret:
+            keys[kid] = secret
+    return keys
+
+
+JWT_KEYS = load_key_set(os.getenv("JWT_KEYS", ""))
+
+
+class TokenVerifier:
+    """Verifies JWTs against the local key set with an LRU of verified tokens"""
+
+    def __init__(self, keys: dict, default_key: str, cache_size: int = JWT_VERIFY_CACHE_SIZE):
+        self.keys = keys
+        self.default_key = default_key
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # token -> claims
+        self.hits_total = 0
+        self.misses_total = 0
+        self.failures_total = 0
+
+    def _key_for(self, token: str) -> Optional[str]:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            return self.default_key
+        return self.keys.get(kid)
+
+    def verify(self, token: str) -> Optional[dict]:
+        """Return the token's claims, or None if it is invalid or expired"""
+        claims = self._cache.get(token)
+        if claims is not None:
+            # The signature was checked already; only expiry can change
+            exp = claims.get("exp")
+            if exp is not None and exp <= time.time():
+                del self._cache[token]
+                return None
+            self._cache.move_to_end(token)
+            self.hits_total += 1
+            return claims
+
+        self.misses_total += 1
+        try:
+            key = self._key_for(token)
+            if key is None:
+                self.failures_total += 1
+                return None
+            claims = jwt.decode(token, key, algorithms=[ALGORITHM])
+        except JWTError:
+            self.failures_total += 1
+            return None
+
+        if self.cache_size > 0:
+            self._cache[token] = claims
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return claims
+
+    def stats(self) -> dict:
+        return {
+            "keys": sorted(self.keys),
+            "cache_size": len(self._cache),
+            "cache_max_size": self.cache_size,
+            "hits_total": self.hits_total,
+            "misses_total": self.misses_total,
+            "failures_total": self.failures_total,
+        }
+
+
+# Global verifier instance
+token_verifier = TokenVerifier(JWT_KEYS, SECRET_KEY)
+
 
 class JWTBearer(HTTPBearer):
+    """Verifies the bearer token once per request and caches its claims on request.state.
+
+    Revocation is checked on every request against the local Bloom filter.
+    """
+
     def __init__(self, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
 
-    async def __call__(self, credentials: HTTPAuthorizationCredentials = Depends(security)):
-        if credentials:
-            if not credentials.scheme == "Bearer":
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="Invalid authentication scheme."
-                )
-            if not self.verify_jwt(credentials.credentials):
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="Invalid token or expired token."
-                )
-            return credentials.credentials
-        else:
+    async def __call__(self, request: Request) -> Optional[dict]:
+        claims = getattr(request.state, "jwt_claims", None)
+        if claims is not None:
+            return claims
+
+        credentials = await super(JWTBearer, self).__call__(request)
+        if not credentials:
+            return None
+
+        claims = token_verifier.verify(credentials.credentials)
+        if claims is not None and await revocation_filter.is_revoked(claims.get("jti")):
+            claims = None
+        if claims is None:
+            if not self.auto_error:
+                return None
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail="Invalid authorization code."
+                detail="Invalid token or expired token."
             )
 
-    def verify_jwt(self, jwtoken: str) -> bool:
-        try:
-            payload = jwt.decode(jwtoken, SECRET_KEY, algorithms=[ALGORITHM])
-            return payload is not None
-        except JWTError:
-            return False
+        request.state.jwt_claims = claims
+        return claims
+
 
 def decode_jwt(token: str) -> Optional[dict]:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
-        return None
+    return token_verifier.verify(token)
 
-def get_current_user_id(token: str = Depends(JWTBearer())) -> int:
-    payload = decode_jwt(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication token"
-        )
-    user_id: int = payload.get("user_id")
+
+def get_current_user_id(claims: dict = Depends(JWTBearer())) -> int:
+    user_id: int = claims.get("user_id")
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -61,16 +144,9 @@ def get_current_user_id(token: str = Depends(JWTBearer())) -> int:
         )
     return user_id
 
-def get_optional_user_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[int]:
+
+def get_optional_user_id(claims: Optional[dict] = Depends(JWTBearer(auto_error=False))) -> Optional[int]:
     """Get user ID from token if provided, otherwise return None"""
-    if not credentials:
+    if not claims:
         return None
-    
-    try:
-        payload = decode_jwt(credentials.credentials)
-        if payload:
-            return payload.get("user_id")
-    except:
-        pass
-    
-    return None
+    return claims.get("user_id")
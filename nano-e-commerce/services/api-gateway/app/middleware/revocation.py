@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from instrumentation import InstrumentedRedis
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+# Must match the filter user-service publishes
+REVOCATION_BLOOM_BITS = int(os.getenv("REVOCATION_BLOOM_BITS", str(1 << 20)))
+REVOCATION_BLOOM_HASHES = int(os.getenv("REVOCATION_BLOOM_HASHES", "7"))
+# How often each replica pulls the filter; bounds how long a revoked token keeps working
+REVOCATION_REFRESH_INTERVAL = float(os.getenv("REVOCATION_REFRESH_INTERVAL", "5"))
+
+REVOKED_TOKENS_KEY = "revoked_access_tokens"
+REVOKED_BLOOM_KEY = "revoked_access_tokens:bloom"
+
+
+def bloom_offsets(token_id: str, bits: int = REVOCATION_BLOOM_BITS,
+                  hashes: int = REVOCATION_BLOOM_HASHES) -> list[int]:
+    """Bit offsets for a token id (double hashing, same as user-service)"""
+    digest = hashlib.sha256(token_id.encode("utf-8")).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:16], "big") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class RevocationFilter:
+    """In-memory copy of the revoked access token Bloom filter.
+
+    A miss is answered locally. A hit is confirmed against the revocation
+    set in Redis, so false positives never reject a valid token.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self.redis = InstrumentedRedis.from_url(redis_url)
+        self._bits = b""
+        self.loaded_at = 0.0
+        self.refresh_failures_total = 0
+        self.checks_total = 0
+        self.filter_hits_total = 0
+        self.revoked_total = 0
+
+    async def refresh(self):
+        # Redis bitmaps are byte strings with the most significant bit first
+        self._bits = await self.redis.get(REVOKED_BLOOM_KEY) or b""
+        self.loaded_at = time.time()
+
+    def might_contain(self, token_id: str) -> bool:
+        bits = self._bits
+        for offset in bloom_offsets(token_id):
+            index = offset >> 3
+            if index >= len(bits) or not bits[index] & (0x80 >> (offset & 7)):
+                return False
+        return True
+
+    async def is_revoked(self, token_id: Optional[str]) -> bool:
+        self.checks_total += 1
+        if not token_id or not self.might_contain(token_id):
+            return False
+
+        self.filter_hits_total += 1
+        try:
+            revoked = await self.redis.zscore(REVOKED_TOKENS_KEY, token_id) is not None
+        except Exception as e:
+            # Cannot confirm; treat the token as revoked rather than let it through
+            logger.warning(f"Revocation check failed for token {token_id}: {e}")
+            revoked = True
+        if revoked:
+            self.revoked_total += 1
+        return revoked
+
+    def stats(self) -> dict:
+        return {
+            "filter_bytes": len(self._bits),
+            "loaded_at": self.loaded_at,
+            "refresh_failures_total": self.refresh_failures_total,
+            "checks_total": self.checks_total,
+            "filter_hits_total": self.filter_hits_total,
+            "revoked_total": self.revoked_total,
+        }
+
+    async def close(self):
+        await self.redis.close()
+
+
+# Global filter instance
+revocation_filter = RevocationFilter()
+
+
+async def refresh_revocation_filter():
+    """Periodically pull the published filter; keep the last copy if Redis is unreachable"""
+    while True:
+        try:
+            await revocation_filter.refresh()
+        except Exception as e:
+            revocation_filter.refresh_failures_total += 1
+            logger.error(f"Error refreshing revocation filter: {e}")
+        await asyncio.sleep(REVOCATION_REFRESH_INTERVAL)
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import Optional
 from app.clients import grpc_clients
@@ -19,12 +20,23 @@ class LoginRequest(BaseModel):
     email: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class TokenResponse(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str = "bearer"
+    expires_in: int
     user_id: int
     email: str
 
+class RefreshResponse(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
 class UserResponse(BaseModel):
     id: int
     email: str
@@ -52,6 +64,8 @@ async def register(request: RegisterRequest):
         
         return TokenResponse(
             access_token=response.token,
+            refresh_token=response.refresh_token,
+            expires_in=response.expires_in,
             user_id=response.user.id,
             email=response.user.email
         )
@@ -75,6 +89,8 @@ async def login(request: LoginRequest):
         
         return TokenResponse(
             access_token=response.token,
+            refresh_token=response.refresh_token,
+            expires_in=response.expires_in,
             user_id=response.user.id,
             email=response.user.email
         )
@@ -82,6 +98,43 @@ async def login(request: LoginRequest):
     except grpc.RpcError as e:
         raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
 
+@router.post("/refresh", response_model=RefreshResponse)
+async def refresh(request: RefreshRequest):
+    """Exchange a refresh token for a new access token and refresh token"""
+    try:
+        grpc_request = user_pb2.RefreshTokenRequest(refresh_token=request.refresh_token)
+        response = await grpc_clients.user_stub.RefreshToken(grpc_request)
+        
+        if not response.success:
+            raise HTTPException(status_code=401, detail=response.message)
+        
+        return RefreshResponse(
+            access_token=response.token,
+            refresh_token=response.refresh_token,
+            expires_in=response.expires_in
+        )
+        
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.post("/logout")
+async def logout(
+    user_id: int = Depends(get_current_user_id),
+    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())
+):
+    """Revoke the current access token and end its refresh token session"""
+    try:
+        grpc_request = user_pb2.LogoutRequest(token=credentials.credentials)
+        response = await grpc_clients.user_stub.Logout(grpc_request)
+        
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+        
+        return {"message": response.message}
+        
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user(user_id: int = Depends(get_current_user_id)):
     """Get current user profile"""
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List
 from app.clients import grpc_clients
+from app.encoding import cart_json
 from app.middleware import get_current_user_id
 from app.proto import cart_pb2
 import grpc
@@ -103,26 +105,8 @@ async def get_cart(user_id: int = Depends(get_current_user_id)):
         if not response.success:
             raise HTTPException(status_code=400, detail=response.message)
         
-        cart = response.cart
-        items = []
-        for item in cart.items:
-            items.append(CartItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                product_name=item.product_name,
-                product_image=item.product_image,
-                quantity=item.quantity,
-                price=item.price,
-                selected=item.selected
-            ))
-        
-        return CartResponse(
-            user_id=cart.user_id,
-            items=items,
-            total_count=cart.total_count,
-            total_amount=cart.total_amount,
-            total_selected_count=cart.total_selected_count
-        )
+        # Encoded straight from the proto; response_model only documents it
+        return ORJSONResponse(cart_json(response.cart))
         
     except grpc.RpcError as e:
         raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
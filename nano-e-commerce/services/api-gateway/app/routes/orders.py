@@ -0,0 +1,195 @@
+from fastapi import APIRouter, HTTPException, Query, Depends, Header
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from typing import List, Optional
+from app.clients import grpc_clients
+from app.encoding import order_json
+from app.middleware import get_current_user_id
+from app.proto import order_pb2
+import grpc
+
+router = APIRouter(prefix="/api/v1/orders", tags=["Orders"])
+
+class OrderItemRequest(BaseModel):
+    product_id: int
+    quantity: int
+
+class OrderAddress(BaseModel):
+    name: str
+    phone: str
+    province: str
+    city: str
+    district: str
+    detail: str
+    postal_code: str = ""
+
+class CreateOrderRequest(BaseModel):
+    store_id: int
+    items: List[OrderItemRequest]
+    address: OrderAddress
+    payment_method: str
+    remark: str = ""
+
+class CancelOrderRequest(BaseModel):
+    reason: str = ""
+
+class OrderItemResponse(BaseModel):
+    product_id: int
+    product_name: str
+    product_image: str
+    quantity: int
+    price: int  # Price in cents
+    total_price: int
+
+class ShippingResponse(BaseModel):
+    company: str
+    tracking_number: str
+    status: str
+
+class OrderResponse(BaseModel):
+    id: int
+    order_no: str
+    user_id: int
+    store_id: int
+    status: str
+    items: List[OrderItemResponse]
+    address: OrderAddress
+    subtotal: int  # Amounts in cents
+    shipping_fee: int
+    total_amount: int
+    payment_method: str
+    shipping: ShippingResponse
+    remark: str
+    created_at: int
+    paid_at: int
+    shipped_at: int
+    completed_at: int
+
+class OrderListResponse(BaseModel):
+    orders: List[OrderResponse]
+    next_cursor: str  # Empty on the last page
+
+def parse_order_status(status: Optional[str]) -> int:
+    """Order status filter from the query string; None lists every status.
+
+    PENDING is the proto default and means "no filter" to the order service,
+    so pending orders cannot be listed on their own.
+    """
+    if status is None:
+        return order_pb2.PENDING
+    try:
+        return order_pb2.OrderStatus.Value(status.upper())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown order status: {status}")
+
+def order_page_json(response) -> dict:
+    return {
+        "orders": [order_json(order) for order in response.orders],
+        "next_cursor": response.next_cursor,
+    }
+
+@router.post("/", response_model=OrderResponse)
+async def create_order(
+    request: CreateOrderRequest,
+    user_id: int = Depends(get_current_user_id),
+    idempotency_key: str = Header("", alias="Idempotency-Key")
+):
+    """Create an order; retries with the same Idempotency-Key return the first result"""
+    try:
+        grpc_request = order_pb2.CreateOrderRequest(
+            user_id=user_id,
+            store_id=request.store_id,
+            items=[
+                order_pb2.OrderItemRequest(product_id=item.product_id, quantity=item.quantity)
+                for item in request.items
+            ],
+            address=order_pb2.OrderAddress(**request.address.model_dump()),
+            payment_method=request.payment_method,
+            remark=request.remark,
+            idempotency_key=idempotency_key
+        )
+
+        response = await grpc_clients.order_stub.CreateOrder(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse(order_json(response.order))
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/", response_model=OrderListResponse)
+async def get_orders(
+    cursor: str = Query(""),
+    page_size: int = Query(20, ge=1, le=100),
+    status: Optional[str] = Query(None),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Get the user's orders, newest first; pass next_cursor back for the next page"""
+    try:
+        grpc_request = order_pb2.GetUserOrdersRequest(
+            user_id=user_id,
+            status=parse_order_status(status),
+            page_size=page_size,
+            cursor=cursor
+        )
+        response = await grpc_clients.order_stub.GetUserOrders(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse(order_page_json(response))
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/{order_id}", response_model=OrderResponse)
+async def get_order(order_id: int, user_id: int = Depends(get_current_user_id)):
+    """Get order by ID"""
+    try:
+        grpc_request = order_pb2.GetOrderRequest(order_id=order_id, user_id=user_id)
+        response = await grpc_clients.order_stub.GetOrder(grpc_request)
+
+        # Someone else's order is reported as missing
+        if not response.success or response.order.user_id != user_id:
+            raise HTTPException(status_code=404, detail=response.message or "Order not found")
+
+        return ORJSONResponse(order_json(response.order))
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.post("/{order_id}/cancel")
+async def cancel_order(order_id: int, request: CancelOrderRequest, user_id: int = Depends(get_current_user_id)):
+    """Cancel an order"""
+    try:
+        grpc_request = order_pb2.CancelOrderRequest(
+            order_id=order_id,
+            user_id=user_id,
+            reason=request.reason
+        )
+        response = await grpc_clients.order_stub.CancelOrder(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return {"message": response.message}
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.post("/{order_id}/confirm")
+async def confirm_order(order_id: int, user_id: int = Depends(get_current_user_id)):
+    """Confirm receipt of an order"""
+    try:
+        grpc_request = order_pb2.ConfirmOrderRequest(order_id=order_id, user_id=user_id)
+        response = await grpc_clients.order_stub.ConfirmOrder(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return {"message": response.message}
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
@@ -0,0 +1,205 @@
+"""Composite endpoints that assemble a whole storefront page in one request.
+
+Each page fans out to the backends concurrently, so its latency is that of the
+slowest call chain rather than the sum of the calls the browser used to make.
+The primary resource (the product, the cart) is required and its errors are
+returned as usual. The other sections are optional: they get a shorter
+deadline, and if they fail the page still renders with the section set to
+null and its name listed in ``errors``.
+"""
+import asyncio
+import logging
+import os
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import ORJSONResponse
+from prometheus_client import Counter
+from pydantic import BaseModel
+from typing import List, Optional
+from app.clients import grpc_clients
+from app.encoding import product_json, category_json, store_json, cart_json, address_json
+from app.middleware import get_current_user_id, get_optional_user_id
+from app.proto import product_pb2, store_pb2, cart_pb2, user_pb2
+from app.routes.cart import CartResponse
+from app.routes.products import ProductResponse, CategoryResponse
+import grpc
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1/pages", tags=["Pages"])
+
+# Deadline for optional sections (seconds), so a slow backend only costs its own section
+PAGE_OPTIONAL_DEADLINE = float(os.getenv("PAGE_OPTIONAL_DEADLINE", "1"))
+
+SECTION_FAILURES = Counter(
+    "page_section_failures_total", "Optional page sections left empty because a backend call failed",
+    ["page", "section"]
+)
+
+class StoreSummaryResponse(BaseModel):
+    id: int
+    name: str
+    description: str
+    logo: str
+    banner: str
+    status: str
+    business_hours: str
+
+class AddressResponse(BaseModel):
+    id: int
+    name: str
+    phone: str
+    province: str
+    city: str
+    district: str
+    detail: str
+    postal_code: str
+    is_default: bool
+
+class StockResponse(BaseModel):
+    product_id: int
+    available: bool
+    current_stock: int
+
+class ProductPageResponse(BaseModel):
+    product: ProductResponse
+    store: Optional[StoreSummaryResponse]
+    categories: Optional[List[CategoryResponse]]
+    cart_count: Optional[int]
+    errors: List[str]  # Optional sections that failed
+
+class CheckoutPageResponse(BaseModel):
+    cart: CartResponse
+    addresses: Optional[List[AddressResponse]]
+    stock: Optional[List[StockResponse]]  # Selected items only
+    errors: List[str]  # Optional sections that failed
+
+
+class SectionError(Exception):
+    """A backend answered an optional section with success=false"""
+
+
+async def optional_section(page: str, section: str, errors: List[str], load):
+    """Await an optional section; on failure record it in `errors` and return None"""
+    try:
+        return await load
+    except (grpc.RpcError, SectionError) as e:
+        SECTION_FAILURES.labels(page, section).inc()
+        detail = e.details() if isinstance(e, grpc.RpcError) else str(e)
+        logger.warning(f"{page} page: {section} unavailable: {detail}")
+        errors.append(section)
+        return None
+
+
+async def load_store(store_id: int) -> dict:
+    grpc_request = store_pb2.GetStoreRequest(store_id=store_id)
+    response = await grpc_clients.store_stub.GetStore(grpc_request, timeout=PAGE_OPTIONAL_DEADLINE)
+    if not response.success:
+        raise SectionError(response.message)
+    return store_json(response.store)
+
+
+async def load_categories() -> list:
+    grpc_request = product_pb2.GetCategoriesRequest()
+    response = await grpc_clients.product_stub.GetCategories(grpc_request, timeout=PAGE_OPTIONAL_DEADLINE)
+    if not response.success:
+        raise SectionError(response.message)
+    return [category_json(category) for category in response.categories]
+
+
+async def load_cart_count(user_id: Optional[int]) -> int:
+    # Anonymous visitors have an empty cart
+    if user_id is None:
+        return 0
+    grpc_request = cart_pb2.GetCartCountRequest(user_id=user_id)
+    response = await grpc_clients.cart_stub.GetCartCount(grpc_request, timeout=PAGE_OPTIONAL_DEADLINE)
+    if not response.success:
+        raise SectionError("cart count unavailable")
+    return response.count
+
+
+async def load_addresses(user_id: int) -> list:
+    grpc_request = user_pb2.GetAddressesRequest(user_id=user_id)
+    response = await grpc_clients.user_stub.GetAddresses(grpc_request, timeout=PAGE_OPTIONAL_DEADLINE)
+    if not response.success:
+        raise SectionError(response.message)
+    return [address_json(address) for address in response.addresses]
+
+
+async def load_stock(cart) -> list:
+    """CheckStock for every selected item, all at once"""
+    items = [item for item in cart.items if item.selected]
+    responses = await asyncio.gather(*(
+        grpc_clients.product_stub.CheckStock(
+            product_pb2.CheckStockRequest(product_id=item.product_id, quantity=item.quantity),
+            timeout=PAGE_OPTIONAL_DEADLINE
+        )
+        for item in items
+    ))
+    return [
+        {"product_id": item.product_id, "available": response.available, "current_stock": response.current_stock}
+        for item, response in zip(items, responses)
+    ]
+
+
+@router.get("/product/{product_id}", response_model=ProductPageResponse)
+async def product_page(product_id: int, user_id: Optional[int] = Depends(get_optional_user_id)):
+    """Product page: the product, its store, the category tree and the cart badge"""
+    errors = []
+
+    async def load_product_and_store():
+        try:
+            grpc_request = product_pb2.GetProductRequest(product_id=product_id)
+            response = await grpc_clients.product_stub.GetProduct(grpc_request)
+        except grpc.RpcError as e:
+            raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+        if not response.success:
+            raise HTTPException(status_code=404, detail=response.message)
+
+        # The store needs the product's store_id; the other sections are already in flight
+        store = await optional_section("product", "store", errors, load_store(response.product.store_id))
+        return product_json(response.product), store
+
+    (product, store), categories, cart_count = await asyncio.gather(
+        load_product_and_store(),
+        optional_section("product", "categories", errors, load_categories()),
+        optional_section("product", "cart_count", errors, load_cart_count(user_id)),
+    )
+    return ORJSONResponse({
+        "product": product,
+        "store": store,
+        "categories": categories,
+        "cart_count": cart_count,
+        "errors": errors,
+    })
+
+
+@router.get("/checkout", response_model=CheckoutPageResponse)
+async def checkout_page(user_id: int = Depends(get_current_user_id)):
+    """Checkout page: the cart, the shipping addresses and stock for the selected items"""
+    errors = []
+
+    async def load_cart_and_stock():
+        try:
+            grpc_request = cart_pb2.GetCartRequest(user_id=user_id)
+            response = await grpc_clients.cart_stub.GetCart(grpc_request)
+        except grpc.RpcError as e:
+            raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        # Stock checks need the cart items; addresses are already in flight
+        stock = await optional_section("checkout", "stock", errors, load_stock(response.cart))
+        return cart_json(response.cart), stock
+
+    (cart, stock), addresses = await asyncio.gather(
+        load_cart_and_stock(),
+        optional_section("checkout", "addresses", errors, load_addresses(user_id)),
+    )
+    return ORJSONResponse({
+        "cart": cart,
+        "addresses": addresses,
+        "stock": stock,
+        "errors": errors,
+    })
@@ -0,0 +1,165 @@
+from fastapi import APIRouter, HTTPException, Query, Depends, Header, Request
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from typing import List
+from app.clients import grpc_clients
+from app.encoding import payment_json, PAYMENT_CSV_COLUMNS, payment_csv_row
+from app.export import export_response
+from app.middleware import get_current_user_id
+from app.proto import payment_pb2, order_pb2
+import grpc
+
+router = APIRouter(prefix="/api/v1/payments", tags=["Payments"])
+
+class CreatePaymentRequest(BaseModel):
+    order_id: int
+    method: str = "credit_card"
+    payment_token: str = ""  # Card token, required for card methods
+    currency: str = "USD"
+    return_url: str = ""
+
+class PaymentResponse(BaseModel):
+    id: int
+    payment_id: str  # Payment number
+    order_id: int
+    amount: int  # Amount in cents
+    method: str
+    status: str
+    created_at: int
+    paid_at: int
+
+class CreatePaymentResponse(BaseModel):
+    payment: PaymentResponse
+    pay_url: str
+    qr_code: str
+
+class PaymentListResponse(BaseModel):
+    payments: List[PaymentResponse]
+    next_cursor: str  # Empty on the last page
+
+@router.post("/", response_model=CreatePaymentResponse)
+async def create_payment(
+    request: CreatePaymentRequest,
+    user_id: int = Depends(get_current_user_id),
+    idempotency_key: str = Header("", alias="Idempotency-Key")
+):
+    """Pay for an order; retries with the same Idempotency-Key never charge twice"""
+    try:
+        method = payment_pb2.PaymentMethod.Value(request.method.upper())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown payment method: {request.method}")
+
+    try:
+        order_response = await grpc_clients.order_stub.GetOrder(
+            order_pb2.GetOrderRequest(order_id=request.order_id, user_id=user_id)
+        )
+
+        # Someone else's order is reported as missing
+        order = order_response.order
+        if not order_response.success or order.user_id != user_id:
+            raise HTTPException(status_code=404, detail=order_response.message or "Order not found")
+        if order.status != order_pb2.PENDING:
+            raise HTTPException(status_code=400, detail="Order is not awaiting payment")
+
+        # The amount always comes from the order, never from the client
+        grpc_request = payment_pb2.CreatePaymentRequest(
+            order_id=order.id,
+            user_id=user_id,
+            amount=order.total_amount,
+            method=method,
+            return_url=request.return_url,
+            idempotency_key=idempotency_key,
+            payment_token=request.payment_token,
+            currency=request.currency
+        )
+
+        response = await grpc_clients.payment_stub.CreatePayment(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse({
+            "payment": payment_json(response.payment),
+            "pay_url": response.pay_url,
+            "qr_code": response.qr_code,
+        })
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/", response_model=PaymentListResponse)
+async def get_payments(
+    cursor: str = Query(""),
+    page_size: int = Query(20, ge=1, le=100),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Get the user's payments, newest first; pass next_cursor back for the next page"""
+    try:
+        grpc_request = payment_pb2.GetUserPaymentsRequest(
+            user_id=user_id,
+            page_size=page_size,
+            cursor=cursor
+        )
+        response = await grpc_clients.payment_stub.GetUserPayments(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse({
+            "payments": [payment_json(payment) for payment in response.payments],
+            "next_cursor": response.next_cursor,
+        })
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/export")
+async def export_payments(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    created_from: int = Query(0, ge=0),
+    created_to: int = Query(0, ge=0),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Download the user's payment history as NDJSON or CSV, oldest first"""
+    grpc_request = payment_pb2.ExportUserPaymentsRequest(
+        user_id=user_id,
+        created_from=created_from,
+        created_to=created_to
+    )
+    call = grpc_clients.payment_stub.ExportUserPayments(grpc_request)
+    return await export_response(call, "payments", format, payment_json, PAYMENT_CSV_COLUMNS, payment_csv_row)
+
+@router.post("/webhook/stripe")
+async def stripe_webhook(request: Request, stripe_signature: str = Header("", alias="Stripe-Signature")):
+    """Stripe event callback; the payment service verifies the signature"""
+    try:
+        grpc_request = payment_pb2.PaymentCallbackRequest(
+            method=payment_pb2.CREDIT_CARD,
+            third_party_data=(await request.body()).decode(),
+            signature=stripe_signature
+        )
+        response = await grpc_clients.payment_stub.PaymentCallback(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return {"received": True}
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/{payment_id}", response_model=PaymentResponse)
+async def get_payment(payment_id: int, user_id: int = Depends(get_current_user_id)):
+    """Get payment by ID"""
+    try:
+        grpc_request = payment_pb2.GetPaymentRequest(payment_id=payment_id)
+        response = await grpc_clients.payment_stub.GetPayment(grpc_request)
+
+        # Someone else's payment is reported as missing
+        if not response.success or response.payment.user_id != user_id:
+            raise HTTPException(status_code=404, detail=response.message or "Payment not found")
+
+        return ORJSONResponse(payment_json(response.payment))
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
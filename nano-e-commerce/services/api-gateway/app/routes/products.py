@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+from app.cache import (
+    response_cache, CATALOG_CACHE_TTL_PRODUCTS, CATALOG_CACHE_TTL_PRODUCT, CATALOG_CACHE_TTL_CATEGORIES
+)
 from app.clients import grpc_clients
+from app.encoding import product_json, category_json
 from app.middleware import get_optional_user_id
 from app.proto import product_pb2
 import grpc
@@ -14,10 +18,10 @@ class ProductResponse(BaseModel):
     description: str
     price: int  # Price in cents
     category_id: int
-    category_name: str
-    sku: str
+    store_id: int
     stock_quantity: int
     images: List[str]
+    attributes: Dict[str, str]
     is_active: bool
     created_at: int
 
@@ -26,10 +30,14 @@ class CategoryResponse(BaseModel):
     name: str
     description: str
     parent_id: Optional[int]
+    image: str
     is_active: bool
 
+# Responses are built with app.encoding; response_model only documents them
+
 @router.get("/", response_model=List[ProductResponse])
 async def get_products(
+    request: Request,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     category_id: Optional[int] = Query(None),
@@ -37,89 +45,67 @@ async def get_products(
     user_id: Optional[int] = Depends(get_optional_user_id)
 ):
     """Get products with pagination and filtering"""
-    try:
-        grpc_request = product_pb2.GetProductsRequest(
-            page=page,
-            page_size=page_size,
-            category_id=category_id or 0,
-            search_query=search or ""
-        )
-        
-        response = await grpc_clients.product_stub.GetProducts(grpc_request)
+    async def load():
+        try:
+            if search:
+                grpc_request = product_pb2.SearchProductsRequest(
+                    keyword=search,
+                    page=page,
+                    page_size=page_size,
+                    category_id=category_id or 0
+                )
+                response = await grpc_clients.product_stub.SearchProducts(grpc_request)
+            else:
+                grpc_request = product_pb2.ListProductsRequest(
+                    page=page,
+                    page_size=page_size,
+                    category_id=category_id or 0,
+                    status="active"
+                )
+                response = await grpc_clients.product_stub.ListProducts(grpc_request)
         
-        if not response.success:
-            raise HTTPException(status_code=400, detail=response.message)
+            if not response.success:
+                raise HTTPException(status_code=400, detail=response.message)
         
-        products = []
-        for product in response.products:
-            products.append(ProductResponse(
-                id=product.id,
-                name=product.name,
-                description=product.description,
-                price=product.price,
-                category_id=product.category_id,
-                category_name=product.category_name,
-                sku=product.sku,
-                stock_quantity=product.stock_quantity,
-                images=list(product.images),
-                is_active=product.is_active,
-                created_at=product.created_at
-            ))
+            return [product_json(product) for product in response.products]
         
-        return products
-        
-    except grpc.RpcError as e:
-        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+        except grpc.RpcError as e:
+            raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+    return await response_cache.serve(request, CATALOG_CACHE_TTL_PRODUCTS, load)
 
 @router.get("/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: int, user_id: Optional[int] = Depends(get_optional_user_id)):
+async def get_product(request: Request, product_id: int, user_id: Optional[int] = Depends(get_optional_user_id)):
     """Get product by ID"""
-    try:
-        grpc_request = product_pb2.GetProductRequest(product_id=product_id)
-        response = await grpc_clients.product_stub.GetProduct(grpc_request)
+    async def load():
+        try:
+            grpc_request = product_pb2.GetProductRequest(product_id=product_id)
+            response = await grpc_clients.product_stub.GetProduct(grpc_request)
         
-        if not response.success:
-            raise HTTPException(status_code=404, detail=response.message)
+            if not response.success:
+                raise HTTPException(status_code=404, detail=response.message)
         
-        product = response.product
-        return ProductResponse(
-            id=product.id,
-            name=product.name,
-            description=product.description,
-            price=product.price,
-            category_id=product.category_id,
-            category_name=product.category_name,
-            sku=product.sku,
-            stock_quantity=product.stock_quantity,
-            images=list(product.images),
-            is_active=product.is_active,
-            created_at=product.created_at
-        )
+            return product_json(response.product)
         
-    except grpc.RpcError as e:
-        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+        except grpc.RpcError as e:
+            raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+    return await response_cache.serve(request, CATALOG_CACHE_TTL_PRODUCT, load)
 
 @router.get("/categories/", response_model=List[CategoryResponse])
-async def get_categories():
+async def get_categories(request: Request):
     """Get all product categories"""
-    try:
-        grpc_request = product_pb2.GetCategoriesRequest()
-        response = await grpc_clients.product_stub.GetCategories(grpc_request)
-        
-        if not response.success:
-            raise HTTPException(status_code=400, detail=response.message)
+    async def load():
+        try:
+            grpc_request = product_pb2.GetCategoriesRequest()
+            response = await grpc_clients.product_stub.GetCategories(grpc_request)
         
-        categories = []
-        for category in response.categories:
-            categories.append(CategoryResponse(
-                id=category.id,
-                name=category.name,
-                description=category.description,
-                parent_id=category.parent_id if category.parent_id > 0 else None,
-                is_active=category.is_active
-            ))
+            if not response.success:
+                raise HTTPException(status_code=400, detail=response.message)
         
-        return categories
+            return [category_json(category) for category in response.categories]
         
-    except grpc.RpcError as e:
-        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+        except grpc.RpcError as e:
+            raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+    return await response_cache.serve(request, CATALOG_CACHE_TTL_CATEGORIES, load)
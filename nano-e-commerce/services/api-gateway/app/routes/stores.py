@@ -0,0 +1,257 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+from app.clients import grpc_clients
+from app.encoding import store_json, store_detail_json, store_product_json, order_json, ORDER_CSV_COLUMNS, order_csv_row
+from app.export import export_response
+from app.middleware import get_current_user_id
+from app.proto import store_pb2, order_pb2
+from app.routes.orders import OrderListResponse, parse_order_status, order_page_json
+from app.routes.pages import StoreSummaryResponse
+import grpc
+
+router = APIRouter(prefix="/api/v1/stores", tags=["Stores"])
+
+class CreateStoreRequest(BaseModel):
+    name: str
+    description: str = ""
+    phone: str = ""
+    email: str = ""
+    address: str = ""
+    business_license: str = ""
+
+class UpdateStoreRequest(BaseModel):
+    # Empty fields are left unchanged
+    name: str = ""
+    description: str = ""
+    logo: str = ""
+    banner: str = ""
+    phone: str = ""
+    email: str = ""
+    address: str = ""
+    business_hours: str = ""
+    settings: Dict[str, str] = {}
+
+class StoreResponse(StoreSummaryResponse):
+    owner_id: int
+    phone: str
+    email: str
+    address: str
+    business_license: str
+    settings: Dict[str, str]
+    created_at: int
+
+class ProductSalesResponse(BaseModel):
+    product_id: int
+    product_name: str
+    quantity: int
+    revenue: int  # Revenue in cents
+
+class StoreStatsResponse(BaseModel):
+    store_id: int
+    total_products: int
+    active_products: int
+    total_orders: int
+    pending_orders: int
+    total_revenue: int  # Revenue in cents
+    monthly_revenue: int
+    total_customers: int
+    avg_rating: float
+    top_products: List[ProductSalesResponse]
+
+class StoreProductResponse(BaseModel):
+    id: int
+    name: str
+    price: int  # Price in cents
+    stock: int
+    status: str
+    image: str
+    created_at: int
+
+class StoreProductListResponse(BaseModel):
+    products: List[StoreProductResponse]
+    next_cursor: str  # Empty on the last page
+
+async def require_store_owner(store_id: int, user_id: int):
+    """404 if the store does not exist, 403 if the user does not own it"""
+    try:
+        response = await grpc_clients.store_stub.GetStore(store_pb2.GetStoreRequest(store_id=store_id))
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+    if not response.success:
+        raise HTTPException(status_code=404, detail=response.message)
+    if response.store.owner_id != user_id:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return response.store
+
+@router.post("/", response_model=StoreResponse)
+async def create_store(request: CreateStoreRequest, user_id: int = Depends(get_current_user_id)):
+    """Open a store owned by the user"""
+    try:
+        grpc_request = store_pb2.CreateStoreRequest(owner_id=user_id, **request.model_dump())
+        response = await grpc_clients.store_stub.CreateStore(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse(store_detail_json(response.store))
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/mine", response_model=List[StoreResponse])
+async def get_my_stores(user_id: int = Depends(get_current_user_id)):
+    """Get the stores owned by the user"""
+    try:
+        grpc_request = store_pb2.GetUserStoresRequest(user_id=user_id)
+        response = await grpc_clients.store_stub.GetUserStores(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse([store_detail_json(store) for store in response.stores])
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/{store_id}", response_model=StoreSummaryResponse)
+async def get_store(store_id: int):
+    """Get store by ID"""
+    try:
+        grpc_request = store_pb2.GetStoreRequest(store_id=store_id)
+        response = await grpc_clients.store_stub.GetStore(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=404, detail=response.message)
+
+        return ORJSONResponse(store_json(response.store))
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.put("/{store_id}", response_model=StoreResponse)
+async def update_store(store_id: int, request: UpdateStoreRequest, user_id: int = Depends(get_current_user_id)):
+    """Update a store the user owns"""
+    try:
+        grpc_request = store_pb2.UpdateStoreRequest(store_id=store_id, owner_id=user_id, **request.model_dump())
+        response = await grpc_clients.store_stub.UpdateStore(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse(store_detail_json(response.store))
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/{store_id}/stats", response_model=StoreStatsResponse)
+async def get_store_stats(store_id: int, user_id: int = Depends(get_current_user_id)):
+    """Sales and order figures for a store the user owns"""
+    try:
+        grpc_request = store_pb2.GetStoreStatsRequest(store_id=store_id, owner_id=user_id)
+        response = await grpc_clients.store_stub.GetStoreStats(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        stats = response.stats
+        return ORJSONResponse({
+            "store_id": stats.store_id,
+            "total_products": stats.total_products,
+            "active_products": stats.active_products,
+            "total_orders": stats.total_orders,
+            "pending_orders": stats.pending_orders,
+            "total_revenue": stats.total_revenue,
+            "monthly_revenue": stats.monthly_revenue,
+            "total_customers": stats.total_customers,
+            "avg_rating": stats.avg_rating,
+            "top_products": [
+                {
+                    "product_id": product.product_id,
+                    "product_name": product.product_name,
+                    "quantity": product.quantity,
+                    "revenue": product.revenue,
+                }
+                for product in stats.top_products
+            ],
+        })
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/{store_id}/products", response_model=StoreProductListResponse)
+async def get_store_products(
+    store_id: int,
+    cursor: str = Query(""),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    """Get a store's active products, newest first; pass next_cursor back for the next page"""
+    try:
+        grpc_request = store_pb2.GetStoreProductsRequest(
+            store_id=store_id,
+            page_size=page_size,
+            cursor=cursor
+        )
+        response = await grpc_clients.store_stub.GetStoreProducts(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse({
+            "products": [store_product_json(product) for product in response.products],
+            "next_cursor": response.next_cursor,
+        })
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/{store_id}/orders", response_model=OrderListResponse)
+async def get_store_orders(
+    store_id: int,
+    cursor: str = Query(""),
+    page_size: int = Query(20, ge=1, le=100),
+    status: Optional[str] = Query(None),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Get the orders of a store the user owns, newest first"""
+    await require_store_owner(store_id, user_id)
+    try:
+        grpc_request = order_pb2.GetStoreOrdersRequest(
+            store_id=store_id,
+            status=parse_order_status(status),
+            page_size=page_size,
+            cursor=cursor
+        )
+        response = await grpc_clients.order_stub.GetStoreOrders(grpc_request)
+
+        if not response.success:
+            raise HTTPException(status_code=400, detail=response.message)
+
+        return ORJSONResponse(order_page_json(response))
+
+    except grpc.RpcError as e:
+        raise HTTPException(status_code=500, detail=f"Service unavailable: {e.details()}")
+
+@router.get("/{store_id}/orders/export")
+async def export_store_orders(
+    store_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: Optional[str] = Query(None),
+    created_from: int = Query(0, ge=0),
+    created_to: int = Query(0, ge=0),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Download the orders of a store the user owns as NDJSON or CSV, oldest first"""
+    await require_store_owner(store_id, user_id)
+    grpc_request = order_pb2.ExportStoreOrdersRequest(
+        store_id=store_id,
+        status=parse_order_status(status),
+        created_from=created_from,
+        created_to=created_to
+    )
+    call = grpc_clients.order_stub.ExportStoreOrders(grpc_request)
+    return await export_response(
+        call, f"store-{store_id}-orders", format, order_json, ORDER_CSV_COLUMNS, order_csv_row
+    )
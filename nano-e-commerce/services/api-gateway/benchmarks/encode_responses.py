@@ -0,0 +1,165 @@
+"""Compare the two ways the gateway can turn protobuf replies into JSON.
+
+- pydantic: copy every field into the route's response models, then let
+  FastAPI validate and serialize them through ``response_model`` (the old path)
+- direct: the ``app.encoding`` functions plus orjson (the current path)
+
+Both are run over a product page and a cart of the same size. The outputs
+are checked to be identical before anything is timed. Run from
+services/api-gateway with the shared package on the path:
+
+    PYTHONPATH=../../shared python benchmarks/encode_responses.py --items 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.encoding import product_json, cart_json
+from app.proto import product_pb2, cart_pb2
+from app.routes.products import ProductResponse
+from app.routes.cart import CartItemResponse, CartResponse
+
+
+def make_products(count: int) -> list:
+    return [
+        product_pb2.Product(
+            id=i + 1,
+            name=f"Product {i}",
+            description="A reasonably long product description " * 4,
+            images=[f"https://cdn.example.com/p/{i}/{n}.jpg" for n in range(3)],
+            price=1999 + i,
+            category_id=7,
+            store_id=42,
+            stock=100 - i % 100,
+            status="active",
+            attributes={"color": "red", "size": "M"},
+            created_at=1700000000 + i,
+        )
+        for i in range(count)
+    ]
+
+
+def make_cart(count: int):
+    return cart_pb2.Cart(
+        user_id=1,
+        items=[
+            cart_pb2.CartItem(
+                id=i + 1, user_id=1, product_id=1000 + i, quantity=1 + i % 3, price=1999,
+                product_name=f"Product {i}", product_image=f"https://cdn.example.com/p/{i}/0.jpg",
+                selected=i % 2 == 0,
+            )
+            for i in range(count)
+        ],
+        total_count=count,
+        total_amount=1999 * count,
+        total_selected_count=(count + 1) // 2,
+    )
+
+
+def product_model(product) -> ProductResponse:
+    return ProductResponse(
+        id=product.id,
+        name=product.name,
+        description=product.description,
+        price=product.price,
+        category_id=product.category_id,
+        store_id=product.store_id,
+        stock_quantity=product.stock,
+        images=list(product.images),
+        attributes=dict(product.attributes),
+        is_active=product.status == "active",
+        created_at=product.created_at,
+    )
+
+
+def cart_model(cart) -> CartResponse:
+    return CartResponse(
+        user_id=cart.user_id,
+        items=[
+            CartItemResponse(
+                id=item.id,
+                product_id=item.product_id,
+                product_name=item.product_name,
+                product_image=item.product_image,
+                quantity=item.quantity,
+                price=item.price,
+                selected=item.selected,
+            )
+            for item in cart.items
+        ],
+        total_count=cart.total_count,
+        total_amount=cart.total_amount,
+        total_selected_count=cart.total_selected_count,
+    )
+
+
+async def pydantic_body(field, models) -> bytes:
+    """What FastAPI does with a route's return value when response_model is set"""
+    content = await serialize_response(field=field, response_content=models)
+    return JSONResponse(content).body
+
+
+async def run_pydantic(field, build, message, iterations: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        await pydantic_body(field, build(message))
+    return (time.perf_counter() - started_at) / iterations
+
+
+def run_direct(encode, message, iterations: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        orjson.dumps(encode(message))
+    return (time.perf_counter() - started_at) / iterations
+
+
+async def compare(name: str, field, build, encode, message, iterations: int):
+    old = await pydantic_body(field, build(message))
+    new = orjson.dumps(encode(message))
+    assert json.loads(old) == json.loads(new), f"{name}: outputs differ"
+
+    # Best of three rounds to damp scheduler noise
+    pydantic_time = min([await run_pydantic(field, build, message, iterations) for _ in range(3)])
+    direct_time = min([run_direct(encode, message, iterations) for _ in range(3)])
+    print(f"{name:<14} pydantic {pydantic_time * 1e6:9.1f}us   direct {direct_time * 1e6:9.1f}us   "
+          f"{pydantic_time / direct_time:5.1f}x faster, {len(new)} bytes")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="gateway response encoding benchmark")
+    parser.add_argument("--items", type=int, default=100, help="products per page / items per cart")
+    parser.add_argument("--iterations", type=int, default=200, help="encodings per timing round")
+    args = parser.parse_args()
+
+    products = make_products(args.items)
+    await compare(
+        f"products x{args.items}",
+        create_response_field(name="products", type_=List[ProductResponse]),
+        lambda page: [product_model(product) for product in page],
+        lambda page: [product_json(product) for product in page],
+        products,
+        args.iterations,
+    )
+    await compare(
+        f"cart x{args.items}",
+        create_response_field(name="cart", type_=CartResponse),
+        cart_model,
+        cart_json,
+        make_cart(args.items),
+        args.iterations,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
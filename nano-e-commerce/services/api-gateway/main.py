@@ -1,26 +1,53 @@
 import asyncio
 import logging
+import os
+import socket
 import uvicorn
+from uvicorn.supervisors import Multiprocess
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 
-from app.routes import auth, products, cart, orders, payments, stores
+from app.routes import auth, products, cart, orders, payments, stores, pages
+from app.cache import response_cache
 from app.clients import grpc_clients
+from app.middleware import token_verifier
+from app.middleware.revocation import revocation_filter, refresh_revocation_filter
+from instrumentation import instrument_app, monitor_event_loop_lag, mark_worker_dead, reset_multiprocess_metrics
+from instrumentation.blocking import detect_blocking_calls
+from instrumentation.tracing import setup_tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Server settings
+GATEWAY_HOST = os.getenv("GATEWAY_HOST", "0.0.0.0")
+GATEWAY_PORT = int(os.getenv("GATEWAY_PORT", "8000"))
+# Worker processes; match the CPU limit so one pod uses every core it is given
+GATEWAY_WORKERS = int(os.getenv("GATEWAY_WORKERS", "1"))
+# Set both to "auto" where uvloop/httptools are not installed
+GATEWAY_LOOP = os.getenv("GATEWAY_LOOP", "uvloop")
+GATEWAY_HTTP = os.getenv("GATEWAY_HTTP", "httptools")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting API Gateway")
+    grpc_clients.connect()
+    revocation_task = asyncio.create_task(refresh_revocation_filter())
+    lag_task = asyncio.create_task(monitor_event_loop_lag())
+    blocking_task = asyncio.create_task(detect_blocking_calls())
     yield
     # Shutdown
     logger.info("Shutting down API Gateway")
+    revocation_task.cancel()
+    lag_task.cancel()
+    blocking_task.cancel()
+    await revocation_filter.close()
     await grpc_clients.close()
+    mark_worker_dead()
 
 # Create FastAPI app
 app = FastAPI(
@@ -39,6 +66,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus metrics: HTTP middleware and /metrics
+instrument_app(app)
+
+# Distributed tracing: root span per request, context forwarded to the services
+setup_tracing("api-gateway", app)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -46,6 +79,10 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 app.include_router(auth.router)
 app.include_router(products.router)
 app.include_router(cart.router)
+app.include_router(orders.router)
+app.include_router(payments.router)
+app.include_router(stores.router)
+app.include_router(pages.router)
 
 @app.get("/")
 async def root():
@@ -66,16 +103,55 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "api-gateway"}
 
-async def main():
-    """Main function to run the API Gateway"""
+@app.get("/stats/auth")
+async def auth_stats():
+    """JWT key set, verification cache and revocation filter stats"""
+    return {
+        **token_verifier.stats(),
+        "revocation": revocation_filter.stats(),
+    }
+
+@app.get("/stats/grpc-channels")
+async def grpc_channel_stats():
+    """Channel pool settings and connectivity state of every pooled channel"""
+    return grpc_clients.stats()
+
+@app.get("/stats/response-cache")
+async def response_cache_stats():
+    """Catalog response cache hit, coalescing and 304 counts"""
+    return response_cache.stats()
+
+def bind_socket() -> socket.socket:
+    """Listening socket with SO_REUSEPORT, so every worker binds the port itself
+    and the kernel spreads new connections evenly across them"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((GATEWAY_HOST, GATEWAY_PORT))
+    return sock
+
+def serve_worker(sockets=None):
+    """Run one gateway server process with uvloop and httptools"""
     config = uvicorn.Config(
-        app, 
-        host="0.0.0.0", 
-        port=8000, 
+        app,
+        loop=GATEWAY_LOOP,
+        http=GATEWAY_HTTP,
         log_level="info"
     )
     server = uvicorn.Server(config)
-    await server.serve()
+    server.run(sockets=[bind_socket()])
+
+def main():
+    """Main function to run the API Gateway"""
+    if GATEWAY_WORKERS <= 1:
+        serve_worker()
+        return
+
+    # Workers are spawned, not forked: each imports this module afresh and
+    # opens its own gRPC channels, Redis connections and caches at startup
+    reset_multiprocess_metrics()
+    config = uvicorn.Config("main:app", workers=GATEWAY_WORKERS, log_level="info")
+    Multiprocess(config, target=serve_worker, sockets=[]).run()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -3,6 +3,8 @@ import redis.asyncio as redis
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from sqlalchemy import MetaData
+from instrumentation import InstrumentedRedis
+from instrumentation.db import InstrumentedAsyncPool, trace_engine
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,8 +25,12 @@ engine = create_async_engine(
     max_overflow=20,
     pool_pre_ping=True,
     pool_recycle=3600,
+    poolclass=InstrumentedAsyncPool,
 )
 
+# 开启链路追踪时为每条 SQL 语句记录 span
+trace_engine(engine)
+
 # 创建会话工厂
 SessionLocal = async_sessionmaker(
     autocommit=False,
@@ -68,7 +74,7 @@ async def get_redis():
     global redis_pool
     if redis_pool is None:
         redis_pool = redis.ConnectionPool.from_url(REDIS_URL)
-    return redis.Redis(connection_pool=redis_pool)
+    return InstrumentedRedis(connection_pool=redis_pool)
 
 async def close_db():
     """关闭数据库连接"""
@@ -1,5 +1,7 @@
 import grpc
 from concurrent import futures
+from instrumentation import MetricsInterceptor, GRPC_SERVER_OPTIONS
+from instrumentation.tracing import server_interceptors
 import logging
 from app.proto import cart_pb2_grpc, cart_pb2
 from app.service import CartService
@@ -42,7 +44,11 @@ class CartServicer(cart_pb2_grpc.CartServiceServicer):
             return await self.cart_service.get_cart_count(db, request)
 
 async def serve():
-    server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.aio.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        interceptors=[*server_interceptors(), MetricsInterceptor()],
+        options=GRPC_SERVER_OPTIONS
+    )
     cart_pb2_grpc.add_CartServiceServicer_to_server(CartServicer(), server)
     
     listen_addr = '[::]:50053'
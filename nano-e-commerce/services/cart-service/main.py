@@ -4,6 +4,9 @@ from fastapi import FastAPI
 import uvicorn
 from app.grpc_server import serve as grpc_serve
 from app.database import init_db
+from instrumentation import instrument_app, monitor_event_loop_lag
+from instrumentation.blocking import detect_blocking_calls
+from instrumentation.tracing import setup_tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +15,12 @@ logger = logging.getLogger(__name__)
 # FastAPI app for health checks
 app = FastAPI(title="Cart Service", version="1.0.0")
 
+# Prometheus metrics: HTTP middleware and /metrics
+instrument_app(app)
+
+# Distributed tracing: continue the gateway's traces and record Redis/SQL spans
+setup_tracing("cart-service")
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "cart-service"}
@@ -37,10 +46,12 @@ async def main():
     await init_db()
     logger.info("Database initialized")
     
-    # Run both servers concurrently
+    # Run both servers, the event loop lag monitor and the blocking call detector concurrently
     await asyncio.gather(
         grpc_serve(),
-        run_fastapi()
+        run_fastapi(),
+        monitor_event_loop_lag(),
+        detect_blocking_calls()
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+import grpc
+import os
+from app.proto import product_pb2_grpc
+from instrumentation.tracing import client_interceptors
+
+# Same balancing and keepalive settings as the gateway's channel pools
+GRPC_LB_POLICY = os.getenv("GRPC_LB_POLICY", "round_robin")
+GRPC_KEEPALIVE_TIME_MS = int(os.getenv("GRPC_KEEPALIVE_TIME_MS", "30000"))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.getenv("GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))
+
+CHANNEL_OPTIONS = [
+    ("grpc.lb_policy_name", GRPC_LB_POLICY),
+    ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+    ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+class GRPCClients:
+    def __init__(self):
+        # Service addresses
+        self.product_service_addr = os.getenv("PRODUCT_SERVICE_ADDR", "product-service:50052")
+        
+        # Initialize channels
+        self.product_channel = grpc.aio.insecure_channel(
+            self.product_service_addr, options=CHANNEL_OPTIONS, interceptors=client_interceptors()
+        )
+        
+        # Initialize stubs
+        self.product_stub = product_pb2_grpc.ProductServiceStub(self.product_channel)
+    
+    async def close(self):
+        """Close all gRPC channels"""
+        await self.product_channel.close()
+
+# Global clients instance
+grpc_clients = GRPCClients()
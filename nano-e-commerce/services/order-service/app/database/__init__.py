@@ -1,7 +1,8 @@
 import os
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, text
+from instrumentation.db import InstrumentedAsyncPool, trace_engine
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,8 +21,12 @@ engine = create_async_engine(
     max_overflow=20,
     pool_pre_ping=True,
     pool_recycle=3600,
+    poolclass=InstrumentedAsyncPool,
 )
 
+# 开启链路追踪时为每条 SQL 语句记录 span
+trace_engine(engine)
+
 # 创建会话工厂
 SessionLocal = async_sessionmaker(
     autocommit=False,
@@ -38,17 +43,29 @@ async def init_db():
     """初始化数据库"""
     try:
         # 导入所有模型以确保它们被注册
-        from app.models import Order, OrderItem
+        from app.models import Order, OrderItem, OrderIdempotencyKey, StoreDailyStats, StoreOrderStats, StoreCustomer, StoreProductDailySales
         
         # 创建所有表
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         
+        await upgrade_orders_table()
+        
         logger.info("Order service database initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing order service database: {e}")
         raise
 
+async def upgrade_orders_table():
+    """为已存在的 orders 表补上列表索引和区县列（create_all 不会修改已有表）"""
+    from app.models import Order
+    
+    listing_indexes = [i for i in Order.__table__.indexes if i.name in ("idx_orders_user_listing", "idx_orders_store_listing")]
+    async with engine.begin() as conn:
+        for index in listing_indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+        await conn.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS shipping_district VARCHAR(100)"))
+
 async def get_db() -> AsyncSession:
     """获取数据库会话"""
     async with SessionLocal() as session:
@@ -1,5 +1,7 @@
 import grpc
 from concurrent import futures
+from instrumentation import MetricsInterceptor, GRPC_SERVER_OPTIONS
+from instrumentation.tracing import server_interceptors
 import logging
 from app.proto import order_pb2_grpc, order_pb2
 from app.service import OrderService
@@ -28,11 +30,8 @@ class OrderServicer(order_pb2_grpc.OrderServiceServicer):
     
     async def GetStoreOrders(self, request: order_pb2.GetStoreOrdersRequest, context) -> order_pb2.GetStoreOrdersResponse:
         """Get store orders"""
-        # TODO: Implement store orders logic
-        return order_pb2.GetStoreOrdersResponse(
-            success=False,
-            message="Not implemented yet"
-        )
+        async for db in get_db():
+            return await self.order_service.get_store_orders(db, request)
     
     async def UpdateOrderStatus(self, request: order_pb2.UpdateOrderStatusRequest, context) -> order_pb2.UpdateOrderStatusResponse:
         """Update order status"""
@@ -41,27 +40,35 @@ class OrderServicer(order_pb2_grpc.OrderServiceServicer):
     
     async def CancelOrder(self, request: order_pb2.CancelOrderRequest, context) -> order_pb2.CancelOrderResponse:
         """Cancel order"""
-        # TODO: Implement cancel order logic
-        return order_pb2.CancelOrderResponse(
-            success=False,
-            message="Not implemented yet"
-        )
+        async for db in get_db():
+            return await self.order_service.cancel_order(db, request)
     
     async def ConfirmOrder(self, request: order_pb2.ConfirmOrderRequest, context) -> order_pb2.ConfirmOrderResponse:
         """Confirm order delivery"""
-        # TODO: Implement confirm order logic
-        return order_pb2.ConfirmOrderResponse(
-            success=False,
-            message="Not implemented yet"
-        )
+        async for db in get_db():
+            return await self.order_service.confirm_order(db, request)
     
     async def AddShipping(self, request: order_pb2.AddShippingRequest, context) -> order_pb2.AddShippingResponse:
         """Add shipping information"""
         async for db in get_db():
             return await self.order_service.add_shipping(db, request)
 
+    async def ExportStoreOrders(self, request: order_pb2.ExportStoreOrdersRequest, context):
+        """Stream a store's orders for export"""
+        async for db in get_db():
+            try:
+                async for order in self.order_service.export_store_orders(db, request):
+                    yield order
+            except Exception as e:
+                logger.error(f"Error exporting store orders: {e}")
+                await context.abort(grpc.StatusCode.INTERNAL, "Failed to export store orders")
+
 async def serve():
-    server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.aio.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        interceptors=[*server_interceptors(), MetricsInterceptor()],
+        options=GRPC_SERVER_OPTIONS
+    )
     order_pb2_grpc.add_OrderServiceServicer_to_server(OrderServicer(), server)
     
     listen_addr = '[::]:50054'
@@ -1,10 +1,9 @@
-from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, func, Enum as SQLEnum, ForeignKey, Numeric
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, func, Enum as SQLEnum, ForeignKey, Numeric, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
 
-Base = declarative_base()
+from app.database import Base
 
 class OrderStatus(enum.Enum):
     PENDING = "PENDING"
@@ -34,6 +33,7 @@ class Order(Base):
     shipping_phone = Column(String(20), nullable=False)
     shipping_address = Column(Text, nullable=False)
     shipping_city = Column(String(100), nullable=False)
+    shipping_district = Column(String(100))
     shipping_state = Column(String(100), nullable=False)
     shipping_country = Column(String(100), nullable=False)
     shipping_postal_code = Column(String(20), nullable=False)
@@ -54,6 +54,14 @@ class Order(Base):
     
     # Relationship
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Finds the days touched since the last store stats reconciliation
+        Index('idx_orders_updated_at', 'updated_at'),
+        # Keyset pagination and exports walk a user's or store's orders by id
+        Index('idx_orders_user_listing', 'user_id', 'id'),
+        Index('idx_orders_store_listing', 'store_id', 'id'),
+    )
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -70,3 +78,78 @@ class OrderItem(Base):
     
     # Relationship
     order = relationship("Order", back_populates="items")
+
+class OrderIdempotencyKey(Base):
+    __tablename__ = "order_idempotency_keys"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, nullable=False)
+    idempotency_key = Column(String(100), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # SHA-256 of the original request
+    order_id = Column(BigInteger)
+    response = Column(LargeBinary)  # Serialized CreateOrderResponse replayed on retries
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # One key per user; the unique index also serializes concurrent retries
+    __table_args__ = (
+        Index('idx_order_idempotency_user_key', 'user_id', 'idempotency_key', unique=True),
+        Index('idx_order_idempotency_expires_at', 'expires_at'),
+    )
+
+class StoreDailyStats(Base):
+    """Per-store order rollup for one UTC day, keyed by the day the orders were created"""
+    __tablename__ = "store_daily_stats"
+    
+    store_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    order_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    
+    # Current status of the day's orders
+    pending_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    paid_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    shipped_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    delivered_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    completed_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    cancelled_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    refunded_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    
+    revenue = Column(BigInteger, nullable=False, default=0, server_default="0")  # Paid orders' final_amount in cents
+    new_customers = Column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class StoreOrderStats(Base):
+    """Per-store all-time totals; the sum of the store's daily rows"""
+    __tablename__ = "store_order_stats"
+    
+    store_id = Column(BigInteger, primary_key=True)
+    order_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    pending_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    paid_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    shipped_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    delivered_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    completed_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    cancelled_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    refunded_orders = Column(BigInteger, nullable=False, default=0, server_default="0")
+    revenue = Column(BigInteger, nullable=False, default=0, server_default="0")
+    customer_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class StoreCustomer(Base):
+    """First order day of each customer of a store, for distinct customer counts"""
+    __tablename__ = "store_customers"
+    
+    store_id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    first_order_day = Column(Date, nullable=False)
+
+class StoreProductDailySales(Base):
+    """Units and revenue per product per day from paid orders, for top sellers"""
+    __tablename__ = "store_product_daily_sales"
+    
+    store_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    product_id = Column(BigInteger, primary_key=True)
+    product_name = Column(String(255), nullable=False)
+    quantity = Column(BigInteger, nullable=False, default=0, server_default="0")
+    revenue = Column(BigInteger, nullable=False, default=0, server_default="0")
@@ -1,16 +1,58 @@
+import asyncio
+import base64
 import json
+import os
 import uuid
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, or_, desc
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
-from app.models import Order, OrderItem, OrderStatus
-from app.proto import order_pb2, order_pb2_grpc
-from datetime import datetime, timedelta
+from app.models import Order, OrderItem, OrderStatus, OrderIdempotencyKey
+from app.proto import order_pb2, order_pb2_grpc, product_pb2
+from app.clients import grpc_clients
+from app.database import SessionLocal
+from app.stats import store_stats
+from datetime import datetime, timedelta, timezone
+from idempotency import IdempotencyKeys, hash_request, sweep_expired_keys
 import logging
 
 logger = logging.getLogger(__name__)
 
+# CreateOrder idempotency keys
+idempotency_keys = IdempotencyKeys(OrderIdempotencyKey)
+
+# The order address has no country; orders are shipped within this one
+ORDER_SHIPPING_COUNTRY = os.getenv("ORDER_SHIPPING_COUNTRY", "CN")
+
+# Order list pagination
+ORDERS_DEFAULT_PAGE_SIZE = 20
+ORDERS_MAX_PAGE_SIZE = 100
+# Rows fetched per round trip when streaming an export
+ORDER_EXPORT_BATCH_SIZE = int(os.getenv("ORDER_EXPORT_BATCH_SIZE", "500"))
+
+# Protobuf status -> model status, for list and export filters
+PROTO_ORDER_STATUS = {
+    order_pb2.PENDING: OrderStatus.PENDING,
+    order_pb2.PAID: OrderStatus.PAID,
+    order_pb2.SHIPPED: OrderStatus.SHIPPED,
+    order_pb2.DELIVERED: OrderStatus.DELIVERED,
+    order_pb2.COMPLETED: OrderStatus.COMPLETED,
+    order_pb2.CANCELLED: OrderStatus.CANCELLED,
+    order_pb2.REFUNDED: OrderStatus.REFUNDED,
+}
+
+def encode_order_cursor(order_id: int) -> str:
+    """Order list cursor: id of the last order on the previous page"""
+    return base64.urlsafe_b64encode(str(order_id).encode()).decode()
+
+def decode_order_cursor(cursor: str) -> int:
+    """Parse a cursor; raises ValueError when it is malformed"""
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError("invalid cursor")
+
 class OrderService:
     def __init__(self):
         pass
@@ -21,6 +63,15 @@ class OrderService:
         unique_id = str(uuid.uuid4())[:8].upper()
         return f"ORD{timestamp}{unique_id}"
     
+    def _replay_idempotent_response(self, record: OrderIdempotencyKey, request_hash: str) -> order_pb2.CreateOrderResponse:
+        """Return the stored response for a retried request"""
+        if record.request_hash != request_hash:
+            return order_pb2.CreateOrderResponse(
+                success=False,
+                message="Idempotency key was already used with a different request"
+            )
+        return order_pb2.CreateOrderResponse.FromString(record.response)
+    
     def _convert_order_to_proto(self, order: Order) -> order_pb2.Order:
         """Convert SQLAlchemy Order to protobuf Order"""
         order_items = []
@@ -43,23 +94,22 @@ class OrderService:
                     pass
             order_items.append(order_item)
         
-        shipping_address = order_pb2.ShippingAddress(
+        address = order_pb2.OrderAddress(
             name=order.shipping_name,
             phone=order.shipping_phone,
-            address=order.shipping_address,
+            province=order.shipping_state,
             city=order.shipping_city,
-            state=order.shipping_state,
-            country=order.shipping_country,
+            district=order.shipping_district or "",
+            detail=order.shipping_address,
             postal_code=order.shipping_postal_code
         )
         
-        shipping_info = order_pb2.ShippingInfo()
-        if order.tracking_number:
-            shipping_info.tracking_number = order.tracking_number
-        if order.shipping_company:
-            shipping_info.shipping_company = order.shipping_company
-        if order.estimated_delivery:
-            shipping_info.estimated_delivery = int(order.estimated_delivery.timestamp())
+        shipping_info = order_pb2.ShippingInfo(
+            company=order.shipping_company or "",
+            tracking_number=order.tracking_number or "",
+            shipped_at=int(order.shipped_at.timestamp()) if order.shipped_at else 0,
+            delivered_at=int(order.delivered_at.timestamp()) if order.delivered_at else 0
+        )
         
         # Convert status enum
         status_map = {
@@ -74,54 +124,93 @@ class OrderService:
         
         return order_pb2.Order(
             id=order.id,
-            order_number=order.order_number,
+            order_no=order.order_number,
             user_id=order.user_id,
             store_id=order.store_id,
             status=status_map.get(order.status, order_pb2.PENDING),
-            total_amount=order.total_amount,
-            shipping_fee=order.shipping_fee,
-            tax_amount=order.tax_amount,
-            discount_amount=order.discount_amount,
-            final_amount=order.final_amount,
-            shipping_address=shipping_address,
-            shipping_info=shipping_info,
-            notes=order.notes or "",
             items=order_items,
+            address=address,
+            subtotal=order.total_amount,
+            shipping_fee=order.shipping_fee or 0,
+            total_amount=order.final_amount,
+            shipping=shipping_info,
+            remark=order.notes or "",
             created_at=int(order.created_at.timestamp()) if order.created_at else 0,
             updated_at=int(order.updated_at.timestamp()) if order.updated_at else 0,
-            shipped_at=int(order.shipped_at.timestamp()) if order.shipped_at else 0,
-            delivered_at=int(order.delivered_at.timestamp()) if order.delivered_at else 0
+            shipped_at=int(order.shipped_at.timestamp()) if order.shipped_at else 0
         )
     
+    async def _get_products(self, request: order_pb2.CreateOrderRequest) -> dict:
+        """Current product records for the ordered items, keyed by product id.
+        
+        Raises ValueError when an item cannot be ordered from the store.
+        """
+        if not request.items:
+            raise ValueError("Order has no items")
+        if any(item.quantity <= 0 for item in request.items):
+            raise ValueError("Item quantity must be positive")
+        
+        product_ids = list(dict.fromkeys(item.product_id for item in request.items))
+        responses = await asyncio.gather(*(
+            grpc_clients.product_stub.GetProduct(product_pb2.GetProductRequest(product_id=product_id))
+            for product_id in product_ids
+        ))
+        
+        products = {}
+        for product_id, response in zip(product_ids, responses):
+            product = response.product
+            if not response.success or product.store_id != request.store_id or product.status != "active":
+                raise ValueError(f"Product {product_id} is not available")
+            products[product_id] = product
+        
+        for item in request.items:
+            if products[item.product_id].stock < item.quantity:
+                raise ValueError(f"Insufficient stock for product {item.product_id}")
+        return products
+    
     async def create_order(self, db: AsyncSession, request: order_pb2.CreateOrderRequest) -> order_pb2.CreateOrderResponse:
-        """Create a new order"""
+        """Create a new order, priced from product-service"""
+        request_hash = None
         try:
+            if request.idempotency_key:
+                request_hash = hash_request(request)
+                record = await idempotency_keys.get(db, request.user_id, request.idempotency_key)
+                if record:
+                    return self._replay_idempotent_response(record, request_hash)
+            
+            # Prices, names and images come from the catalog, never from the client
+            products = await self._get_products(request)
+            
+            if request.idempotency_key:
+                record = await idempotency_keys.claim(db, request.user_id, request.idempotency_key, request_hash)
+            
             # Generate order number
             order_number = self._generate_order_number()
             
-            # Calculate totals
-            total_amount = sum(item.price * item.quantity for item in request.items)
-            final_amount = total_amount + request.shipping_fee + request.tax_amount - request.discount_amount
+            # Calculate totals; shipping, tax and discounts are not charged yet
+            total_amount = sum(products[item.product_id].price * item.quantity for item in request.items)
             
             # Create order
+            address = request.address
             order = Order(
                 order_number=order_number,
                 user_id=request.user_id,
                 store_id=request.store_id,
                 status=OrderStatus.PENDING,
                 total_amount=total_amount,
-                shipping_fee=request.shipping_fee,
-                tax_amount=request.tax_amount,
-                discount_amount=request.discount_amount,
-                final_amount=final_amount,
-                shipping_name=request.shipping_address.name,
-                shipping_phone=request.shipping_address.phone,
-                shipping_address=request.shipping_address.address,
-                shipping_city=request.shipping_address.city,
-                shipping_state=request.shipping_address.state,
-                shipping_country=request.shipping_address.country,
-                shipping_postal_code=request.shipping_address.postal_code,
-                notes=request.notes
+                shipping_fee=0,
+                tax_amount=0,
+                discount_amount=0,
+                final_amount=total_amount,
+                shipping_name=address.name,
+                shipping_phone=address.phone,
+                shipping_address=address.detail,
+                shipping_city=address.city,
+                shipping_district=address.district,
+                shipping_state=address.province,
+                shipping_country=ORDER_SHIPPING_COUNTRY,
+                shipping_postal_code=address.postal_code,
+                notes=request.remark
             )
             
             db.add(order)
@@ -129,32 +218,64 @@ class OrderService:
             
             # Create order items
             for item in request.items:
+                product = products[item.product_id]
                 order_item = OrderItem(
                     order_id=order.id,
                     product_id=item.product_id,
-                    product_name=item.product_name,
-                    product_image=item.product_image,
+                    product_name=product.name,
+                    product_image=product.images[0] if product.images else None,
                     quantity=item.quantity,
-                    price=item.price,
-                    total_price=item.price * item.quantity,
-                    product_attributes=json.dumps(dict(item.product_attributes)) if item.product_attributes else None
+                    price=product.price,
+                    total_price=product.price * item.quantity,
+                    product_attributes=json.dumps(dict(product.attributes)) if product.attributes else None
                 )
                 db.add(order_item)
             
-            await db.commit()
+            await db.flush()
             
             # Fetch the complete order with items
             result = await db.execute(
-                select(Order).options(selectinload(Order.items)).where(Order.id == order.id)
+                select(Order)
+                .options(selectinload(Order.items))
+                .where(Order.id == order.id)
+                .execution_options(populate_existing=True)
             )
             created_order = result.scalar_one()
             
-            return order_pb2.CreateOrderResponse(
+            response = order_pb2.CreateOrderResponse(
                 success=True,
                 order=self._convert_order_to_proto(created_order),
                 message="Order created successfully"
             )
             
+            # Store the response with the order so retries replay it
+            if request.idempotency_key:
+                record.order_id = created_order.id
+                record.response = response.SerializeToString()
+            
+            await store_stats.record_created(db, created_order)
+            await db.commit()
+            
+            return response
+            
+        except ValueError as e:
+            await db.rollback()
+            return order_pb2.CreateOrderResponse(
+                success=False,
+                message=str(e)
+            )
+        except IntegrityError as e:
+            await db.rollback()
+            if request_hash:
+                # Lost the race against a concurrent retry with the same key
+                record = await idempotency_keys.get(db, request.user_id, request.idempotency_key)
+                if record:
+                    return self._replay_idempotent_response(record, request_hash)
+            logger.error(f"Error creating order: {e}")
+            return order_pb2.CreateOrderResponse(
+                success=False,
+                message="Failed to create order"
+            )
         except Exception as e:
             logger.error(f"Error creating order: {e}")
             await db.rollback()
@@ -189,43 +310,49 @@ class OrderService:
                 message="Failed to get order"
             )
     
+    def _status_filter(self, query, status: int):
+        """Filter by status; PENDING (the proto default) means no filter"""
+        if status != order_pb2.PENDING and status in PROTO_ORDER_STATUS:
+            query = query.where(Order.status == PROTO_ORDER_STATUS[status])
+        return query
+    
+    async def _list_orders(self, db: AsyncSession, owner_column, owner_id: int, status: int,
+                           page_size: int, cursor: str) -> tuple[list, str]:
+        """Newest orders first, keyset-paginated on id; returns (orders, next cursor)"""
+        page_size = min(page_size or ORDERS_DEFAULT_PAGE_SIZE, ORDERS_MAX_PAGE_SIZE)
+        query = select(Order).options(selectinload(Order.items)).where(owner_column == owner_id)
+        query = self._status_filter(query, status)
+        if cursor:
+            query = query.where(Order.id < decode_order_cursor(cursor))
+        
+        # Fetch one extra row to know whether there is a next page
+        query = query.order_by(desc(Order.id)).limit(page_size + 1)
+        orders = list((await db.execute(query)).scalars().all())
+        
+        next_cursor = ""
+        if len(orders) > page_size:
+            orders = orders[:page_size]
+            next_cursor = encode_order_cursor(orders[-1].id)
+        return orders, next_cursor
+    
     async def get_user_orders(self, db: AsyncSession, request: order_pb2.GetUserOrdersRequest) -> order_pb2.GetUserOrdersResponse:
         """Get orders for a user"""
         try:
-            query = select(Order).options(selectinload(Order.items)).where(Order.user_id == request.user_id)
-            
-            # Add status filter if provided
-            if request.status != order_pb2.PENDING:  # Assuming PENDING is default/unspecified
-                status_map = {
-                    order_pb2.PENDING: OrderStatus.PENDING,
-                    order_pb2.PAID: OrderStatus.PAID,
-                    order_pb2.SHIPPED: OrderStatus.SHIPPED,
-                    order_pb2.DELIVERED: OrderStatus.DELIVERED,
-                    order_pb2.COMPLETED: OrderStatus.COMPLETED,
-                    order_pb2.CANCELLED: OrderStatus.CANCELLED,
-                    order_pb2.REFUNDED: OrderStatus.REFUNDED,
-                }
-                if request.status in status_map:
-                    query = query.where(Order.status == status_map[request.status])
-            
-            # Add pagination
-            if request.page > 0 and request.page_size > 0:
-                offset = (request.page - 1) * request.page_size
-                query = query.offset(offset).limit(request.page_size)
-            
-            query = query.order_by(desc(Order.created_at))
-            
-            result = await db.execute(query)
-            orders = result.scalars().all()
-            
-            order_list = [self._convert_order_to_proto(order) for order in orders]
-            
+            orders, next_cursor = await self._list_orders(
+                db, Order.user_id, request.user_id, request.status, request.page_size, request.cursor
+            )
             return order_pb2.GetUserOrdersResponse(
                 success=True,
-                orders=order_list,
-                total_count=len(order_list)
+                orders=[self._convert_order_to_proto(order) for order in orders],
+                page_size=len(orders),
+                next_cursor=next_cursor
             )
             
+        except ValueError:
+            return order_pb2.GetUserOrdersResponse(
+                success=False,
+                message="Invalid cursor"
+            )
         except Exception as e:
             logger.error(f"Error getting user orders: {e}")
             return order_pb2.GetUserOrdersResponse(
@@ -233,6 +360,45 @@ class OrderService:
                 message="Failed to get user orders"
             )
     
+    async def get_store_orders(self, db: AsyncSession, request: order_pb2.GetStoreOrdersRequest) -> order_pb2.GetStoreOrdersResponse:
+        """Get orders for a store"""
+        try:
+            orders, next_cursor = await self._list_orders(
+                db, Order.store_id, request.store_id, request.status, request.page_size, request.cursor
+            )
+            return order_pb2.GetStoreOrdersResponse(
+                success=True,
+                orders=[self._convert_order_to_proto(order) for order in orders],
+                page_size=len(orders),
+                next_cursor=next_cursor
+            )
+            
+        except ValueError:
+            return order_pb2.GetStoreOrdersResponse(
+                success=False,
+                message="Invalid cursor"
+            )
+        except Exception as e:
+            logger.error(f"Error getting store orders: {e}")
+            return order_pb2.GetStoreOrdersResponse(
+                success=False,
+                message="Failed to get store orders"
+            )
+    
+    async def export_store_orders(self, db: AsyncSession, request: order_pb2.ExportStoreOrdersRequest):
+        """Yield a store's orders oldest first, read in batches through a server-side cursor"""
+        query = select(Order).options(selectinload(Order.items)).where(Order.store_id == request.store_id)
+        query = self._status_filter(query, request.status)
+        if request.created_from:
+            query = query.where(Order.created_at >= datetime.fromtimestamp(request.created_from, timezone.utc))
+        if request.created_to:
+            query = query.where(Order.created_at < datetime.fromtimestamp(request.created_to, timezone.utc))
+        
+        query = query.order_by(Order.id).execution_options(yield_per=ORDER_EXPORT_BATCH_SIZE)
+        result = await db.stream_scalars(query)
+        async for order in result:
+            yield self._convert_order_to_proto(order)
+    
     async def update_order_status(self, db: AsyncSession, request: order_pb2.UpdateOrderStatusRequest) -> order_pb2.UpdateOrderStatusResponse:
         """Update order status"""
         try:
@@ -274,6 +440,7 @@ class OrderService:
             elif request.status == order_pb2.DELIVERED and old_status != OrderStatus.DELIVERED:
                 order.delivered_at = datetime.utcnow()
             
+            await store_stats.record_transition(db, order, old_status)
             await db.commit()
             
             return order_pb2.UpdateOrderStatusResponse(
@@ -297,24 +464,25 @@ class OrderService:
             )
             order = result.scalar_one_or_none()
             
-            if not order:
+            # Another store's order is reported as missing
+            if not order or order.store_id != request.store_id:
                 return order_pb2.AddShippingResponse(
                     success=False,
                     message="Order not found"
                 )
             
             order.tracking_number = request.tracking_number
-            order.shipping_company = request.shipping_company
-            if request.estimated_delivery > 0:
-                order.estimated_delivery = datetime.fromtimestamp(request.estimated_delivery)
+            order.shipping_company = request.company
             
             # Update status to shipped if not already
+            old_status = order.status
             if order.status == OrderStatus.PAID:
                 order.status = OrderStatus.SHIPPED
                 order.shipped_at = datetime.utcnow()
             
             order.updated_at = datetime.utcnow()
             
+            await store_stats.record_transition(db, order, old_status)
             await db.commit()
             
             return order_pb2.AddShippingResponse(
@@ -329,3 +497,86 @@ class OrderService:
                 success=False,
                 message="Failed to add shipping information"
             )
+
+    async def _transition_user_order(self, db: AsyncSession, order_id: int, user_id: int,
+                                     from_statuses: tuple, to_status: OrderStatus) -> Optional[str]:
+        """Move one of the user's orders to `to_status`; returns an error message on failure"""
+        # Lock the row so a concurrent payment or shipment cannot interleave
+        result = await db.execute(
+            select(Order).where(Order.id == order_id).with_for_update()
+        )
+        order = result.scalar_one_or_none()
+        
+        # Someone else's order is reported as missing
+        if not order or order.user_id != user_id:
+            return "Order not found"
+        if order.status not in from_statuses:
+            return f"Order cannot be changed from {order.status.value}"
+        
+        old_status = order.status
+        order.status = to_status
+        order.updated_at = datetime.utcnow()
+        if to_status == OrderStatus.COMPLETED and not order.delivered_at:
+            order.delivered_at = datetime.utcnow()
+        
+        await store_stats.record_transition(db, order, old_status)
+        await db.commit()
+        return None
+    
+    async def cancel_order(self, db: AsyncSession, request: order_pb2.CancelOrderRequest) -> order_pb2.CancelOrderResponse:
+        """Cancel one of the user's orders that has not been paid yet"""
+        try:
+            error = await self._transition_user_order(
+                db, request.order_id, request.user_id, (OrderStatus.PENDING,), OrderStatus.CANCELLED
+            )
+            if error:
+                await db.rollback()
+                return order_pb2.CancelOrderResponse(
+                    success=False,
+                    message=error
+                )
+            
+            logger.info(f"Order {request.order_id} cancelled by user {request.user_id}: {request.reason}")
+            return order_pb2.CancelOrderResponse(
+                success=True,
+                message="Order cancelled successfully"
+            )
+            
+        except Exception as e:
+            logger.error(f"Error cancelling order: {e}")
+            await db.rollback()
+            return order_pb2.CancelOrderResponse(
+                success=False,
+                message="Failed to cancel order"
+            )
+    
+    async def confirm_order(self, db: AsyncSession, request: order_pb2.ConfirmOrderRequest) -> order_pb2.ConfirmOrderResponse:
+        """Confirm receipt of one of the user's shipped orders"""
+        try:
+            error = await self._transition_user_order(
+                db, request.order_id, request.user_id,
+                (OrderStatus.SHIPPED, OrderStatus.DELIVERED), OrderStatus.COMPLETED
+            )
+            if error:
+                await db.rollback()
+                return order_pb2.ConfirmOrderResponse(
+                    success=False,
+                    message=error
+                )
+            
+            return order_pb2.ConfirmOrderResponse(
+                success=True,
+                message="Order confirmed successfully"
+            )
+            
+        except Exception as e:
+            logger.error(f"Error confirming order: {e}")
+            await db.rollback()
+            return order_pb2.ConfirmOrderResponse(
+                success=False,
+                message="Failed to confirm order"
+            )
+
+async def sweep_expired_idempotency_keys():
+    """Periodically purge expired idempotency keys"""
+    await sweep_expired_keys(idempotency_keys, SessionLocal)
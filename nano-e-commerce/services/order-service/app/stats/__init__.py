@@ -0,0 +1,334 @@
+import asyncio
+import os
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import select, delete, func, and_, distinct, tuple_, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SessionLocal
+from app.models import (
+    Order, OrderItem, OrderStatus,
+    StoreDailyStats, StoreOrderStats, StoreCustomer, StoreProductDailySales,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rollups are corrected from the orders table for days touched within this window
+STORE_STATS_RECONCILE_INTERVAL = int(os.getenv("STORE_STATS_RECONCILE_INTERVAL", "300"))  # seconds
+STORE_STATS_RECONCILE_WINDOW = int(os.getenv("STORE_STATS_RECONCILE_WINDOW", "3600"))  # seconds
+# (store, day) pairs rebuilt per statement; each pair is two bind parameters and
+# asyncpg allows 32767 per statement
+STORE_STATS_RECONCILE_BATCH_SIZE = int(os.getenv("STORE_STATS_RECONCILE_BATCH_SIZE", "1000"))
+
+# Orders whose final_amount counts as store revenue
+REVENUE_STATUSES = (
+    OrderStatus.PAID,
+    OrderStatus.SHIPPED,
+    OrderStatus.DELIVERED,
+    OrderStatus.COMPLETED,
+)
+
+STATUS_COLUMNS = {
+    OrderStatus.PENDING: "pending_orders",
+    OrderStatus.PAID: "paid_orders",
+    OrderStatus.SHIPPED: "shipped_orders",
+    OrderStatus.DELIVERED: "delivered_orders",
+    OrderStatus.COMPLETED: "completed_orders",
+    OrderStatus.CANCELLED: "cancelled_orders",
+    OrderStatus.REFUNDED: "refunded_orders",
+}
+
+COUNTER_COLUMNS = ["order_count", *STATUS_COLUMNS.values(), "revenue"]
+
+
+def batches(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def order_day(created_at: Optional[datetime]) -> date:
+    """UTC day an order is bucketed under"""
+    if created_at is None:
+        return datetime.now(timezone.utc).date()
+    if created_at.tzinfo is None:
+        return created_at.date()
+    return created_at.astimezone(timezone.utc).date()
+
+
+class StoreStatsRecorder:
+    """Applies order status transitions to the store rollup tables.
+
+    Deltas are written in the caller's transaction, inside a savepoint, so a
+    rollup failure never fails the order; reconciliation repairs the drift.
+    Call just before commit to keep the rollup row locks short.
+    """
+
+    def __init__(self):
+        self.deltas_total = 0
+        self.failures_total = 0
+        self.reconciled_days_total = 0
+        self.last_reconciled_at = 0.0
+
+    async def record_created(self, db: AsyncSession, order: Order):
+        counters = {"order_count": 1, STATUS_COLUMNS[order.status]: 1}
+        await self._record(db, order, counters)
+
+    async def record_transition(self, db: AsyncSession, order: Order, old_status: OrderStatus):
+        if old_status == order.status:
+            return
+        counters = {STATUS_COLUMNS[old_status]: -1}
+        counters[STATUS_COLUMNS[order.status]] = counters.get(STATUS_COLUMNS[order.status], 0) + 1
+
+        # Revenue and product sales only move when the order crosses the paid boundary
+        sign = (order.status in REVENUE_STATUSES) - (old_status in REVENUE_STATUSES)
+        if sign:
+            counters["revenue"] = sign * order.final_amount
+        await self._record(db, order, counters, sales_sign=sign)
+
+    async def _record(self, db: AsyncSession, order: Order, counters: dict, sales_sign: int = 0):
+        try:
+            async with db.begin_nested():
+                await self._apply(db, order, counters, sales_sign)
+            self.deltas_total += 1
+        except Exception as e:
+            self.failures_total += 1
+            logger.warning(f"Failed to update store stats for order {order.id}: {e}")
+
+    async def _apply(self, db: AsyncSession, order: Order, counters: dict, sales_sign: int):
+        day = order_day(order.created_at)
+        new_customer = 0
+        if "order_count" in counters:
+            result = await db.execute(
+                pg_insert(StoreCustomer)
+                .values(store_id=order.store_id, user_id=order.user_id, first_order_day=day)
+                .on_conflict_do_nothing(index_elements=["store_id", "user_id"])
+                .returning(StoreCustomer.user_id)
+            )
+            new_customer = int(result.scalar_one_or_none() is not None)
+
+        # Same lock order everywhere: daily row, totals row, product rows by id
+        daily = pg_insert(StoreDailyStats).values(
+            store_id=order.store_id, day=day, new_customers=new_customer, **counters
+        )
+        await db.execute(daily.on_conflict_do_update(
+            index_elements=["store_id", "day"],
+            set_=self._increments(StoreDailyStats, daily, [*counters, "new_customers"])
+        ))
+
+        totals = pg_insert(StoreOrderStats).values(
+            store_id=order.store_id, customer_count=new_customer, **counters
+        )
+        await db.execute(totals.on_conflict_do_update(
+            index_elements=["store_id"],
+            set_=self._increments(StoreOrderStats, totals, [*counters, "customer_count"])
+        ))
+
+        if sales_sign:
+            items = (await db.execute(
+                select(OrderItem)
+                .where(OrderItem.order_id == order.id)
+                .order_by(OrderItem.product_id)
+            )).scalars().all()
+            sales = {}
+            for item in items:
+                row = sales.setdefault(item.product_id, {
+                    "store_id": order.store_id,
+                    "day": day,
+                    "product_id": item.product_id,
+                    "product_name": item.product_name,
+                    "quantity": 0,
+                    "revenue": 0,
+                })
+                row["quantity"] += sales_sign * item.quantity
+                row["revenue"] += sales_sign * item.total_price
+            if sales:
+                stmt = pg_insert(StoreProductDailySales).values(list(sales.values()))
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=["store_id", "day", "product_id"],
+                    set_=self._increments(StoreProductDailySales, stmt, ["quantity", "revenue"])
+                ))
+
+    @staticmethod
+    def _increments(model, stmt, columns: Iterable[str]) -> dict:
+        updates = {
+            column: getattr(model, column) + getattr(stmt.excluded, column)
+            for column in columns
+        }
+        if hasattr(model, "updated_at"):
+            updates["updated_at"] = func.now()
+        return updates
+
+    async def reconcile(self, db: AsyncSession, since: datetime,
+                        batch_size: int = STORE_STATS_RECONCILE_BATCH_SIZE) -> int:
+        """Recompute the rollup rows of every (store, day) with orders changed since `since`.
+
+        Touched days are rebuilt from orders/order_items in batches, then the
+        totals of the affected stores are re-summed from their daily rows. All
+        of it commits at once, so a failed run leaves the rollups as they were.
+        Returns the number of days rebuilt.
+        """
+        # Literal time zone so the grouped and selected expressions are identical
+        day_expr = func.date(func.timezone(literal_column("'UTC'"), Order.created_at))
+        touched = (await db.execute(
+            select(Order.store_id, day_expr)
+            .where(Order.updated_at >= since)
+            .distinct()
+        )).all()
+        if not touched:
+            return 0
+
+        # A store's earlier days come first, so customers get their first order
+        # day before the later days count new customers
+        pairs = sorted(tuple(row) for row in touched)
+        for batch in batches(pairs, batch_size):
+            await self._rebuild_days(db, day_expr, batch)
+
+        store_ids = sorted({store_id for store_id, _ in pairs})
+        for batch in batches(store_ids, batch_size):
+            await self._resum_totals(db, batch)
+
+        await db.commit()
+        return len(pairs)
+
+    async def _rebuild_days(self, db: AsyncSession, day_expr, pairs: list):
+        """Rebuild the daily and product rows of the given (store, day) pairs"""
+        in_touched = tuple_(Order.store_id, day_expr).in_(pairs)
+
+        # Customers first, so the rebuilt days can count first orders
+        customers = pg_insert(StoreCustomer).from_select(
+            ["store_id", "user_id", "first_order_day"],
+            select(Order.store_id, Order.user_id, func.min(day_expr))
+            .where(in_touched)
+            .group_by(Order.store_id, Order.user_id)
+        )
+        await db.execute(customers.on_conflict_do_update(
+            index_elements=["store_id", "user_id"],
+            set_={"first_order_day": func.least(StoreCustomer.first_order_day, customers.excluded.first_order_day)}
+        ))
+
+        await db.execute(
+            delete(StoreDailyStats)
+            .where(tuple_(StoreDailyStats.store_id, StoreDailyStats.day).in_(pairs))
+            .execution_options(synchronize_session=False)
+        )
+        status_counts = [
+            func.count().filter(Order.status == status).label(column)
+            for status, column in STATUS_COLUMNS.items()
+        ]
+        rebuilt = pg_insert(StoreDailyStats).from_select(
+            ["store_id", "day", "order_count", *STATUS_COLUMNS.values(), "revenue", "new_customers"],
+            select(
+                Order.store_id,
+                day_expr,
+                func.count(),
+                *status_counts,
+                func.coalesce(func.sum(Order.final_amount).filter(Order.status.in_(REVENUE_STATUSES)), 0),
+                func.count(distinct(StoreCustomer.user_id)),
+            )
+            # At most one customer row per order: those whose first order day this is
+            .outerjoin(StoreCustomer, and_(
+                StoreCustomer.store_id == Order.store_id,
+                StoreCustomer.user_id == Order.user_id,
+                StoreCustomer.first_order_day == day_expr,
+            ))
+            .where(in_touched)
+            .group_by(Order.store_id, day_expr)
+        )
+        # Deltas that commit while this runs can be overwritten; their orders are
+        # still inside the window and get recounted on the next run
+        await db.execute(rebuilt.on_conflict_do_update(
+            index_elements=["store_id", "day"],
+            set_={
+                **{column: getattr(rebuilt.excluded, column) for column in [*COUNTER_COLUMNS, "new_customers"]},
+                "updated_at": func.now(),
+            }
+        ))
+
+        await db.execute(
+            delete(StoreProductDailySales)
+            .where(tuple_(StoreProductDailySales.store_id, StoreProductDailySales.day).in_(pairs))
+            .execution_options(synchronize_session=False)
+        )
+        sales = pg_insert(StoreProductDailySales).from_select(
+            ["store_id", "day", "product_id", "product_name", "quantity", "revenue"],
+            select(
+                Order.store_id,
+                day_expr,
+                OrderItem.product_id,
+                func.max(OrderItem.product_name),
+                func.sum(OrderItem.quantity),
+                func.sum(OrderItem.total_price),
+            )
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .where(and_(in_touched, Order.status.in_(REVENUE_STATUSES)))
+            .group_by(Order.store_id, day_expr, OrderItem.product_id)
+        )
+        await db.execute(sales.on_conflict_do_update(
+            index_elements=["store_id", "day", "product_id"],
+            set_={column: getattr(sales.excluded, column) for column in ["product_name", "quantity", "revenue"]}
+        ))
+
+    async def _resum_totals(self, db: AsyncSession, store_ids: list):
+        """Re-sum the all-time totals of the given stores from their daily rows"""
+        totals_select = (
+            select(
+                StoreDailyStats.store_id,
+                *[func.sum(getattr(StoreDailyStats, column)) for column in COUNTER_COLUMNS],
+                select(func.count())
+                .where(StoreCustomer.store_id == StoreDailyStats.store_id)
+                .correlate(StoreDailyStats)
+                .scalar_subquery(),
+            )
+            .where(StoreDailyStats.store_id.in_(store_ids))
+            .group_by(StoreDailyStats.store_id)
+        )
+        totals = pg_insert(StoreOrderStats).from_select(
+            ["store_id", *COUNTER_COLUMNS, "customer_count"], totals_select
+        )
+        await db.execute(totals.on_conflict_do_update(
+            index_elements=["store_id"],
+            set_={
+                **{column: getattr(totals.excluded, column) for column in [*COUNTER_COLUMNS, "customer_count"]},
+                "updated_at": func.now(),
+            }
+        ))
+
+    def stats(self) -> dict:
+        return {
+            "deltas_total": self.deltas_total,
+            "failures_total": self.failures_total,
+            "reconciled_days_total": self.reconciled_days_total,
+            "last_reconciled_at": self.last_reconciled_at,
+        }
+
+
+# Global recorder instance
+store_stats = StoreStatsRecorder()
+
+
+async def reconcile_store_stats():
+    """Periodically rebuild recently touched rollup days from the orders table"""
+    backfill = None  # Unknown until the rollups have been checked
+    while True:
+        started = datetime.now(timezone.utc)
+        try:
+            since = started - timedelta(seconds=STORE_STATS_RECONCILE_WINDOW)
+            async with SessionLocal() as db:
+                if backfill is None:
+                    # Empty rollups (first deployment): build them from every order once
+                    backfill = (await db.execute(select(StoreOrderStats.store_id).limit(1))).first() is None
+                if backfill:
+                    since = datetime.min.replace(tzinfo=timezone.utc)
+                days = await store_stats.reconcile(db, since)
+            # Only cleared once the backfill has committed; a failed one is retried
+            backfill = False
+            store_stats.reconciled_days_total += days
+            store_stats.last_reconciled_at = started.timestamp()
+            if days:
+                logger.info(f"Reconciled store stats for {days} store days")
+        except Exception as e:
+            logger.error(f"Error reconciling store stats: {e}")
+        await asyncio.sleep(STORE_STATS_RECONCILE_INTERVAL)
@@ -4,6 +4,11 @@ from fastapi import FastAPI
 import uvicorn
 from app.grpc_server import serve as grpc_serve
 from app.database import init_db
+from app.service import sweep_expired_idempotency_keys
+from app.stats import store_stats, reconcile_store_stats
+from instrumentation import instrument_app, monitor_event_loop_lag
+from instrumentation.blocking import detect_blocking_calls
+from instrumentation.tracing import setup_tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,10 +17,21 @@ logger = logging.getLogger(__name__)
 # FastAPI app for health checks
 app = FastAPI(title="Order Service", version="1.0.0")
 
+# Prometheus metrics: HTTP middleware and /metrics
+instrument_app(app)
+
+# Distributed tracing: continue the gateway's traces and record Redis/SQL spans
+setup_tracing("order-service")
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "order-service"}
 
+@app.get("/stats/store-stats")
+async def store_stats_status():
+    """Store rollup delta and reconciliation counters"""
+    return store_stats.stats()
+
 @app.get("/")
 async def root():
     return {"message": "Order Service is running"}
@@ -37,10 +53,14 @@ async def main():
     await init_db()
     logger.info("Database initialized")
     
-    # Run both servers concurrently
+    # Run both servers and the background workers concurrently
     await asyncio.gather(
         grpc_serve(),
-        run_fastapi()
+        run_fastapi(),
+        sweep_expired_idempotency_keys(),
+        reconcile_store_stats(),
+        monitor_event_loop_lag(),
+        detect_blocking_calls()
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import stripe
+
+logger = logging.getLogger(__name__)
+
+# Stripe client configuration
+stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "sk_test_...")
+# Point at the fake Stripe server (tools/fake_stripe.py) for local load tests
+stripe.api_base = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+
+# Gateway executor settings
+STRIPE_MAX_WORKERS = int(os.getenv("STRIPE_MAX_WORKERS", "16"))
+STRIPE_MAX_QUEUE = int(os.getenv("STRIPE_MAX_QUEUE", "64"))
+STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "10"))  # seconds per call
+STRIPE_BREAKER_FAILURE_THRESHOLD = int(os.getenv("STRIPE_BREAKER_FAILURE_THRESHOLD", "5"))
+STRIPE_BREAKER_RESET_TIMEOUT = float(os.getenv("STRIPE_BREAKER_RESET_TIMEOUT", "30"))  # seconds
+
+# Also bound the HTTP request itself so timed-out calls free their worker thread
+stripe.default_http_client = stripe.http_client.RequestsClient(timeout=STRIPE_TIMEOUT)
+
+# Errors that mean the gateway itself is unhealthy (card declines etc. do not count)
+GATEWAY_FAILURES = (
+    asyncio.TimeoutError,
+    stripe.error.APIConnectionError,
+    stripe.error.APIError,
+    stripe.error.RateLimitError,
+)
+
+
+class GatewayUnavailableError(Exception):
+    """Raised when a call is rejected without reaching the gateway"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open)"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = self.CLOSED
+
+    def allow_request(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Let a single probe through
+            self.state = self.HALF_OPEN
+            return True
+        if self.state == self.HALF_OPEN:
+            # A probe is already in flight
+            return False
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Stripe circuit breaker opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """The caller gave up (e.g. was cancelled) before the gateway answered.
+
+        That says nothing about the gateway's health, but an abandoned probe
+        must not leave the breaker half-open with no probe in flight, which
+        would reject every call for good. Wait another reset timeout instead.
+        """
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class StripeGateway:
+    """Runs blocking Stripe SDK calls on a dedicated, bounded thread pool"""
+
+    def __init__(self, max_workers: int = STRIPE_MAX_WORKERS, max_queue: int = STRIPE_MAX_QUEUE,
+                 timeout: float = STRIPE_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stripe")
+        self.breaker = CircuitBreaker(STRIPE_BREAKER_FAILURE_THRESHOLD, STRIPE_BREAKER_RESET_TIMEOUT)
+
+        # Metrics; pending is only touched on the event loop, running from worker threads
+        self._lock = threading.Lock()
+        self.pending = 0  # queued + running
+        self.running = 0
+        self.calls_total = 0
+        self.failures_total = 0
+        self.timeouts_total = 0
+        self.rejected_total = 0
+        self.queue_wait_seconds_total = 0.0
+        self.call_seconds_total = 0.0
+
+    def _run(self, fn: Callable, submitted_at: float, kwargs: dict) -> Any:
+        """Executed on a worker thread"""
+        started_at = time.monotonic()
+        with self._lock:
+            self.running += 1
+            self.queue_wait_seconds_total += started_at - submitted_at
+        try:
+            return fn(**kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.call_seconds_total += time.monotonic() - started_at
+
+    def _release(self, _future):
+        self.pending -= 1
+
+    async def call(self, fn: Callable, **kwargs) -> Any:
+        """Run a Stripe SDK call off the event loop with a timeout"""
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected_total += 1
+            raise GatewayUnavailableError("Payment gateway queue is full")
+        if not self.breaker.allow_request():
+            self.rejected_total += 1
+            raise GatewayUnavailableError("Payment gateway circuit breaker is open")
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        self.calls_total += 1
+        future = loop.run_in_executor(self.executor, self._run, fn, time.monotonic(), kwargs)
+        # Release the slot when the thread finishes, not when we stop waiting
+        future.add_done_callback(self._release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except GATEWAY_FAILURES as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts_total += 1
+            self.failures_total += 1
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # The gateway answered (e.g. card declined), so it is healthy
+            self.breaker.record_success()
+            raise
+        except BaseException:
+            # Cancelled, e.g. by the caller's gRPC deadline
+            self.breaker.record_abandoned()
+            raise
+
+        self.breaker.record_success()
+        return result
+
+    def stats(self) -> dict:
+        """Executor and breaker metrics"""
+        with self._lock:
+            running = self.running
+            queue_wait = self.queue_wait_seconds_total
+            call_time = self.call_seconds_total
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": running,
+            "queue_depth": max(self.pending - running, 0),
+            "calls_total": self.calls_total,
+            "failures_total": self.failures_total,
+            "timeouts_total": self.timeouts_total,
+            "rejected_total": self.rejected_total,
+            "queue_wait_seconds_total": round(queue_wait, 6),
+            "call_seconds_total": round(call_time, 6),
+            "circuit_breaker_state": self.breaker.state,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Global gateway instance
+stripe_gateway = StripeGateway()
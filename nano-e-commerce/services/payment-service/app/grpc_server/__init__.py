@@ -1,5 +1,7 @@
 import grpc
 from concurrent import futures
+from instrumentation import MetricsInterceptor, GRPC_SERVER_OPTIONS
+from instrumentation.tracing import server_interceptors
 import logging
 from app.proto import payment_pb2_grpc, payment_pb2
 from app.service import PaymentService
@@ -21,26 +23,42 @@ class PaymentServicer(payment_pb2_grpc.PaymentServiceServicer):
         async for db in get_db():
             return await self.payment_service.get_payment(db, request)
     
-    async def GetOrderPayments(self, request: payment_pb2.GetOrderPaymentsRequest, context) -> payment_pb2.GetOrderPaymentsResponse:
-        """Get all payments for an order"""
+    async def PaymentCallback(self, request: payment_pb2.PaymentCallbackRequest, context) -> payment_pb2.PaymentCallbackResponse:
+        """Ingest a payment gateway callback"""
         async for db in get_db():
-            return await self.payment_service.get_order_payments(db, request)
+            return await self.payment_service.handle_payment_callback(db, request)
     
-    async def RefundPayment(self, request: payment_pb2.RefundPaymentRequest, context) -> payment_pb2.RefundPaymentResponse:
-        """Process a refund"""
+    async def CreateRefund(self, request: payment_pb2.CreateRefundRequest, context) -> payment_pb2.CreateRefundResponse:
+        """Refund a completed payment"""
         async for db in get_db():
-            return await self.payment_service.refund_payment(db, request)
+            return await self.payment_service.create_refund(db, request)
+    
+    async def GetRefund(self, request: payment_pb2.GetRefundRequest, context) -> payment_pb2.GetRefundResponse:
+        """Get refund by ID"""
+        async for db in get_db():
+            return await self.payment_service.get_refund(db, request)
     
     async def GetUserPayments(self, request: payment_pb2.GetUserPaymentsRequest, context) -> payment_pb2.GetUserPaymentsResponse:
         """Get user payments"""
-        # TODO: Implement user payments logic
-        return payment_pb2.GetUserPaymentsResponse(
-            success=False,
-            message="Not implemented yet"
-        )
+        async for db in get_db():
+            return await self.payment_service.get_user_payments(db, request)
+    
+    async def ExportUserPayments(self, request: payment_pb2.ExportUserPaymentsRequest, context):
+        """Stream a user's payments for export"""
+        async for db in get_db():
+            try:
+                async for payment in self.payment_service.export_user_payments(db, request):
+                    yield payment
+            except Exception as e:
+                logger.error(f"Error exporting user payments: {e}")
+                await context.abort(grpc.StatusCode.INTERNAL, "Failed to export user payments")
 
 async def serve():
-    server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.aio.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        interceptors=[*server_interceptors(), MetricsInterceptor()],
+        options=GRPC_SERVER_OPTIONS
+    )
     payment_pb2_grpc.add_PaymentServiceServicer_to_server(PaymentServicer(), server)
     
     listen_addr = '[::]:50055'
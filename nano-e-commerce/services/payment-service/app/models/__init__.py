@@ -1,9 +1,8 @@
-from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, func, Enum as SQLEnum, Boolean
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, func, Enum as SQLEnum, Boolean, LargeBinary, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 import enum
-
-Base = declarative_base()
+from app.database import Base
 
 class PaymentStatus(enum.Enum):
     PENDING = "PENDING"
@@ -14,7 +13,12 @@ class PaymentStatus(enum.Enum):
     REFUNDED = "REFUNDED"
 
 class PaymentMethod(enum.Enum):
+    # Methods of the payment proto
+    ALIPAY = "ALIPAY"
+    WECHAT = "WECHAT"
+    BANK_CARD = "BANK_CARD"
     CREDIT_CARD = "CREDIT_CARD"
+    # Legacy methods, kept for existing rows
     DEBIT_CARD = "DEBIT_CARD"
     PAYPAL = "PAYPAL"
     STRIPE = "STRIPE"
@@ -34,8 +38,8 @@ class Payment(Base):
     status = Column(SQLEnum(PaymentStatus), nullable=False, default=PaymentStatus.PENDING)
     
     # Payment gateway specific fields
-    gateway_payment_id = Column(String(200))  # Payment ID from gateway (Stripe, PayPal, etc)
-    gateway_response = Column(Text)  # JSON response from gateway
+    gateway_payment_id = Column(String(200), index=True)  # Payment ID from gateway (Stripe, PayPal, etc)
+    # Raw gateway responses are kept in payment_gateway_logs
     
     # Card information (encrypted/tokenized)
     card_last_four = Column(String(4))
@@ -49,6 +53,13 @@ class Payment(Base):
     # Failure information
     failure_reason = Column(String(500))
     failure_code = Column(String(50))
+    
+    __table_args__ = (
+        # Partial index used by the stuck-payment recovery sweeper
+        Index('idx_payments_processing_created_at', 'created_at', postgresql_where=text("status = 'PROCESSING'")),
+        # Keyset pagination and exports walk a user's payments by id
+        Index('idx_payments_user_listing', 'user_id', 'id'),
+    )
 
 class Refund(Base):
     __tablename__ = "refunds"
@@ -63,8 +74,59 @@ class Refund(Base):
     
     # Gateway specific
     gateway_refund_id = Column(String(200))
-    gateway_response = Column(Text)
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     processed_at = Column(DateTime(timezone=True))
+
+class PaymentIdempotencyKey(Base):
+    __tablename__ = "payment_idempotency_keys"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, nullable=False)
+    idempotency_key = Column(String(100), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # SHA-256 of the original request
+    payment_id = Column(BigInteger)
+    response = Column(LargeBinary)  # Serialized CreatePaymentResponse replayed on retries
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # One key per user; the unique index also serializes concurrent retries
+    __table_args__ = (
+        Index('idx_payment_idempotency_user_key', 'user_id', 'idempotency_key', unique=True),
+        Index('idx_payment_idempotency_expires_at', 'expires_at'),
+    )
+
+class PaymentGatewayEvent(Base):
+    __tablename__ = "payment_gateway_events"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event_id = Column(String(100), unique=True, nullable=False)  # Gateway event ID, used for dedupe
+    event_type = Column(String(100), nullable=False)
+    gateway_payment_id = Column(String(200))
+    failure_code = Column(String(50))
+    failure_reason = Column(String(500))
+    event_created_at = Column(DateTime(timezone=True))
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        # Queue of events waiting for the reconciliation worker
+        Index('idx_payment_gateway_events_unprocessed', 'id', postgresql_where=text("processed_at IS NULL")),
+    )
+
+class PaymentGatewayLog(Base):
+    """Append-only raw gateway payloads, range-partitioned by month on created_at"""
+    __tablename__ = "payment_gateway_logs"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    payment_id = Column(BigInteger, index=True)
+    refund_id = Column(BigInteger)
+    kind = Column(String(20), nullable=False)  # charge, refund
+    gateway_object_id = Column(String(200))  # Charge/refund ID from the gateway
+    payload = Column(JSONB, nullable=False)
+    
+    __table_args__ = (
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
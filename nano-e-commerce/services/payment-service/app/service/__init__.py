@@ -1,19 +1,103 @@
+import asyncio
+import base64
 import json
 import uuid
 import stripe
-from typing import Optional
+from collections import defaultdict
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.models import Payment, Refund, PaymentStatus, PaymentMethod
+from sqlalchemy import select, update, and_, or_, func, case, cast, column, values, String
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from app.models import Payment, Refund, PaymentStatus, PaymentMethod, PaymentIdempotencyKey, PaymentGatewayEvent, PaymentGatewayLog
 from app.proto import payment_pb2, payment_pb2_grpc
-from datetime import datetime
+from app.database import SessionLocal, ensure_gateway_log_partitions
+from app.gateway import stripe_gateway, GatewayUnavailableError
+from datetime import datetime, timedelta, timezone
+from idempotency import IdempotencyKeys, hash_request, sweep_expired_keys
 import logging
 import os
 
 logger = logging.getLogger(__name__)
 
-# Initialize Stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "sk_test_...")
+# Stuck payment recovery settings
+PAYMENT_PROCESSING_DEADLINE = int(os.getenv("PAYMENT_PROCESSING_DEADLINE", "300"))  # seconds
+PAYMENT_RECOVERY_INTERVAL = int(os.getenv("PAYMENT_RECOVERY_INTERVAL", "60"))  # seconds
+PAYMENT_RECOVERY_BATCH_SIZE = int(os.getenv("PAYMENT_RECOVERY_BATCH_SIZE", "100"))
+# Charge.search is eventually consistent, so a payment with no charge found is
+# only marked FAILED once it is this old
+PAYMENT_RECOVERY_GIVE_UP_AFTER = int(os.getenv("PAYMENT_RECOVERY_GIVE_UP_AFTER", "3600"))  # seconds
+
+# Gateway failures after which Stripe may still have captured the charge, and
+# charges Stripe has not settled yet
+UNKNOWN_OUTCOME_CODES = frozenset({
+    "gateway_timeout", "gateway_connection_error", "gateway_server_error", "charge_pending"
+})
+# Refunds carry an idempotency key, so these are also sent again by the recovery
+# sweeper, including ones the gateway client never sent
+REFUND_RETRY_CODES = UNKNOWN_OUTCOME_CODES | {"gateway_unavailable"}
+# Stripe keeps idempotency keys for 24 hours; older PROCESSING refunds are left
+# for manual review rather than risk a second refund
+REFUND_RECOVERY_RETRY_WINDOW = int(os.getenv("REFUND_RECOVERY_RETRY_WINDOW", "82800"))  # seconds
+
+# Payment callback settings
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+CALLBACK_BATCH_SIZE = int(os.getenv("CALLBACK_BATCH_SIZE", "500"))
+CALLBACK_POLL_INTERVAL = float(os.getenv("CALLBACK_POLL_INTERVAL", "1"))  # seconds
+
+# Gateway log partition maintenance
+GATEWAY_LOG_MAINTENANCE_INTERVAL = int(os.getenv("GATEWAY_LOG_MAINTENANCE_INTERVAL", "86400"))  # seconds
+
+# Payment history pagination
+PAYMENTS_DEFAULT_PAGE_SIZE = 20
+PAYMENTS_MAX_PAGE_SIZE = 100
+# Rows fetched per round trip when streaming an export
+PAYMENT_EXPORT_BATCH_SIZE = int(os.getenv("PAYMENT_EXPORT_BATCH_SIZE", "500"))
+
+# Gateway event type -> (new payment status, statuses it may be applied to)
+CALLBACK_TRANSITIONS = {
+    "charge.succeeded": (PaymentStatus.COMPLETED, [PaymentStatus.PENDING, PaymentStatus.PROCESSING, PaymentStatus.FAILED]),
+    "charge.failed": (PaymentStatus.FAILED, [PaymentStatus.PENDING, PaymentStatus.PROCESSING]),
+    "charge.refunded": (PaymentStatus.REFUNDED, [PaymentStatus.COMPLETED]),
+}
+
+# Proto payment method -> stored payment method
+PAYMENT_METHODS = {
+    payment_pb2.ALIPAY: PaymentMethod.ALIPAY,
+    payment_pb2.WECHAT: PaymentMethod.WECHAT,
+    payment_pb2.BANK_CARD: PaymentMethod.BANK_CARD,
+    payment_pb2.CREDIT_CARD: PaymentMethod.CREDIT_CARD,
+}
+
+# Methods charged through Stripe with the request's payment token
+CARD_PAYMENT_METHODS = frozenset({PaymentMethod.BANK_CARD, PaymentMethod.CREDIT_CARD})
+
+# Stored payment/refund status -> proto status; in-flight ones are still pending to callers
+PROTO_PAYMENT_STATUSES = {
+    PaymentStatus.PENDING: payment_pb2.PENDING,
+    PaymentStatus.PROCESSING: payment_pb2.PENDING,
+    PaymentStatus.COMPLETED: payment_pb2.SUCCESS,
+    PaymentStatus.FAILED: payment_pb2.FAILED,
+    PaymentStatus.CANCELLED: payment_pb2.CANCELLED,
+    PaymentStatus.REFUNDED: payment_pb2.REFUNDED,
+}
+
+# CreatePayment idempotency keys
+idempotency_keys = IdempotencyKeys(PaymentIdempotencyKey)
+
+# Set when callback events are stored so the worker wakes up without waiting for the next poll
+callback_events_pending = asyncio.Event()
+
+def encode_payment_cursor(payment_pk: int) -> str:
+    """Payment history cursor: id of the last payment on the previous page"""
+    return base64.urlsafe_b64encode(str(payment_pk).encode()).decode()
+
+def decode_payment_cursor(cursor: str) -> int:
+    """Parse a cursor; raises ValueError when it is malformed"""
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError("invalid cursor")
 
 class PaymentService:
     def __init__(self):
@@ -27,26 +111,37 @@ class PaymentService:
         """Generate unique refund ID"""
         return f"REF_{uuid.uuid4().hex[:16].upper()}"
     
+    async def _replay_idempotent_response(self, db: AsyncSession, record: PaymentIdempotencyKey, request_hash: str) -> payment_pb2.CreatePaymentResponse:
+        """Return the stored response for a retried request"""
+        if record.request_hash != request_hash:
+            return payment_pb2.CreatePaymentResponse(
+                success=False,
+                message="Idempotency key was already used with a different request"
+            )
+        if record.response:
+            return payment_pb2.CreatePaymentResponse.FromString(record.response)
+        
+        # The original request is still waiting on the gateway
+        result = await db.execute(select(Payment).where(Payment.id == record.payment_id))
+        payment = result.scalar_one_or_none()
+        if not payment:
+            return payment_pb2.CreatePaymentResponse(
+                success=False,
+                message="Payment is being processed"
+            )
+        return self._build_create_response(payment)
+    
     def _convert_payment_to_proto(self, payment: Payment) -> payment_pb2.Payment:
         """Convert SQLAlchemy Payment to protobuf Payment"""
-        # Convert status enum
-        status_map = {
-            PaymentStatus.PENDING: payment_pb2.PENDING,
-            PaymentStatus.PROCESSING: payment_pb2.PROCESSING,
-            PaymentStatus.COMPLETED: payment_pb2.COMPLETED,
-            PaymentStatus.FAILED: payment_pb2.FAILED,
-            PaymentStatus.CANCELLED: payment_pb2.CANCELLED,
-            PaymentStatus.REFUNDED: payment_pb2.REFUNDED,
-        }
-        
-        # Convert method enum
+        # Convert method enum; legacy methods map to the nearest proto method
         method_map = {
+            PaymentMethod.ALIPAY: payment_pb2.ALIPAY,
+            PaymentMethod.WECHAT: payment_pb2.WECHAT,
+            PaymentMethod.BANK_CARD: payment_pb2.BANK_CARD,
             PaymentMethod.CREDIT_CARD: payment_pb2.CREDIT_CARD,
-            PaymentMethod.DEBIT_CARD: payment_pb2.DEBIT_CARD,
-            PaymentMethod.PAYPAL: payment_pb2.PAYPAL,
-            PaymentMethod.STRIPE: payment_pb2.STRIPE,
-            PaymentMethod.BANK_TRANSFER: payment_pb2.BANK_TRANSFER,
-            PaymentMethod.CASH_ON_DELIVERY: payment_pb2.CASH_ON_DELIVERY,
+            PaymentMethod.STRIPE: payment_pb2.CREDIT_CARD,
+            PaymentMethod.DEBIT_CARD: payment_pb2.BANK_CARD,
+            PaymentMethod.BANK_TRANSFER: payment_pb2.BANK_CARD,
         }
         
         return payment_pb2.Payment(
@@ -55,121 +150,266 @@ class PaymentService:
             order_id=payment.order_id,
             user_id=payment.user_id,
             amount=payment.amount,
-            currency=payment.currency,
             method=method_map.get(payment.method, payment_pb2.CREDIT_CARD),
-            status=status_map.get(payment.status, payment_pb2.PENDING),
-            gateway_payment_id=payment.gateway_payment_id or "",
-            card_last_four=payment.card_last_four or "",
-            card_brand=payment.card_brand or "",
-            failure_reason=payment.failure_reason or "",
-            failure_code=payment.failure_code or "",
+            status=PROTO_PAYMENT_STATUSES.get(payment.status, payment_pb2.PENDING),
+            third_party_id=payment.gateway_payment_id or "",
             created_at=int(payment.created_at.timestamp()) if payment.created_at else 0,
-            processed_at=int(payment.processed_at.timestamp()) if payment.processed_at else 0
+            updated_at=int(payment.updated_at.timestamp()) if payment.updated_at else 0,
+            paid_at=int(payment.processed_at.timestamp()) if payment.processed_at and payment.status == PaymentStatus.COMPLETED else 0
         )
     
-    async def process_stripe_payment(self, amount: int, currency: str, token: str, description: str) -> dict:
-        """Process payment via Stripe"""
-        try:
-            charge = stripe.Charge.create(
-                amount=amount,
-                currency=currency.lower(),
-                source=token,
-                description=description
-            )
-            
+    def _convert_refund_to_proto(self, refund: Refund, user_id: int) -> payment_pb2.Refund:
+        """Convert SQLAlchemy Refund to protobuf Refund; the user comes from its payment"""
+        updated_at = refund.processed_at or refund.created_at
+        return payment_pb2.Refund(
+            id=refund.id,
+            refund_id=refund.refund_id,
+            payment_id=refund.payment_id,
+            order_id=refund.order_id,
+            user_id=user_id,
+            amount=refund.amount,
+            status=PROTO_PAYMENT_STATUSES.get(refund.status, payment_pb2.PENDING),
+            reason=refund.reason or "",
+            third_party_refund_id=refund.gateway_refund_id or "",
+            created_at=int(refund.created_at.timestamp()) if refund.created_at else 0,
+            updated_at=int(updated_at.timestamp()) if updated_at else 0,
+            refunded_at=int(refund.processed_at.timestamp()) if refund.processed_at and refund.status == PaymentStatus.COMPLETED else 0
+        )
+    
+    def _charge_result(self, charge) -> dict:
+        """Extract the fields we keep from a Stripe charge"""
+        if charge.paid:
             return {
                 "success": True,
                 "gateway_payment_id": charge.id,
-                "status": "completed" if charge.paid else "failed",
                 "card_last_four": charge.source.last4 if charge.source else None,
                 "card_brand": charge.source.brand if charge.source else None,
                 "response": charge
             }
-            
-        except stripe.error.CardError as e:
+        if charge.status == "pending":
             return {
                 "success": False,
-                "failure_reason": str(e),
-                "failure_code": e.code,
-                "response": str(e)
+                "gateway_payment_id": charge.id,
+                "failure_reason": "Charge is pending at the gateway",
+                "failure_code": "charge_pending",
+                "response": charge
             }
+        return {
+            "success": False,
+            "gateway_payment_id": charge.id,
+            "failure_reason": (charge.failure_message or "Charge was not paid")[:500],
+            "failure_code": charge.failure_code or "charge_failed",
+            "response": charge
+        }
+    
+    async def process_stripe_payment(self, amount: int, currency: str, token: str, description: str,
+                                     idempotency_key: Optional[str] = None, metadata: Optional[dict] = None) -> dict:
+        """Process payment via Stripe"""
+        try:
+            charge = await stripe_gateway.call(
+                stripe.Charge.create,
+                amount=amount,
+                currency=currency.lower(),
+                source=token,
+                description=description,
+                metadata=metadata,
+                idempotency_key=idempotency_key
+            )
+            
+            return self._charge_result(charge)
+            
         except Exception as e:
+            return self._gateway_error_result(e)
+    
+    def _gateway_error_result(self, e: Exception) -> dict:
+        """Map an exception from a gateway call to a failed result"""
+        if isinstance(e, stripe.error.CardError):
+            failure_code = e.code
+        elif isinstance(e, GatewayUnavailableError):
+            failure_code = "gateway_unavailable"
+        elif isinstance(e, asyncio.TimeoutError):
             return {
                 "success": False,
-                "failure_reason": str(e),
-                "failure_code": "processing_error",
-                "response": str(e)
+                "failure_reason": "Payment gateway timed out",
+                "failure_code": "gateway_timeout",
+                "response": "timeout"
             }
+        elif isinstance(e, stripe.error.APIConnectionError):
+            # Includes read timeouts of the HTTP client; the request may have reached Stripe
+            failure_code = "gateway_connection_error"
+        elif isinstance(e, stripe.error.StripeError):
+            failure_code = "gateway_server_error" if (e.http_status or 0) >= 500 else "processing_error"
+        else:
+            failure_code = "processing_error"
+        return {
+            "success": False,
+            "failure_reason": str(e),
+            "failure_code": failure_code,
+            "response": str(e)
+        }
+    
+    def _gateway_result_values(self, result: dict) -> Optional[dict]:
+        """Map a gateway result to payment column values, or None if the outcome is unknown"""
+        if result["success"]:
+            return {
+                "status": PaymentStatus.COMPLETED,
+                "gateway_payment_id": result["gateway_payment_id"],
+                "card_last_four": result.get("card_last_four"),
+                "card_brand": result.get("card_brand"),
+                "processed_at": datetime.utcnow(),
+            }
+        if result["failure_code"] in UNKNOWN_OUTCOME_CODES:
+            # The charge may still have gone through; leave it for the recovery sweeper
+            return None
+        return {
+            "status": PaymentStatus.FAILED,
+            "gateway_payment_id": result.get("gateway_payment_id"),
+            "failure_reason": result["failure_reason"],
+            "failure_code": result["failure_code"],
+        }
+    
+    async def _log_gateway_response(self, db: AsyncSession, kind: str, response, payment_id: Optional[int] = None,
+                                    refund_id: Optional[int] = None, gateway_object_id: Optional[str] = None):
+        """Append a raw gateway response to payment_gateway_logs"""
+        if isinstance(response, dict):
+            payload = json.loads(json.dumps(response, default=str))
+        else:
+            payload = {"error": str(response)}
+        
+        await db.execute(
+            insert(PaymentGatewayLog).values(
+                payment_id=payment_id,
+                refund_id=refund_id,
+                kind=kind,
+                gateway_object_id=gateway_object_id,
+                payload=payload
+            )
+        )
+    
+    def _build_create_response(self, payment: Payment) -> payment_pb2.CreatePaymentResponse:
+        """Build the CreatePayment response for the payment's current state"""
+        if payment.status == PaymentStatus.COMPLETED:
+            message = "Payment processed successfully"
+        elif payment.status == PaymentStatus.PROCESSING:
+            message = "Payment is being processed"
+        else:
+            message = "Payment created"
+        
+        return payment_pb2.CreatePaymentResponse(
+            success=True,
+            payment=self._convert_payment_to_proto(payment),
+            message=message
+        )
+    
+    async def _finalize_payment(self, db: AsyncSession, payment_pk: int, values: Optional[dict],
+                                gateway_result: Optional[dict] = None) -> payment_pb2.CreatePaymentResponse:
+        """Second short transaction: record the gateway outcome on a PROCESSING payment"""
+        if gateway_result:
+            await self._log_gateway_response(
+                db, "charge", gateway_result["response"],
+                payment_id=payment_pk,
+                gateway_object_id=gateway_result.get("gateway_payment_id")
+            )
+        
+        if values:
+            # Only the first writer (request or recovery sweeper) wins
+            await db.execute(
+                update(Payment)
+                .where(and_(Payment.id == payment_pk, Payment.status == PaymentStatus.PROCESSING))
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        
+        result = await db.execute(
+            select(Payment).where(Payment.id == payment_pk).execution_options(populate_existing=True)
+        )
+        payment = result.scalar_one()
+        response = self._build_create_response(payment)
+        
+        # Final outcomes are stored for idempotent replays
+        if payment.status != PaymentStatus.PROCESSING:
+            await db.execute(
+                update(PaymentIdempotencyKey)
+                .where(and_(
+                    PaymentIdempotencyKey.payment_id == payment_pk,
+                    PaymentIdempotencyKey.response.is_(None)
+                ))
+                .values(response=response.SerializeToString())
+                .execution_options(synchronize_session=False)
+            )
+        
+        await db.commit()
+        return response
     
     async def create_payment(self, db: AsyncSession, request: payment_pb2.CreatePaymentRequest) -> payment_pb2.CreatePaymentResponse:
-        """Create and process a payment"""
+        """Create and process a payment.
+        
+        Gateway payments run in two short transactions: the PROCESSING row is
+        committed before calling the gateway and the outcome is written
+        afterwards, so no pooled connection is held while the gateway works.
+        """
+        payment_method = PAYMENT_METHODS.get(request.method, PaymentMethod.CREDIT_CARD)
+        charge_card = payment_method in CARD_PAYMENT_METHODS
+        if charge_card and not request.payment_token:
+            return payment_pb2.CreatePaymentResponse(
+                success=False,
+                message="A payment token is required for card payments"
+            )
+        currency = request.currency.upper() or "USD"
+        
+        request_hash = None
         try:
-            payment_id = self._generate_payment_id()
+            if request.idempotency_key:
+                request_hash = hash_request(request)
+                record = await idempotency_keys.get(db, request.user_id, request.idempotency_key)
+                if record:
+                    return await self._replay_idempotent_response(db, record, request_hash)
+                record = await idempotency_keys.claim(db, request.user_id, request.idempotency_key, request_hash)
             
-            # Convert protobuf enums to SQLAlchemy enums
-            method_map = {
-                payment_pb2.CREDIT_CARD: PaymentMethod.CREDIT_CARD,
-                payment_pb2.DEBIT_CARD: PaymentMethod.DEBIT_CARD,
-                payment_pb2.PAYPAL: PaymentMethod.PAYPAL,
-                payment_pb2.STRIPE: PaymentMethod.STRIPE,
-                payment_pb2.BANK_TRANSFER: PaymentMethod.BANK_TRANSFER,
-                payment_pb2.CASH_ON_DELIVERY: PaymentMethod.CASH_ON_DELIVERY,
-            }
-            
-            payment_method = method_map.get(request.method, PaymentMethod.CREDIT_CARD)
+            payment_id = self._generate_payment_id()
             
-            # Create payment record
+            # Create payment record. Card payments are charged through Stripe;
+            # wallet payments (Alipay, WeChat) are left pending for manual processing.
             payment = Payment(
                 payment_id=payment_id,
                 order_id=request.order_id,
                 user_id=request.user_id,
                 amount=request.amount,
-                currency=request.currency,
+                currency=currency,
                 method=payment_method,
-                status=PaymentStatus.PROCESSING
+                status=PaymentStatus.PROCESSING if charge_card else PaymentStatus.PENDING
             )
             
             db.add(payment)
             await db.flush()  # Get payment ID
             
-            # Process payment based on method
-            if payment_method == PaymentMethod.STRIPE:
-                result = await self.process_stripe_payment(
-                    amount=request.amount,
-                    currency=request.currency,
-                    token=request.payment_token,
-                    description=f"Order #{request.order_id}"
-                )
-                
-                if result["success"]:
-                    payment.status = PaymentStatus.COMPLETED
-                    payment.gateway_payment_id = result["gateway_payment_id"]
-                    payment.card_last_four = result.get("card_last_four")
-                    payment.card_brand = result.get("card_brand")
-                    payment.processed_at = datetime.utcnow()
-                else:
-                    payment.status = PaymentStatus.FAILED
-                    payment.failure_reason = result["failure_reason"]
-                    payment.failure_code = result["failure_code"]
-                
-                payment.gateway_response = json.dumps(result["response"], default=str)
-                
-            elif payment_method == PaymentMethod.CASH_ON_DELIVERY:
-                payment.status = PaymentStatus.PENDING
-                # COD payments are completed upon delivery
-                
-            else:
-                # For other payment methods, mark as pending for manual processing
-                payment.status = PaymentStatus.PENDING
+            if request.idempotency_key:
+                record.payment_id = payment.id
+            
+            if not charge_card:
+                await db.refresh(payment)
+                response = self._build_create_response(payment)
+                if request.idempotency_key:
+                    record.response = response.SerializeToString()
+                await db.commit()
+                return response
             
+            # Phase 1: commit the PROCESSING row before calling the gateway
+            payment_pk = payment.id
             await db.commit()
             
+        except IntegrityError as e:
+            await db.rollback()
+            if request_hash:
+                # Lost the race against a concurrent retry with the same key
+                record = await idempotency_keys.get(db, request.user_id, request.idempotency_key)
+                if record:
+                    return await self._replay_idempotent_response(db, record, request_hash)
+            logger.error(f"Error creating payment: {e}")
             return payment_pb2.CreatePaymentResponse(
-                success=True,
-                payment=self._convert_payment_to_proto(payment),
-                message="Payment processed successfully" if payment.status == PaymentStatus.COMPLETED else "Payment created"
+                success=False,
+                message="Failed to process payment"
             )
-            
         except Exception as e:
             logger.error(f"Error creating payment: {e}")
             await db.rollback()
@@ -177,13 +417,240 @@ class PaymentService:
                 success=False,
                 message="Failed to process payment"
             )
+        
+        # Phase 2: call the gateway outside any transaction
+        result = await self.process_stripe_payment(
+            amount=request.amount,
+            currency=currency,
+            token=request.payment_token,
+            description=f"Order #{request.order_id}",
+            # Stripe dedupes retried charges carrying the same key
+            idempotency_key=f"{request.user_id}:{request.idempotency_key}" if request.idempotency_key else None,
+            # Lets the recovery sweeper find the charge if we never record it
+            metadata={"payment_id": payment_id}
+        )
+        
+        # Phase 3: record the outcome in a second short transaction
+        try:
+            return await self._finalize_payment(db, payment_pk, self._gateway_result_values(result), result)
+        except Exception as e:
+            logger.error(f"Error recording result of payment {payment_id}: {e}")
+            await db.rollback()
+            # The row stays PROCESSING and is reconciled by the recovery sweeper
+            return payment_pb2.CreatePaymentResponse(
+                success=False,
+                message="Payment is being processed"
+            )
     
-    async def get_payment(self, db: AsyncSession, request: payment_pb2.GetPaymentRequest) -> payment_pb2.GetPaymentResponse:
-        """Get payment by ID"""
+    async def _find_stripe_charge(self, payment_id: str):
+        """Look up a charge by the payment_id metadata attached at creation"""
+        result = await stripe_gateway.call(
+            stripe.Charge.search,
+            query=f"metadata['payment_id']:'{payment_id}'"
+        )
+        return result.data[0] if result.data else None
+    
+    async def recover_stuck_payments(self, db: AsyncSession, batch_size: int = PAYMENT_RECOVERY_BATCH_SIZE) -> int:
+        """Reconcile PROCESSING payments that outlived the processing deadline"""
+        result = await db.execute(
+            select(
+                Payment.id,
+                Payment.payment_id,
+                (Payment.created_at < func.now() - timedelta(seconds=PAYMENT_RECOVERY_GIVE_UP_AFTER)).label("give_up")
+            )
+            .where(and_(
+                Payment.status == PaymentStatus.PROCESSING,
+                Payment.created_at < func.now() - timedelta(seconds=PAYMENT_PROCESSING_DEADLINE)
+            ))
+            .order_by(Payment.id)
+            .limit(batch_size)
+        )
+        stuck_payments = result.all()
+        # Release the connection before talking to the gateway
+        await db.commit()
+        
+        recovered = 0
+        for payment_pk, payment_id, give_up in stuck_payments:
+            try:
+                charge = await self._find_stripe_charge(payment_id)
+            except Exception as e:
+                logger.warning(f"Could not look up charge for stuck payment {payment_id}: {e}")
+                continue
+            
+            charge_result = self._charge_result(charge) if charge else None
+            if charge_result:
+                values = self._gateway_result_values(charge_result)
+                if values is None:
+                    # Stripe has not settled the charge yet; look again next run
+                    continue
+            elif not give_up:
+                # The search index may not have caught up yet; look again next run
+                continue
+            else:
+                values = {
+                    "status": PaymentStatus.FAILED,
+                    "failure_reason": "No gateway charge found after recovery deadline",
+                    "failure_code": "reconciliation_not_found",
+                }
+            
+            try:
+                await self._finalize_payment(db, payment_pk, values, charge_result)
+                recovered += 1
+            except Exception as e:
+                logger.error(f"Error reconciling stuck payment {payment_id}: {e}")
+                await db.rollback()
+        
+        return recovered
+    
+    async def handle_payment_callback(self, db: AsyncSession, request: payment_pb2.PaymentCallbackRequest) -> payment_pb2.PaymentCallbackResponse:
+        """Store a gateway webhook event for the reconciliation worker.
+        
+        Events are deduplicated on the gateway event id; applying them to
+        payments happens in batches in apply_callback_events.
+        """
+        if not STRIPE_WEBHOOK_SECRET:
+            # Without the secret the payload cannot be authenticated; never trust it
+            logger.error("Rejected payment callback: STRIPE_WEBHOOK_SECRET is not set")
+            return payment_pb2.PaymentCallbackResponse(
+                success=False,
+                message="Payment callbacks are not configured"
+            )
+        
         try:
+            event = stripe.Webhook.construct_event(request.third_party_data, request.signature, STRIPE_WEBHOOK_SECRET)
+            charge = event["data"]["object"]
+            event_id = event["id"]
+            event_type = event["type"]
+        except (ValueError, KeyError, TypeError, stripe.error.SignatureVerificationError) as e:
+            logger.warning(f"Rejected payment callback: {e}")
+            return payment_pb2.PaymentCallbackResponse(
+                success=False,
+                message="Invalid callback payload"
+            )
+        
+        try:
+            gateway_payment_id = charge.get("id") if charge.get("object") == "charge" else None
+            if event_type == "charge.refunded" and not charge.get("refunded"):
+                # Partial refund; the payment stays COMPLETED
+                gateway_payment_id = None
+            
             result = await db.execute(
-                select(Payment).where(Payment.payment_id == request.payment_id)
+                insert(PaymentGatewayEvent)
+                .values(
+                    event_id=event_id,
+                    event_type=event_type,
+                    gateway_payment_id=gateway_payment_id,
+                    failure_code=charge.get("failure_code"),
+                    failure_reason=(charge.get("failure_message") or "")[:500] or None,
+                    event_created_at=datetime.fromtimestamp(event["created"], tz=timezone.utc) if event.get("created") else None
+                )
+                .on_conflict_do_nothing(index_elements=["event_id"])
+                .returning(PaymentGatewayEvent.id)
+            )
+            is_new = result.scalar_one_or_none() is not None
+            await db.commit()
+            
+            if is_new:
+                callback_events_pending.set()
+            
+            return payment_pb2.PaymentCallbackResponse(
+                success=True,
+                message="Event received" if is_new else "Duplicate event ignored",
+                response_data=json.dumps({"received": True})
+            )
+            
+        except Exception as e:
+            logger.error(f"Error storing payment callback: {e}")
+            await db.rollback()
+            return payment_pb2.PaymentCallbackResponse(
+                success=False,
+                message="Failed to process callback"
+            )
+    
+    def _build_callback_update(self, events: List[PaymentGatewayEvent]):
+        """One UPDATE ... FROM (VALUES ...) applying events to payments by gateway_payment_id"""
+        rows = values(
+            column("gateway_payment_id", String),
+            column("status", String),
+            column("failure_code", String),
+            column("failure_reason", String),
+            name="callback_events"
+        ).data([
+            (event.gateway_payment_id, CALLBACK_TRANSITIONS[event.event_type][0].value,
+             event.failure_code, event.failure_reason)
+            for event in events
+        ])
+        
+        allowed_transition = or_(*(
+            and_(rows.c.status == target.value, Payment.status.in_(sources))
+            for target, sources in CALLBACK_TRANSITIONS.values()
+        ))
+        
+        return (
+            update(Payment)
+            .where(and_(Payment.gateway_payment_id == rows.c.gateway_payment_id, allowed_transition))
+            .values(
+                status=cast(rows.c.status, Payment.status.type),
+                failure_code=func.coalesce(rows.c.failure_code, Payment.failure_code),
+                failure_reason=func.coalesce(rows.c.failure_reason, Payment.failure_reason),
+                processed_at=case(
+                    (rows.c.status == PaymentStatus.COMPLETED.value, func.coalesce(Payment.processed_at, func.now())),
+                    else_=Payment.processed_at
+                )
             )
+            .execution_options(synchronize_session=False)
+        )
+    
+    async def apply_callback_events(self, db: AsyncSession, batch_size: int = CALLBACK_BATCH_SIZE) -> int:
+        """Apply one batch of stored callback events in a single transaction"""
+        result = await db.execute(
+            select(PaymentGatewayEvent)
+            .where(PaymentGatewayEvent.processed_at.is_(None))
+            .order_by(PaymentGatewayEvent.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        events = result.scalars().all()
+        if not events:
+            await db.commit()
+            return 0
+        
+        # Several events for the same charge go into successive rounds, in
+        # event order, so every transition is checked against the previous one
+        rounds = []
+        seen = defaultdict(int)
+        for event in sorted(events, key=lambda e: (e.event_created_at or e.received_at, e.id)):
+            if event.event_type not in CALLBACK_TRANSITIONS or not event.gateway_payment_id:
+                continue
+            position = seen[event.gateway_payment_id]
+            seen[event.gateway_payment_id] += 1
+            if position == len(rounds):
+                rounds.append([])
+            rounds[position].append(event)
+        
+        for round_events in rounds:
+            await db.execute(self._build_callback_update(round_events))
+        
+        await db.execute(
+            update(PaymentGatewayEvent)
+            .where(PaymentGatewayEvent.id.in_([event.id for event in events]))
+            .values(processed_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return len(events)
+    
+    async def get_payment(self, db: AsyncSession, request: payment_pb2.GetPaymentRequest) -> payment_pb2.GetPaymentResponse:
+        """Get payment by ID, payment number or order (latest payment)"""
+        try:
+            identifier = request.WhichOneof("identifier")
+            if identifier == "payment_id":
+                query = select(Payment).where(Payment.id == request.payment_id)
+            elif identifier == "payment_no":
+                query = select(Payment).where(Payment.payment_id == request.payment_no)
+            else:
+                query = select(Payment).where(Payment.order_id == request.order_id).order_by(Payment.id.desc()).limit(1)
+            result = await db.execute(query)
             payment = result.scalar_one_or_none()
             
             if not payment:
@@ -204,101 +671,355 @@ class PaymentService:
                 message="Failed to get payment"
             )
     
-    async def get_order_payments(self, db: AsyncSession, request: payment_pb2.GetOrderPaymentsRequest) -> payment_pb2.GetOrderPaymentsResponse:
-        """Get all payments for an order"""
+    async def get_user_payments(self, db: AsyncSession, request: payment_pb2.GetUserPaymentsRequest) -> payment_pb2.GetUserPaymentsResponse:
+        """A user's payments newest first, keyset-paginated on id"""
         try:
-            result = await db.execute(
-                select(Payment).where(Payment.order_id == request.order_id)
-            )
-            payments = result.scalars().all()
+            page_size = min(request.page_size or PAYMENTS_DEFAULT_PAGE_SIZE, PAYMENTS_MAX_PAGE_SIZE)
+            query = select(Payment).where(Payment.user_id == request.user_id)
+            if request.cursor:
+                query = query.where(Payment.id < decode_payment_cursor(request.cursor))
+            
+            # Fetch one extra row to know whether there is a next page
+            query = query.order_by(Payment.id.desc()).limit(page_size + 1)
+            payments = list((await db.execute(query)).scalars().all())
             
-            payment_list = [self._convert_payment_to_proto(payment) for payment in payments]
+            next_cursor = ""
+            if len(payments) > page_size:
+                payments = payments[:page_size]
+                next_cursor = encode_payment_cursor(payments[-1].id)
             
-            return payment_pb2.GetOrderPaymentsResponse(
+            return payment_pb2.GetUserPaymentsResponse(
                 success=True,
-                payments=payment_list
+                payments=[self._convert_payment_to_proto(payment) for payment in payments],
+                next_cursor=next_cursor
             )
             
+        except ValueError:
+            return payment_pb2.GetUserPaymentsResponse(
+                success=False,
+                message="Invalid cursor"
+            )
         except Exception as e:
-            logger.error(f"Error getting order payments: {e}")
-            return payment_pb2.GetOrderPaymentsResponse(
+            logger.error(f"Error getting user payments: {e}")
+            return payment_pb2.GetUserPaymentsResponse(
                 success=False,
-                message="Failed to get order payments"
+                message="Failed to get user payments"
+            )
+    
+    async def export_user_payments(self, db: AsyncSession, request: payment_pb2.ExportUserPaymentsRequest):
+        """Yield a user's payments oldest first, read in batches through a server-side cursor"""
+        query = select(Payment).where(Payment.user_id == request.user_id)
+        if request.created_from:
+            query = query.where(Payment.created_at >= datetime.fromtimestamp(request.created_from, timezone.utc))
+        if request.created_to:
+            query = query.where(Payment.created_at < datetime.fromtimestamp(request.created_to, timezone.utc))
+        
+        query = query.order_by(Payment.id).execution_options(yield_per=PAYMENT_EXPORT_BATCH_SIZE)
+        result = await db.stream_scalars(query)
+        async for payment in result:
+            yield self._convert_payment_to_proto(payment)
+    
+    async def process_stripe_refund(self, charge_id: str, amount: int, refund_id: str) -> dict:
+        """Refund a charge via Stripe"""
+        try:
+            stripe_refund = await stripe_gateway.call(
+                stripe.Refund.create,
+                charge=charge_id,
+                amount=amount,
+                metadata={"refund_id": refund_id},
+                # Requests resent by the recovery sweeper never refund twice
+                idempotency_key=refund_id
             )
+        except Exception as e:
+            return self._gateway_error_result(e)
+        
+        if stripe_refund.status in ("failed", "canceled"):
+            return {
+                "success": False,
+                "gateway_refund_id": stripe_refund.id,
+                "failure_reason": stripe_refund.failure_reason or "Refund was not processed",
+                "failure_code": "refund_failed",
+                "response": stripe_refund
+            }
+        return {
+            "success": True,
+            "gateway_refund_id": stripe_refund.id,
+            "response": stripe_refund
+        }
+    
+    def _build_refund_response(self, refund: Refund, user_id: int) -> payment_pb2.CreateRefundResponse:
+        """Build the CreateRefund response for the refund's current state"""
+        return payment_pb2.CreateRefundResponse(
+            success=refund.status != PaymentStatus.FAILED,
+            message={
+                PaymentStatus.COMPLETED: "Refund processed successfully",
+                PaymentStatus.PROCESSING: "Refund is being processed",
+                PaymentStatus.FAILED: "Refund failed",
+            }.get(refund.status, "Refund created"),
+            refund=self._convert_refund_to_proto(refund, user_id)
+        )
+    
+    async def _finalize_refund(self, db: AsyncSession, refund_pk: int, result: dict) -> payment_pb2.CreateRefundResponse:
+        """Second short transaction: record the gateway outcome on a PROCESSING refund"""
+        payment_pk = (await db.execute(select(Refund.payment_id).where(Refund.id == refund_pk))).scalar_one()
+        # Same lock order as create_refund: the payment first, then its refunds
+        payment = (await db.execute(
+            select(Payment).where(Payment.id == payment_pk).with_for_update()
+            .execution_options(populate_existing=True)
+        )).scalar_one()
+        refund = (await db.execute(
+            select(Refund).where(Refund.id == refund_pk).with_for_update()
+            .execution_options(populate_existing=True)
+        )).scalar_one()
+        
+        await self._log_gateway_response(
+            db, "refund", result["response"],
+            payment_id=payment.id,
+            refund_id=refund.id,
+            gateway_object_id=result.get("gateway_refund_id")
+        )
+        
+        # Only the first writer (request or recovery sweeper) wins
+        if refund.status == PaymentStatus.PROCESSING:
+            if result["success"]:
+                refund.status = PaymentStatus.COMPLETED
+                refund.gateway_refund_id = result["gateway_refund_id"]
+                refund.processed_at = datetime.utcnow()
+                
+                # Update original payment status once completed refunds cover it
+                completed = await db.execute(
+                    select(func.coalesce(func.sum(Refund.amount), 0)).where(and_(
+                        Refund.payment_id == payment.id,
+                        Refund.status == PaymentStatus.COMPLETED,
+                        Refund.id != refund.id
+                    ))
+                )
+                if completed.scalar_one() + refund.amount >= payment.amount:
+                    payment.status = PaymentStatus.REFUNDED
+            elif result["failure_code"] not in REFUND_RETRY_CODES:
+                refund.status = PaymentStatus.FAILED
+                refund.gateway_refund_id = result.get("gateway_refund_id")
+                refund.processed_at = datetime.utcnow()
+        
+        await db.flush()
+        await db.refresh(refund)
+        response = self._build_refund_response(refund, payment.user_id)
+        await db.commit()
+        return response
     
-    async def refund_payment(self, db: AsyncSession, request: payment_pb2.RefundPaymentRequest) -> payment_pb2.RefundPaymentResponse:
-        """Process a refund"""
+    async def create_refund(self, db: AsyncSession, request: payment_pb2.CreateRefundRequest) -> payment_pb2.CreateRefundResponse:
+        """Refund a completed payment in full (amount 0) or in part.
+        
+        Like create_payment, the PROCESSING refund is committed before calling
+        the gateway and the outcome is written in a second short transaction.
+        Unknown outcomes stay PROCESSING for the recovery sweeper.
+        """
         try:
-            # Get original payment
+            # Lock the payment so concurrent refunds cannot exceed what was paid
             result = await db.execute(
-                select(Payment).where(Payment.payment_id == request.payment_id)
+                select(Payment).where(Payment.id == request.payment_id).with_for_update()
             )
             payment = result.scalar_one_or_none()
             
-            if not payment:
-                return payment_pb2.RefundPaymentResponse(
+            # Someone else's payment is reported as missing
+            if (not payment or payment.user_id != request.user_id
+                    or (request.order_id and payment.order_id != request.order_id)):
+                return payment_pb2.CreateRefundResponse(
                     success=False,
                     message="Payment not found"
                 )
             
             if payment.status != PaymentStatus.COMPLETED:
-                return payment_pb2.RefundPaymentResponse(
+                return payment_pb2.CreateRefundResponse(
                     success=False,
                     message="Can only refund completed payments"
                 )
             
-            refund_id = self._generate_refund_id()
-            refund_amount = request.amount if request.amount > 0 else payment.amount
+            # Refunds that have not failed, including ones still processing,
+            # count against the paid amount
+            result = await db.execute(
+                select(func.coalesce(func.sum(Refund.amount), 0)).where(and_(
+                    Refund.payment_id == payment.id,
+                    Refund.status != PaymentStatus.FAILED
+                ))
+            )
+            refunded = result.scalar_one()
+            refund_amount = request.amount if request.amount > 0 else payment.amount - refunded
+            if refund_amount <= 0 or refunded + refund_amount > payment.amount:
+                return payment_pb2.CreateRefundResponse(
+                    success=False,
+                    message="Refund amount exceeds the refundable amount"
+                )
             
-            # Create refund record
+            # Refunds of gateway payments go through Stripe; others are left
+            # pending for manual processing
             refund = Refund(
-                refund_id=refund_id,
+                refund_id=self._generate_refund_id(),
                 payment_id=payment.id,
                 order_id=payment.order_id,
                 amount=refund_amount,
                 reason=request.reason,
-                status=PaymentStatus.PROCESSING
+                status=PaymentStatus.PROCESSING if payment.gateway_payment_id else PaymentStatus.PENDING
             )
             
             db.add(refund)
             await db.flush()
+            await db.refresh(refund)
             
-            # Process refund via payment gateway
-            if payment.method == PaymentMethod.STRIPE and payment.gateway_payment_id:
-                try:
-                    stripe_refund = stripe.Refund.create(
-                        charge=payment.gateway_payment_id,
-                        amount=refund_amount
-                    )
-                    
-                    refund.status = PaymentStatus.COMPLETED
-                    refund.gateway_refund_id = stripe_refund.id
-                    refund.gateway_response = json.dumps(stripe_refund, default=str)
-                    refund.processed_at = datetime.utcnow()
-                    
-                    # Update original payment status if fully refunded
-                    if refund_amount >= payment.amount:
-                        payment.status = PaymentStatus.REFUNDED
-                    
-                except Exception as e:
-                    refund.status = PaymentStatus.FAILED
-                    refund.gateway_response = str(e)
-            else:
-                # Mark as pending for manual processing
-                refund.status = PaymentStatus.PENDING
+            if refund.status == PaymentStatus.PENDING:
+                response = self._build_refund_response(refund, payment.user_id)
+                await db.commit()
+                return response
             
+            # Phase 1: commit the PROCESSING refund before calling the gateway
+            refund_pk = refund.id
+            refund_id = refund.refund_id
+            charge_id = payment.gateway_payment_id
             await db.commit()
             
-            return payment_pb2.RefundPaymentResponse(
-                success=True,
-                refund_id=refund_id,
-                message="Refund processed successfully" if refund.status == PaymentStatus.COMPLETED else "Refund created"
-            )
-            
         except Exception as e:
             logger.error(f"Error processing refund: {e}")
             await db.rollback()
-            return payment_pb2.RefundPaymentResponse(
+            return payment_pb2.CreateRefundResponse(
                 success=False,
                 message="Failed to process refund"
             )
+        
+        # Phase 2: call the gateway outside any transaction
+        result = await self.process_stripe_refund(charge_id, refund_amount, refund_id)
+        
+        # Phase 3: record the outcome in a second short transaction
+        try:
+            return await self._finalize_refund(db, refund_pk, result)
+        except Exception as e:
+            logger.error(f"Error recording result of refund {refund_id}: {e}")
+            await db.rollback()
+            # The refund stays PROCESSING and is resent by the recovery sweeper
+            return payment_pb2.CreateRefundResponse(
+                success=False,
+                message="Refund is being processed"
+            )
+    
+    async def recover_stuck_refunds(self, db: AsyncSession, batch_size: int = PAYMENT_RECOVERY_BATCH_SIZE) -> int:
+        """Resend PROCESSING refunds that outlived the processing deadline.
+        
+        Stripe replays the original outcome for a request it already received
+        with the same idempotency key, and performs the refund otherwise.
+        """
+        result = await db.execute(
+            select(
+                Refund.id,
+                Refund.refund_id,
+                Refund.amount,
+                Payment.gateway_payment_id,
+                (Refund.created_at < func.now() - timedelta(seconds=REFUND_RECOVERY_RETRY_WINDOW)).label("expired")
+            )
+            .join(Payment, Payment.id == Refund.payment_id)
+            .where(and_(
+                Refund.status == PaymentStatus.PROCESSING,
+                Refund.created_at < func.now() - timedelta(seconds=PAYMENT_PROCESSING_DEADLINE)
+            ))
+            .order_by(Refund.id)
+            .limit(batch_size)
+        )
+        stuck_refunds = result.all()
+        # Release the connection before talking to the gateway
+        await db.commit()
+        
+        recovered = 0
+        for refund_pk, refund_id, amount, charge_id, expired in stuck_refunds:
+            if expired:
+                logger.warning(f"Refund {refund_id} is still processing after its idempotency key expired; needs manual review")
+                continue
+            
+            result = await self.process_stripe_refund(charge_id, amount, refund_id)
+            if not result["success"] and result["failure_code"] in REFUND_RETRY_CODES:
+                continue
+            
+            try:
+                await self._finalize_refund(db, refund_pk, result)
+                recovered += 1
+            except Exception as e:
+                logger.error(f"Error reconciling stuck refund {refund_id}: {e}")
+                await db.rollback()
+        
+        return recovered
+    
+    async def get_refund(self, db: AsyncSession, request: payment_pb2.GetRefundRequest) -> payment_pb2.GetRefundResponse:
+        """Get refund by ID, refund number or order (latest refund)"""
+        try:
+            query = select(Refund, Payment.user_id).join(Payment, Payment.id == Refund.payment_id)
+            identifier = request.WhichOneof("identifier")
+            if identifier == "refund_id":
+                query = query.where(Refund.id == request.refund_id)
+            elif identifier == "refund_no":
+                query = query.where(Refund.refund_id == request.refund_no)
+            else:
+                query = query.where(Refund.order_id == request.order_id).order_by(Refund.id.desc()).limit(1)
+            row = (await db.execute(query)).first()
+            
+            if not row:
+                return payment_pb2.GetRefundResponse(
+                    success=False,
+                    message="Refund not found"
+                )
+            
+            refund, user_id = row
+            return payment_pb2.GetRefundResponse(
+                success=True,
+                refund=self._convert_refund_to_proto(refund, user_id)
+            )
+            
+        except Exception as e:
+            logger.error(f"Error getting refund: {e}")
+            return payment_pb2.GetRefundResponse(
+                success=False,
+                message="Failed to get refund"
+            )
+
+async def sweep_expired_idempotency_keys():
+    """Periodically purge expired idempotency keys"""
+    await sweep_expired_keys(idempotency_keys, SessionLocal)
+
+async def sweep_stuck_payments():
+    """Periodically reconcile payments and refunds stuck in PROCESSING"""
+    payment_service = PaymentService()
+    while True:
+        await asyncio.sleep(PAYMENT_RECOVERY_INTERVAL)
+        try:
+            async with SessionLocal() as db:
+                recovered = await payment_service.recover_stuck_payments(db)
+                recovered_refunds = await payment_service.recover_stuck_refunds(db)
+            if recovered:
+                logger.info(f"Reconciled {recovered} stuck payments")
+            if recovered_refunds:
+                logger.info(f"Reconciled {recovered_refunds} stuck refunds")
+        except Exception as e:
+            logger.error(f"Error reconciling stuck payments: {e}")
+
+async def process_payment_callbacks():
+    """Worker applying stored callback events to payments in batches"""
+    payment_service = PaymentService()
+    while True:
+        try:
+            await asyncio.wait_for(callback_events_pending.wait(), timeout=CALLBACK_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        callback_events_pending.clear()
+        
+        try:
+            async with SessionLocal() as db:
+                # Keep draining while batches come back full
+                while await payment_service.apply_callback_events(db) == CALLBACK_BATCH_SIZE:
+                    pass
+        except Exception as e:
+            logger.error(f"Error applying payment callbacks: {e}")
+
+async def maintain_gateway_log_partitions():
+    """Keep monthly payment_gateway_logs partitions created ahead of time"""
+    while True:
+        await asyncio.sleep(GATEWAY_LOG_MAINTENANCE_INTERVAL)
+        try:
+            await ensure_gateway_log_partitions()
+        except Exception as e:
+            logger.error(f"Error maintaining gateway log partitions: {e}")
@@ -4,6 +4,16 @@ from fastapi import FastAPI
 import uvicorn
 from app.grpc_server import serve as grpc_serve
 from app.database import init_db
+from app.service import (
+    sweep_expired_idempotency_keys,
+    sweep_stuck_payments,
+    process_payment_callbacks,
+    maintain_gateway_log_partitions,
+)
+from app.gateway import stripe_gateway
+from instrumentation import instrument_app, monitor_event_loop_lag
+from instrumentation.blocking import detect_blocking_calls
+from instrumentation.tracing import setup_tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,10 +22,21 @@ logger = logging.getLogger(__name__)
 # FastAPI app for health checks
 app = FastAPI(title="Payment Service", version="1.0.0")
 
+# Prometheus metrics: HTTP middleware and /metrics
+instrument_app(app)
+
+# Distributed tracing: continue the gateway's traces and record Redis/SQL spans
+setup_tracing("payment-service")
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "payment-service"}
 
+@app.get("/stats/gateway")
+async def gateway_stats():
+    """Stripe executor queue depth and circuit breaker state"""
+    return stripe_gateway.stats()
+
 @app.get("/")
 async def root():
     return {"message": "Payment Service is running"}
@@ -37,11 +58,20 @@ async def main():
     await init_db()
     logger.info("Database initialized")
     
-    # Run both servers concurrently
-    await asyncio.gather(
-        grpc_serve(),
-        run_fastapi()
-    )
+    # Run both servers and the background workers concurrently
+    try:
+        await asyncio.gather(
+            grpc_serve(),
+            run_fastapi(),
+            sweep_expired_idempotency_keys(),
+            sweep_stuck_payments(),
+            process_payment_callbacks(),
+            maintain_gateway_log_partitions(),
+            monitor_event_loop_lag(),
+            detect_blocking_calls()
+        )
+    finally:
+        stripe_gateway.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,84 @@
+"""Checks how the recovery sweeper maps the charges it finds to payment outcomes.
+
+Run `PYTHONPATH=.:../../shared python -m pytest tests` from services/payment-service.
+The gateway lookup and the finalizing transaction are replaced, so no
+database or Stripe account is needed.
+"""
+import asyncio
+from types import SimpleNamespace
+
+from app.models import PaymentStatus
+from app.service import PaymentService
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """Returns one stuck payment from the PROCESSING query"""
+
+    async def execute(self, statement):
+        return FakeResult([(1, "PAY123", False)])
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+def make_charge(**fields):
+    charge = {
+        "id": "ch_123",
+        "paid": False,
+        "status": "failed",
+        "failure_code": None,
+        "failure_message": None,
+        "source": SimpleNamespace(last4="4242", brand="Visa"),
+    }
+    charge.update(fields)
+    return SimpleNamespace(**charge)
+
+
+def recover(charge):
+    """Run the sweeper over one stuck payment and return the values it records, if any"""
+    service = PaymentService()
+    finalized = []
+
+    async def find_charge(payment_id):
+        return charge
+
+    async def finalize(db, payment_pk, values, gateway_result=None):
+        finalized.append(values)
+
+    service._find_stripe_charge = find_charge
+    service._finalize_payment = finalize
+    recovered = asyncio.run(service.recover_stuck_payments(FakeSession()))
+    assert recovered == len(finalized) <= 1
+    return finalized[0] if finalized else None
+
+
+def test_paid_charge_completes_payment():
+    values = recover(make_charge(paid=True, status="succeeded"))
+
+    assert values["status"] == PaymentStatus.COMPLETED
+    assert values["gateway_payment_id"] == "ch_123"
+    assert values["card_last_four"] == "4242"
+
+
+def test_unpaid_charge_fails_payment():
+    values = recover(make_charge(failure_code="card_declined", failure_message="Your card was declined."))
+
+    assert values["status"] == PaymentStatus.FAILED
+    assert values["gateway_payment_id"] == "ch_123"
+    assert values["failure_code"] == "card_declined"
+    assert values["failure_reason"] == "Your card was declined."
+
+
+def test_pending_charge_stays_processing():
+    assert recover(make_charge(status="pending")) is None
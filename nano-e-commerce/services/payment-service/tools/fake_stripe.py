@@ -0,0 +1,131 @@
+"""Fake Stripe API for local load tests.
+
+Implements just enough of POST /v1/charges, GET /v1/charges/search and
+POST /v1/refunds for the payment service. Point the service at it with
+STRIPE_API_BASE=http://localhost:12111.
+
+Behaviour is tuned through environment variables:
+    FAKE_STRIPE_LATENCY_MS  - base latency per call (default 300)
+    FAKE_STRIPE_JITTER_MS   - random extra latency (default 200)
+    FAKE_STRIPE_DECLINE_RATE - fraction of charges declined (default 0.02)
+    FAKE_STRIPE_ERROR_RATE  - fraction of calls answered with HTTP 500 (default 0)
+"""
+import asyncio
+import os
+import random
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LATENCY_MS = int(os.getenv("FAKE_STRIPE_LATENCY_MS", "300"))
+JITTER_MS = int(os.getenv("FAKE_STRIPE_JITTER_MS", "200"))
+DECLINE_RATE = float(os.getenv("FAKE_STRIPE_DECLINE_RATE", "0.02"))
+ERROR_RATE = float(os.getenv("FAKE_STRIPE_ERROR_RATE", "0"))
+PORT = int(os.getenv("FAKE_STRIPE_PORT", "12111"))
+
+app = FastAPI(title="Fake Stripe", version="1.0.0")
+
+# Idempotency-Key -> previous response, like the real API
+idempotent_responses = {}
+# Successful charges, for /v1/charges/search
+charges = {}
+
+
+async def _simulate_latency():
+    await asyncio.sleep((LATENCY_MS + random.randint(0, JITTER_MS)) / 1000)
+
+
+async def _form(request: Request) -> dict:
+    """Stripe's SDK sends form-encoded bodies"""
+    body = (await request.body()).decode()
+    return {key: values[0] for key, values in parse_qs(body).items()}
+
+
+def _server_error() -> JSONResponse:
+    return JSONResponse(
+        status_code=500,
+        content={"error": {"type": "api_error", "message": "Simulated gateway failure"}}
+    )
+
+
+@app.post("/v1/charges")
+async def create_charge(request: Request):
+    key = request.headers.get("Idempotency-Key")
+    if key and key in idempotent_responses:
+        return idempotent_responses[key]
+
+    form = await _form(request)
+    await _simulate_latency()
+
+    if random.random() < ERROR_RATE:
+        return _server_error()
+
+    if random.random() < DECLINE_RATE:
+        response = JSONResponse(
+            status_code=402,
+            content={"error": {
+                "type": "card_error",
+                "code": "card_declined",
+                "message": "Your card was declined.",
+            }}
+        )
+    else:
+        charge = {
+            "id": f"ch_{uuid.uuid4().hex[:24]}",
+            "object": "charge",
+            "amount": int(form.get("amount", 0)),
+            "currency": form.get("currency", "usd"),
+            "description": form.get("description"),
+            "metadata": {
+                key[len("metadata["):-1]: value
+                for key, value in form.items() if key.startswith("metadata[")
+            },
+            "paid": True,
+            "status": "succeeded",
+            "created": int(time.time()),
+            "source": {"object": "card", "last4": "4242", "brand": "Visa"},
+        }
+        charges[charge["id"]] = charge
+        response = JSONResponse(content=charge)
+
+    if key:
+        idempotent_responses[key] = response
+    return response
+
+
+@app.get("/v1/charges/search")
+async def search_charges(query: str = ""):
+    """Supports metadata['key']:'value' queries only"""
+    match = re.fullmatch(r"metadata\['(\w+)'\]:'([^']*)'", query.strip())
+    data = []
+    if match:
+        key, value = match.groups()
+        data = [charge for charge in charges.values() if charge["metadata"].get(key) == value]
+    return {"object": "search_result", "data": data, "has_more": False, "url": "/v1/charges/search"}
+
+
+@app.post("/v1/refunds")
+async def create_refund(request: Request):
+    form = await _form(request)
+    await _simulate_latency()
+
+    if random.random() < ERROR_RATE:
+        return _server_error()
+
+    return {
+        "id": f"re_{uuid.uuid4().hex[:24]}",
+        "object": "refund",
+        "amount": int(form.get("amount", 0)),
+        "charge": form.get("charge"),
+        "status": "succeeded",
+        "created": int(time.time()),
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=PORT, log_level="warning")
@@ -1,7 +1,8 @@
 import os
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, text
+from instrumentation.db import InstrumentedAsyncPool, trace_engine
 
 # 数据库配置
 DATABASE_URL = os.getenv(
@@ -17,8 +18,12 @@ engine = create_async_engine(
     max_overflow=20,
     pool_pre_ping=True,
     pool_recycle=3600,
+    poolclass=InstrumentedAsyncPool,
 )
 
+# 开启链路追踪时为每条 SQL 语句记录 span
+trace_engine(engine)
+
 # 创建会话工厂
 SessionLocal = async_sessionmaker(
     autocommit=False,
@@ -41,11 +46,26 @@ async def init_db():
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         
+        await upgrade_products_table()
+        
         print("Product database initialized successfully")
     except Exception as e:
         print(f"Error initializing product database: {e}")
         raise
 
+async def upgrade_products_table():
+    """为已存在的 products 表补上 cover_image 列和店铺列表索引（create_all 不会修改已有表）"""
+    from app.models import Product
+    
+    listing_index = next(i for i in Product.__table__.indexes if i.name == "idx_products_store_listing")
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS cover_image VARCHAR(500)"))
+        await conn.execute(text(
+            "UPDATE products SET cover_image = images->>0 "
+            "WHERE cover_image IS NULL AND images->>0 IS NOT NULL"
+        ))
+        await conn.run_sync(listing_index.create, checkfirst=True)
+
 async def get_db() -> AsyncSession:
     """获取数据库会话"""
     async with SessionLocal() as session:
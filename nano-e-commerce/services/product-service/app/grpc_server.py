@@ -1,6 +1,6 @@
 import grpc
 from app.proto import product_pb2_grpc, product_pb2
-from app.service import ProductService, CategoryService
+from app.service import ProductService, CategoryService, STORE_PRODUCTS_MAX_PAGE_SIZE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -144,6 +144,41 @@ class ProductServicer(product_pb2_grpc.ProductServiceServicer):
             context.set_details(str(e))
             return product_pb2.ListProductsResponse()
     
+    async def ListStoreProducts(self, request, context):
+        """店铺商品列表"""
+        try:
+            page_size = request.page_size if request.page_size > 0 else 20
+            success, message, rows, next_cursor = await self.product_service.list_store_products(
+                store_id=request.store_id,
+                status=request.status if request.status else "active",
+                page_size=min(page_size, STORE_PRODUCTS_MAX_PAGE_SIZE),
+                cursor=request.cursor if request.cursor else None
+            )
+            
+            response = product_pb2.ListStoreProductsResponse()
+            response.success = success
+            response.message = message
+            response.next_cursor = next_cursor
+            
+            for row in rows:
+                response.products.add(
+                    id=row.id,
+                    name=row.name,
+                    price=row.price,
+                    image=row.cover_image or "",
+                    stock=row.stock or 0,
+                    status=row.status,
+                    created_at=row.created_at or 0
+                )
+            
+            return response
+            
+        except Exception as e:
+            logger.error(f"ListStoreProducts error: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return product_pb2.ListStoreProductsResponse()
+    
     async def SearchProducts(self, request, context):
         """搜索商品"""
         try:
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, BigInteger, Boolean, Text, DateTime, ForeignKey, JSON
+import time
+from sqlalchemy import Column, Integer, String, BigInteger, Boolean, Text, DateTime, ForeignKey, JSON, Index, text
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
 from app.database import Base
 
 class Category(Base):
@@ -14,8 +14,8 @@ class Category(Base):
     image = Column(String(255))
     sort_order = Column(Integer, default=0)
     status = Column(String(20), default="active")  # active, inactive
-    created_at = Column(BigInteger, default=lambda: int(func.now().timestamp()))
-    updated_at = Column(BigInteger, default=lambda: int(func.now().timestamp()), onupdate=lambda: int(func.now().timestamp()))
+    created_at = Column(BigInteger, default=lambda: int(time.time()))
+    updated_at = Column(BigInteger, default=lambda: int(time.time()), onupdate=lambda: int(time.time()))
 
     # 自关联关系
     parent = relationship("Category", remote_side=[id], backref="children")
@@ -43,20 +43,27 @@ class Product(Base):
     name = Column(String(200), nullable=False, index=True)
     description = Column(Text)
     images = Column(JSON)  # 存储图片URL列表
+    cover_image = Column(String(500))  # images[0]，供店铺商品列表的覆盖索引使用
     price = Column(BigInteger, nullable=False)  # 价格，单位：分
     category_id = Column(BigInteger, ForeignKey("categories.id"), nullable=False)
     store_id = Column(BigInteger, nullable=False, index=True)
     stock = Column(Integer, default=0)
     status = Column(String(20), default="active")  # active, inactive, deleted
     attributes = Column(JSON)  # 商品属性，如颜色、尺寸等
-    created_at = Column(BigInteger, default=lambda: int(func.now().timestamp()))
-    updated_at = Column(BigInteger, default=lambda: int(func.now().timestamp()), onupdate=lambda: int(func.now().timestamp()))
+    created_at = Column(BigInteger, default=lambda: int(time.time()))
+    updated_at = Column(BigInteger, default=lambda: int(time.time()), onupdate=lambda: int(time.time()))
 
     # 关联分类
     category = relationship("Category", back_populates="products")
     # 关联库存预留
     stock_reservations = relationship("StockReservation", back_populates="product", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # 店铺商品列表：等值过滤 + 按创建时间倒序，列表字段放在 INCLUDE 中以支持仅索引扫描
+        Index('idx_products_store_listing', 'store_id', 'status', text('created_at DESC'), 'id',
+              postgresql_include=['name', 'price', 'cover_image', 'stock']),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -84,8 +91,8 @@ class StockReservation(Base):
     order_id = Column(String(100), nullable=False, index=True)
     status = Column(String(20), default="reserved")  # reserved, confirmed, released
     expires_at = Column(BigInteger, nullable=False)  # 过期时间戳
-    created_at = Column(BigInteger, default=lambda: int(func.now().timestamp()))
-    updated_at = Column(BigInteger, default=lambda: int(func.now().timestamp()), onupdate=lambda: int(func.now().timestamp()))
+    created_at = Column(BigInteger, default=lambda: int(time.time()))
+    updated_at = Column(BigInteger, default=lambda: int(time.time()), onupdate=lambda: int(time.time()))
 
     # 关联商品
     product = relationship("Product", back_populates="stock_reservations")
@@ -1,3 +1,4 @@
+import base64
 import uuid
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
@@ -7,6 +8,24 @@ from sqlalchemy.orm import selectinload
 from app.models import Product, Category, StockReservation
 from app.database import SessionLocal
 
+# 店铺商品列表每页上限
+STORE_PRODUCTS_MAX_PAGE_SIZE = 100
+
+
+def encode_listing_cursor(created_at: int, product_id: int) -> str:
+    """店铺商品列表游标：上一页最后一条的 (created_at, id)"""
+    return base64.urlsafe_b64encode(f"{created_at}:{product_id}".encode()).decode()
+
+
+def decode_listing_cursor(cursor: str) -> tuple[int, int]:
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        created_at, product_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(created_at), int(product_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
 class ProductService:
     """商品服务业务逻辑"""
     
@@ -28,6 +47,7 @@ class ProductService:
                     name=name,
                     description=description,
                     images=images,
+                    cover_image=images[0] if images else None,
                     price=price,
                     category_id=category_id,
                     store_id=store_id,
@@ -90,7 +110,9 @@ class ProductService:
                 # 更新字段
                 if name: product.name = name
                 if description: product.description = description
-                if images is not None: product.images = images
+                if images is not None:
+                    product.images = images
+                    product.cover_image = images[0] if images else None
                 if price: product.price = price
                 if category_id: product.category_id = category_id
                 if stock is not None: product.stock = stock
@@ -175,6 +197,42 @@ class ProductService:
             except Exception as e:
                 return False, f"获取失败: {str(e)}", [], 0
     
+    async def list_store_products(self, store_id: int, status: str = "active", page_size: int = 20,
+                                  cursor: str = None) -> tuple[bool, str, list, str]:
+        """店铺商品列表：键集分页，只读取覆盖索引中的列，返回 (成功, 消息, 商品行, 下一页游标)"""
+        async with SessionLocal() as session:
+            try:
+                conditions = [Product.store_id == store_id, Product.status == status]
+                if cursor:
+                    created_at, product_id = decode_listing_cursor(cursor)
+                    # 与索引顺序一致：created_at 倒序，时间相同时按 id 正序
+                    conditions.append(Product.created_at <= created_at)
+                    conditions.append(or_(Product.created_at < created_at, Product.id > product_id))
+                
+                # 多取一条判断是否还有下一页
+                query = (
+                    select(
+                        Product.id, Product.name, Product.price, Product.cover_image,
+                        Product.stock, Product.status, Product.created_at
+                    )
+                    .where(and_(*conditions))
+                    .order_by(desc(Product.created_at), asc(Product.id))
+                    .limit(page_size + 1)
+                )
+                rows = (await session.execute(query)).all()
+                
+                next_cursor = ""
+                if len(rows) > page_size:
+                    rows = rows[:page_size]
+                    next_cursor = encode_listing_cursor(rows[-1].created_at, rows[-1].id)
+                
+                return True, "获取成功", rows, next_cursor
+                
+            except ValueError:
+                return False, "无效的分页游标", [], ""
+            except Exception as e:
+                return False, f"获取失败: {str(e)}", [], ""
+    
     async def search_products(self, keyword: str, page: int = 1, page_size: int = 20,
                             category_id: int = None, min_price: int = None, max_price: int = None,
                             sort_by: str = "created_at", sort_order: str = "desc") -> tuple[bool, str, List[Product], int]:
@@ -7,6 +7,9 @@ import uvloop
 import os
 import logging
 
+from instrumentation import MetricsInterceptor, GRPC_SERVER_OPTIONS, instrument_app, monitor_event_loop_lag
+from instrumentation.blocking import detect_blocking_calls
+from instrumentation.tracing import server_interceptors, setup_tracing
 from app.grpc_server import ProductServicer
 from app.database import init_db
 from app.proto import product_pb2_grpc
@@ -36,6 +39,12 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Prometheus 指标：HTTP 中间件和 /metrics
+instrument_app(app)
+
+# 链路追踪：延续网关传来的 trace，并记录 Redis/SQL span
+setup_tracing("product-service")
+
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
@@ -48,7 +57,11 @@ async def root():
 
 async def serve_grpc():
     """启动gRPC服务器"""
-    server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.aio.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        interceptors=[*server_interceptors(), MetricsInterceptor()],
+        options=GRPC_SERVER_OPTIONS
+    )
     product_pb2_grpc.add_ProductServiceServicer_to_server(ProductServicer(), server)
     
     listen_addr = '0.0.0.0:50052'
@@ -80,10 +93,12 @@ async def main():
     # 使用uvloop提升性能
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     
-    # 并发启动gRPC和HTTP服务器
+    # 并发启动gRPC和HTTP服务器，以及事件循环延迟监测和阻塞调用检测任务
     await asyncio.gather(
         serve_grpc(),
-        serve_http()
+        serve_http(),
+        monitor_event_loop_lag(),
+        detect_blocking_calls()
     )
 
 if __name__ == "__main__":
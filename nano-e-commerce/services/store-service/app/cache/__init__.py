@@ -0,0 +1,193 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from app.database import get_redis
+from app.proto import store_pb2
+
+logger = logging.getLogger(__name__)
+
+# Shared Redis tier
+STORE_CACHE_TTL = int(os.getenv("STORE_CACHE_TTL", "600"))  # seconds
+# Per-process LRU in front of Redis; other replicas are invalidated over pub/sub
+STORE_LOCAL_CACHE_TTL = float(os.getenv("STORE_LOCAL_CACHE_TTL", "30"))  # seconds
+STORE_LOCAL_CACHE_SIZE = int(os.getenv("STORE_LOCAL_CACHE_SIZE", "10000"))
+# Version keys only need to outlive one database load
+STORE_CACHE_VERSION_TTL = 86400
+
+STORE_KEY = "store:{}"
+STORE_VERSION_KEY = "store:{}:version"
+STORE_INVALIDATION_CHANNEL = "store_invalidations"
+
+# Only write the entry back if no invalidation happened since the version was read
+# KEYS[1] entry, KEYS[2] version; ARGV: serialized store, version read before the load, TTL
+SET_IF_VERSION_UNCHANGED_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[2] then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class StoreCache:
+    """Two-tier cache of Store protos: in-process LRU backed by Redis"""
+
+    def __init__(self, ttl: int = STORE_CACHE_TTL, local_ttl: float = STORE_LOCAL_CACHE_TTL,
+                 local_size: int = STORE_LOCAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self._local = OrderedDict()  # store_id -> (expires_at, store_pb2.Store)
+        self._set_script = None
+
+        # Metrics
+        self.local_hits_total = 0
+        self.redis_hits_total = 0
+        self.misses_total = 0
+        self.errors_total = 0
+
+    def _get_local(self, store_id: int) -> Optional[store_pb2.Store]:
+        entry = self._local.get(store_id)
+        if entry is None:
+            return None
+        expires_at, store = entry
+        if expires_at < time.monotonic():
+            del self._local[store_id]
+            return None
+        self._local.move_to_end(store_id)
+        return store
+
+    def _put_local(self, store_id: int, store: store_pb2.Store):
+        if self.local_size <= 0:
+            return
+        self._local[store_id] = (time.monotonic() + self.local_ttl, store)
+        self._local.move_to_end(store_id)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    def evict_local(self, store_id: int):
+        self._local.pop(store_id, None)
+
+    def clear_local(self):
+        self._local.clear()
+
+    async def get_many(self, store_ids: Iterable[int]) -> dict:
+        """Return {store_id: Store} for the ids found in either tier"""
+        found = {}
+        remote_ids = []
+        for store_id in store_ids:
+            store = self._get_local(store_id)
+            if store is not None:
+                self.local_hits_total += 1
+                found[store_id] = store
+            else:
+                remote_ids.append(store_id)
+
+        if not remote_ids:
+            return found
+
+        try:
+            redis = await get_redis()
+            values = await redis.mget([STORE_KEY.format(store_id) for store_id in remote_ids])
+        except Exception as e:
+            self.errors_total += 1
+            logger.warning(f"Store cache read failed: {e}")
+            values = [None] * len(remote_ids)
+
+        for store_id, data in zip(remote_ids, values):
+            if data is None:
+                self.misses_total += 1
+                continue
+            self.redis_hits_total += 1
+            store = store_pb2.Store.FromString(data)
+            self._put_local(store_id, store)
+            found[store_id] = store
+        return found
+
+    async def versions(self, store_ids: list) -> Optional[dict]:
+        """Read invalidation versions before loading from the database; None if Redis is down"""
+        try:
+            redis = await get_redis()
+            values = await redis.mget([STORE_VERSION_KEY.format(store_id) for store_id in store_ids])
+        except Exception as e:
+            self.errors_total += 1
+            logger.warning(f"Store cache version read failed: {e}")
+            return None
+        return {store_id: value or b"0" for store_id, value in zip(store_ids, values)}
+
+    async def put_many(self, stores: dict, versions: Optional[dict]):
+        """Cache freshly loaded stores unless they were invalidated during the load"""
+        if versions is None:
+            return
+        try:
+            redis = await get_redis()
+            if self._set_script is None:
+                self._set_script = redis.register_script(SET_IF_VERSION_UNCHANGED_SCRIPT)
+            pipe = redis.pipeline(transaction=False)
+            for store_id, store in stores.items():
+                await self._set_script(
+                    keys=[STORE_KEY.format(store_id), STORE_VERSION_KEY.format(store_id)],
+                    args=[store.SerializeToString(), versions[store_id], self.ttl],
+                    client=pipe
+                )
+            written = await pipe.execute()
+        except Exception as e:
+            self.errors_total += 1
+            logger.warning(f"Store cache write failed: {e}")
+            return
+
+        for (store_id, store), ok in zip(stores.items(), written):
+            if ok:
+                self._put_local(store_id, store)
+
+    async def invalidate(self, store_id: int):
+        """Drop a store from every tier and tell other replicas to evict it"""
+        self.evict_local(store_id)
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline()
+            pipe.incr(STORE_VERSION_KEY.format(store_id))
+            pipe.expire(STORE_VERSION_KEY.format(store_id), STORE_CACHE_VERSION_TTL)
+            pipe.delete(STORE_KEY.format(store_id))
+            pipe.publish(STORE_INVALIDATION_CHANNEL, store_id)
+            await pipe.execute()
+        except Exception as e:
+            self.errors_total += 1
+            logger.warning(f"Store cache invalidation failed for store {store_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "local_ttl_seconds": self.local_ttl,
+            "local_size": len(self._local),
+            "local_max_size": self.local_size,
+            "local_hits_total": self.local_hits_total,
+            "redis_hits_total": self.redis_hits_total,
+            "misses_total": self.misses_total,
+            "errors_total": self.errors_total,
+        }
+
+
+# Global cache instance
+store_cache = StoreCache()
+
+
+async def listen_store_invalidations():
+    """Evict stores from the local LRU when another replica updates them"""
+    while True:
+        try:
+            redis = await get_redis()
+            pubsub = redis.pubsub()
+            await pubsub.subscribe(STORE_INVALIDATION_CHANNEL)
+            # Messages may have been missed while disconnected
+            store_cache.clear_local()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    store_cache.evict_local(int(message["data"]))
+        except Exception as e:
+            logger.error(f"Store invalidation listener error: {e}")
+            await asyncio.sleep(1)
@@ -1,5 +1,7 @@
 import grpc
 from concurrent import futures
+from instrumentation import MetricsInterceptor, GRPC_SERVER_OPTIONS
+from instrumentation.tracing import server_interceptors
 import logging
 from app.proto import store_pb2_grpc, store_pb2
 from app.service import StoreService
@@ -21,32 +23,42 @@ class StoreServicer(store_pb2_grpc.StoreServiceServicer):
         async for db in get_db():
             return await self.store_service.get_store(db, request)
     
+    async def GetStoresByIds(self, request: store_pb2.GetStoresByIdsRequest, context) -> store_pb2.GetStoresByIdsResponse:
+        """Get many stores by ID"""
+        async for db in get_db():
+            return await self.store_service.get_stores_by_ids(db, request)
+    
     async def GetUserStores(self, request: store_pb2.GetUserStoresRequest, context) -> store_pb2.GetUserStoresResponse:
         """Get stores owned by user"""
-        # TODO: Implement user stores logic
-        return store_pb2.GetUserStoresResponse(
-            success=False,
-            message="Not implemented yet"
-        )
+        async for db in get_db():
+            return await self.store_service.get_user_stores(db, request)
     
     async def UpdateStore(self, request: store_pb2.UpdateStoreRequest, context) -> store_pb2.UpdateStoreResponse:
         """Update store"""
-        # TODO: Implement update store logic
-        return store_pb2.UpdateStoreResponse(
-            success=False,
-            message="Not implemented yet"
-        )
-    
-    async def DeleteStore(self, request: store_pb2.DeleteStoreRequest, context) -> store_pb2.DeleteStoreResponse:
-        """Delete store"""
-        # TODO: Implement delete store logic
-        return store_pb2.DeleteStoreResponse(
-            success=False,
-            message="Not implemented yet"
-        )
+        async for db in get_db():
+            return await self.store_service.update_store(db, request)
+    
+    async def UpdateStoreStatus(self, request: store_pb2.UpdateStoreStatusRequest, context) -> store_pb2.UpdateStoreStatusResponse:
+        """Update store status"""
+        async for db in get_db():
+            return await self.store_service.update_store_status(db, request)
+    
+    async def GetStoreStats(self, request: store_pb2.GetStoreStatsRequest, context) -> store_pb2.GetStoreStatsResponse:
+        """Get store statistics"""
+        async for db in get_db():
+            return await self.store_service.get_store_stats(db, request)
+    
+    async def GetStoreProducts(self, request: store_pb2.GetStoreProductsRequest, context) -> store_pb2.GetStoreProductsResponse:
+        """Get store products"""
+        async for db in get_db():
+            return await self.store_service.get_store_products(db, request)
 
 async def serve():
-    server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.aio.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        interceptors=[*server_interceptors(), MetricsInterceptor()],
+        options=GRPC_SERVER_OPTIONS
+    )
     store_pb2_grpc.add_StoreServiceServicer_to_server(StoreServicer(), server)
     
     listen_addr = '[::]:50056'
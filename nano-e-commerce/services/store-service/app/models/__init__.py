@@ -1,8 +1,8 @@
 from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, func, Boolean
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 
-Base = declarative_base()
+from app.database import Base
 
 class Store(Base):
     __tablename__ = "stores"
@@ -15,6 +15,9 @@ class Store(Base):
     phone = Column(String(20))
     website = Column(String(500))
     logo_url = Column(String(500))
+    banner_url = Column(String(500))
+    business_hours = Column(String(100))
+    settings = Column(JSONB, nullable=False, default=dict, server_default="{}")
     
     # Address information
     address = Column(Text)
@@ -27,7 +30,8 @@ class Store(Base):
     tax_id = Column(String(50))
     business_license = Column(String(100))
     
-    # Status
+    # Status: StoreStatus enum name (PENDING/ACTIVE/SUSPENDED/CLOSED); is_active mirrors ACTIVE
+    status = Column(String(20), nullable=False, default="ACTIVE", server_default="ACTIVE")
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
     
@@ -1,12 +1,46 @@
 from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, text
 from app.models import Store
-from app.proto import store_pb2, store_pb2_grpc
+from app.proto import store_pb2, store_pb2_grpc, product_pb2
+from app.clients import grpc_clients
+from app.cache import store_cache
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on ids per GetStoresByIds call
+STORE_BATCH_MAX = int(os.getenv("STORE_BATCH_MAX", "200"))
+
+# Top sellers window and size for GetStoreStats
+STORE_STATS_TOP_PRODUCTS = int(os.getenv("STORE_STATS_TOP_PRODUCTS", "10"))
+STORE_STATS_TOP_PRODUCTS_DAYS = int(os.getenv("STORE_STATS_TOP_PRODUCTS_DAYS", "30"))
+
+# Order numbers come from the rollup tables order-service maintains; only the
+# product counts are read live, from the products(store_id) index
+STORE_STATS_SQL = text("""
+SELECT t.order_count, t.pending_orders, t.paid_orders, t.revenue, t.customer_count,
+       extract(epoch FROM t.updated_at)::bigint AS updated_at,
+       (SELECT coalesce(sum(d.revenue), 0)::bigint FROM store_daily_stats d
+         WHERE d.store_id = :store_id
+           AND d.day >= date_trunc('month', timezone('UTC', now()))::date) AS monthly_revenue,
+       (SELECT count(*) FROM products p WHERE p.store_id = :store_id) AS total_products,
+       (SELECT count(*) FROM products p WHERE p.store_id = :store_id AND p.status = 'active') AS active_products
+FROM (SELECT 1) AS one
+LEFT JOIN store_order_stats t ON t.store_id = :store_id
+""")
+
+TOP_PRODUCTS_SQL = text("""
+SELECT product_id, max(product_name) AS product_name, sum(quantity)::bigint AS quantity, sum(revenue)::bigint AS revenue
+FROM store_product_daily_sales
+WHERE store_id = :store_id AND day >= timezone('UTC', now())::date - CAST(:days AS integer)
+GROUP BY product_id
+HAVING sum(quantity) > 0
+ORDER BY sum(quantity) DESC, product_id
+LIMIT :limit
+""")
+
 class StoreService:
     def __init__(self):
         pass
@@ -18,23 +52,33 @@ class StoreService:
             name=store.name,
             description=store.description or "",
             owner_id=store.owner_id,
-            email=store.email,
+            logo=store.logo_url or "",
+            banner=store.banner_url or "",
+            status=store_pb2.StoreStatus.Value(store.status),
             phone=store.phone or "",
-            website=store.website or "",
-            logo_url=store.logo_url or "",
+            email=store.email,
             address=store.address or "",
-            city=store.city or "",
-            state=store.state or "",
-            country=store.country or "",
-            postal_code=store.postal_code or "",
-            tax_id=store.tax_id or "",
             business_license=store.business_license or "",
-            is_active=store.is_active,
-            is_verified=store.is_verified,
+            business_hours=store.business_hours or "",
+            settings=store.settings or {},
             created_at=int(store.created_at.timestamp()) if store.created_at else 0,
             updated_at=int(store.updated_at.timestamp()) if store.updated_at else 0
         )
     
+    async def _get_stores(self, db: AsyncSession, store_ids: List[int]) -> dict:
+        """Read-through lookup: local LRU, then Redis, then one query for the rest"""
+        stores = await store_cache.get_many(store_ids)
+        missing = [store_id for store_id in store_ids if store_id not in stores]
+        if missing:
+            versions = await store_cache.versions(missing)
+            result = await db.execute(
+                select(Store).where(Store.id.in_(missing))
+            )
+            loaded = {store.id: self._convert_store_to_proto(store) for store in result.scalars()}
+            await store_cache.put_many(loaded, versions)
+            stores.update(loaded)
+        return stores
+    
     async def create_store(self, db: AsyncSession, request: store_pb2.CreateStoreRequest) -> store_pb2.CreateStoreResponse:
         """Create a new store"""
         try:
@@ -44,13 +88,7 @@ class StoreService:
                 owner_id=request.owner_id,
                 email=request.email,
                 phone=request.phone,
-                website=request.website,
                 address=request.address,
-                city=request.city,
-                state=request.state,
-                country=request.country,
-                postal_code=request.postal_code,
-                tax_id=request.tax_id,
                 business_license=request.business_license
             )
             
@@ -75,10 +113,8 @@ class StoreService:
     async def get_store(self, db: AsyncSession, request: store_pb2.GetStoreRequest) -> store_pb2.GetStoreResponse:
         """Get store by ID"""
         try:
-            result = await db.execute(
-                select(Store).where(Store.id == request.store_id)
-            )
-            store = result.scalar_one_or_none()
+            stores = await self._get_stores(db, [request.store_id])
+            store = stores.get(request.store_id)
             
             if not store:
                 return store_pb2.GetStoreResponse(
@@ -88,7 +124,7 @@ class StoreService:
             
             return store_pb2.GetStoreResponse(
                 success=True,
-                store=self._convert_store_to_proto(store)
+                store=store
             )
             
         except Exception as e:
@@ -97,3 +133,246 @@ class StoreService:
                 success=False,
                 message="Failed to get store"
             )
+    
+    async def get_stores_by_ids(self, db: AsyncSession, request: store_pb2.GetStoresByIdsRequest) -> store_pb2.GetStoresByIdsResponse:
+        """Get many stores in one call, in request order"""
+        try:
+            store_ids = list(dict.fromkeys(request.store_ids))
+            if len(store_ids) > STORE_BATCH_MAX:
+                return store_pb2.GetStoresByIdsResponse(
+                    success=False,
+                    message=f"At most {STORE_BATCH_MAX} store ids per request"
+                )
+            
+            stores = await self._get_stores(db, store_ids) if store_ids else {}
+            
+            return store_pb2.GetStoresByIdsResponse(
+                success=True,
+                stores=[stores[store_id] for store_id in store_ids if store_id in stores]
+            )
+            
+        except Exception as e:
+            logger.error(f"Error getting stores by ids: {e}")
+            return store_pb2.GetStoresByIdsResponse(
+                success=False,
+                message="Failed to get stores"
+            )
+    
+    async def get_store_stats(self, db: AsyncSession, request: store_pb2.GetStoreStatsRequest) -> store_pb2.GetStoreStatsResponse:
+        """Get dashboard numbers for a store (owner only) from the order rollups"""
+        try:
+            stores = await self._get_stores(db, [request.store_id])
+            store = stores.get(request.store_id)
+            
+            if not store:
+                return store_pb2.GetStoreStatsResponse(
+                    success=False,
+                    message="Store not found"
+                )
+            
+            if store.owner_id != request.owner_id:
+                return store_pb2.GetStoreStatsResponse(
+                    success=False,
+                    message="Permission denied"
+                )
+            
+            params = {"store_id": request.store_id}
+            row = (await db.execute(STORE_STATS_SQL, params)).mappings().one()
+            top_products = (await db.execute(TOP_PRODUCTS_SQL, {
+                **params,
+                "days": STORE_STATS_TOP_PRODUCTS_DAYS,
+                "limit": STORE_STATS_TOP_PRODUCTS,
+            })).mappings().all()
+            
+            stats = store_pb2.StoreStats(
+                store_id=request.store_id,
+                total_products=row["total_products"],
+                active_products=row["active_products"],
+                total_orders=row["order_count"] or 0,
+                # Orders the merchant still has to act on: unpaid or awaiting shipment
+                pending_orders=(row["pending_orders"] or 0) + (row["paid_orders"] or 0),
+                total_revenue=row["revenue"] or 0,
+                monthly_revenue=row["monthly_revenue"],
+                total_customers=row["customer_count"] or 0,
+                updated_at=row["updated_at"] or 0,
+                top_products=[
+                    store_pb2.ProductSales(
+                        product_id=product["product_id"],
+                        product_name=product["product_name"],
+                        quantity=product["quantity"],
+                        revenue=product["revenue"]
+                    )
+                    for product in top_products
+                ]
+            )
+            
+            return store_pb2.GetStoreStatsResponse(
+                success=True,
+                stats=stats
+            )
+            
+        except Exception as e:
+            logger.error(f"Error getting store stats: {e}")
+            return store_pb2.GetStoreStatsResponse(
+                success=False,
+                message="Failed to get store stats"
+            )
+    
+    async def get_store_products(self, db: AsyncSession, request: store_pb2.GetStoreProductsRequest) -> store_pb2.GetStoreProductsResponse:
+        """Get a page of a store's products from product-service, newest first"""
+        try:
+            stores = await self._get_stores(db, [request.store_id])
+            if request.store_id not in stores:
+                return store_pb2.GetStoreProductsResponse(
+                    success=False,
+                    message="Store not found"
+                )
+            
+            response = await grpc_clients.product_stub.ListStoreProducts(
+                product_pb2.ListStoreProductsRequest(
+                    store_id=request.store_id,
+                    status=request.status,
+                    page_size=request.page_size,
+                    cursor=request.cursor
+                )
+            )
+            
+            if not response.success:
+                return store_pb2.GetStoreProductsResponse(
+                    success=False,
+                    message=response.message
+                )
+            
+            return store_pb2.GetStoreProductsResponse(
+                success=True,
+                products=[
+                    store_pb2.StoreProduct(
+                        id=product.id,
+                        name=product.name,
+                        price=product.price,
+                        stock=product.stock,
+                        status=product.status,
+                        image=product.image,
+                        created_at=product.created_at
+                    )
+                    for product in response.products
+                ],
+                page_size=len(response.products),
+                next_cursor=response.next_cursor
+            )
+            
+        except Exception as e:
+            logger.error(f"Error getting store products: {e}")
+            return store_pb2.GetStoreProductsResponse(
+                success=False,
+                message="Failed to get store products"
+            )
+    
+    async def get_user_stores(self, db: AsyncSession, request: store_pb2.GetUserStoresRequest) -> store_pb2.GetUserStoresResponse:
+        """Get stores owned by a user"""
+        try:
+            query = select(Store).where(Store.owner_id == request.user_id)
+            # PENDING is the proto default, so it doubles as "no filter"
+            if request.status != store_pb2.PENDING:
+                query = query.where(Store.status == store_pb2.StoreStatus.Name(request.status))
+            
+            result = await db.execute(query.order_by(Store.created_at.desc()))
+            
+            return store_pb2.GetUserStoresResponse(
+                success=True,
+                stores=[self._convert_store_to_proto(store) for store in result.scalars()]
+            )
+            
+        except Exception as e:
+            logger.error(f"Error getting user stores: {e}")
+            return store_pb2.GetUserStoresResponse(
+                success=False,
+                message="Failed to get user stores"
+            )
+    
+    async def update_store(self, db: AsyncSession, request: store_pb2.UpdateStoreRequest) -> store_pb2.UpdateStoreResponse:
+        """Update store details (owner only)"""
+        try:
+            result = await db.execute(
+                select(Store).where(Store.id == request.store_id)
+            )
+            store = result.scalar_one_or_none()
+            
+            if not store:
+                return store_pb2.UpdateStoreResponse(
+                    success=False,
+                    message="Store not found"
+                )
+            
+            if store.owner_id != request.owner_id:
+                return store_pb2.UpdateStoreResponse(
+                    success=False,
+                    message="Permission denied"
+                )
+            
+            if request.name: store.name = request.name
+            if request.description: store.description = request.description
+            if request.logo: store.logo_url = request.logo
+            if request.banner: store.banner_url = request.banner
+            if request.phone: store.phone = request.phone
+            if request.email: store.email = request.email
+            if request.address: store.address = request.address
+            if request.business_hours: store.business_hours = request.business_hours
+            if request.settings:
+                store.settings = {**(store.settings or {}), **dict(request.settings)}
+            
+            await db.commit()
+            await db.refresh(store)
+            await store_cache.invalidate(store.id)
+            
+            return store_pb2.UpdateStoreResponse(
+                success=True,
+                store=self._convert_store_to_proto(store),
+                message="Store updated successfully"
+            )
+            
+        except Exception as e:
+            logger.error(f"Error updating store: {e}")
+            await db.rollback()
+            return store_pb2.UpdateStoreResponse(
+                success=False,
+                message="Failed to update store"
+            )
+    
+    async def update_store_status(self, db: AsyncSession, request: store_pb2.UpdateStoreStatusRequest) -> store_pb2.UpdateStoreStatusResponse:
+        """Change store status (review, suspend, close)"""
+        try:
+            result = await db.execute(
+                select(Store).where(Store.id == request.store_id)
+            )
+            store = result.scalar_one_or_none()
+            
+            if not store:
+                return store_pb2.UpdateStoreStatusResponse(
+                    success=False,
+                    message="Store not found"
+                )
+            
+            status = store_pb2.StoreStatus.Name(request.status)
+            logger.info(
+                f"Store {store.id} status {store.status} -> {status} "
+                f"by operator {request.operator_id}: {request.reason}"
+            )
+            store.status = status
+            store.is_active = request.status == store_pb2.ACTIVE
+            
+            await db.commit()
+            await store_cache.invalidate(store.id)
+            
+            return store_pb2.UpdateStoreStatusResponse(
+                success=True,
+                message="Store status updated successfully"
+            )
+            
+        except Exception as e:
+            logger.error(f"Error updating store status: {e}")
+            await db.rollback()
+            return store_pb2.UpdateStoreStatusResponse(
+                success=False,
+                message="Failed to update store status"
+            )
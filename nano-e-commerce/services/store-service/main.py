@@ -4,6 +4,10 @@ from fastapi import FastAPI
 import uvicorn
 from app.grpc_server import serve as grpc_serve
 from app.database import init_db
+from app.cache import store_cache, listen_store_invalidations
+from instrumentation import instrument_app, monitor_event_loop_lag
+from instrumentation.blocking import detect_blocking_calls
+from instrumentation.tracing import setup_tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,10 +16,21 @@ logger = logging.getLogger(__name__)
 # FastAPI app for health checks
 app = FastAPI(title="Store Service", version="1.0.0")
 
+# Prometheus metrics: HTTP middleware and /metrics
+instrument_app(app)
+
+# Distributed tracing: continue the gateway's traces and record Redis/SQL spans
+setup_tracing("store-service")
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "store-service"}
 
+@app.get("/stats/store-cache")
+async def store_cache_stats():
+    """Store cache hit rates per tier"""
+    return store_cache.stats()
+
 @app.get("/")
 async def root():
     return {"message": "Store Service is running"}
@@ -37,10 +52,13 @@ async def main():
     await init_db()
     logger.info("Database initialized")
     
-    # Run both servers concurrently
+    # Run both servers, the cache invalidation listener and the event loop monitors concurrently
     await asyncio.gather(
         grpc_serve(),
-        run_fastapi()
+        run_fastapi(),
+        listen_store_invalidations(),
+        monitor_event_loop_lag(),
+        detect_blocking_calls()
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+"""Runs the GetStoreStats queries against PostgreSQL.
+
+Needs a scratch database: set TEST_DATABASE_URL (an asyncpg URL) and run
+`PYTHONPATH=.:../../shared python -m pytest tests` from services/store-service.
+The rollup tables are created as temporary tables, so nothing is left behind.
+"""
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.service import STORE_STATS_SQL, TOP_PRODUCTS_SQL
+from app.proto import store_pb2
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+SCHEMA = [
+    "CREATE TEMP TABLE store_order_stats (store_id bigint PRIMARY KEY, order_count bigint, pending_orders bigint,"
+    " paid_orders bigint, revenue bigint, customer_count bigint, updated_at timestamptz)",
+    "CREATE TEMP TABLE store_daily_stats (store_id bigint, day date, revenue bigint, PRIMARY KEY (store_id, day))",
+    "CREATE TEMP TABLE store_product_daily_sales (store_id bigint, day date, product_id bigint,"
+    " product_name varchar(255), quantity bigint, revenue bigint, PRIMARY KEY (store_id, day, product_id))",
+    "CREATE TEMP TABLE products (id bigint PRIMARY KEY, store_id bigint, status varchar(20))",
+]
+
+FIXTURES = [
+    "INSERT INTO store_order_stats VALUES (1, 5, 1, 2, 4200, 3, now())",
+    "INSERT INTO store_daily_stats VALUES (1, timezone('UTC', now())::date, 1200)",
+    # Product 11 outsold product 10, but only before the top-products window
+    "INSERT INTO store_product_daily_sales VALUES"
+    " (1, timezone('UTC', now())::date, 10, 'Mug', 3, 900),"
+    " (1, timezone('UTC', now())::date - 1, 10, 'Mug', 1, 300),"
+    " (1, timezone('UTC', now())::date - 5, 12, 'Pen', 2, 100),"
+    " (1, timezone('UTC', now())::date - 60, 11, 'Hat', 50, 5000),"
+    " (2, timezone('UTC', now())::date, 13, 'Other store', 9, 900)",
+    "INSERT INTO products VALUES (10, 1, 'active'), (11, 1, 'inactive'), (12, 1, 'active')",
+]
+
+async def run_queries():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    try:
+        async with engine.connect() as conn:
+            for statement in SCHEMA + FIXTURES:
+                await conn.execute(text(statement))
+            row = (await conn.execute(STORE_STATS_SQL, {"store_id": 1})).mappings().one()
+            top_products = (await conn.execute(TOP_PRODUCTS_SQL, {"store_id": 1, "days": 30, "limit": 10})).mappings().all()
+            await conn.rollback()
+        return row, top_products
+    finally:
+        await engine.dispose()
+
+def test_store_stats_queries():
+    row, top_products = asyncio.run(run_queries())
+
+    assert row["order_count"] == 5
+    assert row["monthly_revenue"] == 1200
+    assert (row["total_products"], row["active_products"]) == (3, 2)
+    assert [(p["product_id"], p["quantity"], p["revenue"]) for p in top_products] == [(10, 4, 1200), (12, 2, 100)]
+
+    # The sums must fit the int64 proto fields as they come back from the driver
+    store_pb2.StoreStats(monthly_revenue=row["monthly_revenue"], top_products=[
+        store_pb2.ProductSales(product_id=p["product_id"], product_name=p["product_name"],
+                               quantity=p["quantity"], revenue=p["revenue"])
+        for p in top_products
+    ])
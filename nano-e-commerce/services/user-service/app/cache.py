@@ -0,0 +1,129 @@
+import asyncio
+import os
+import logging
+from typing import Awaitable, Callable
+
+from app.database import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 用户资料/地址列表缓存有效期（秒），0 表示关闭缓存
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "300"))
+# 版本号键的有效期，只需覆盖一次回源查询的时间
+PROFILE_CACHE_VERSION_TTL = 86400
+
+USER_PROFILE_KEY = "user_profile:{}"
+USER_ADDRESSES_KEY = "user_addresses:{}"
+
+# 仅当回源期间没有发生失效（版本号未变）时才写入缓存，避免把旧数据写回
+# KEYS[1] 缓存键，KEYS[2] 版本号键；ARGV: 序列化数据、回源前读到的版本号、TTL
+SET_IF_VERSION_UNCHANGED_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[2] then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class ProtoCache:
+    """序列化 proto 的读穿透缓存（Redis），同一进程内相同键的并发未命中合并为一次回源"""
+
+    def __init__(self, ttl: int = PROFILE_CACHE_TTL):
+        self.ttl = ttl
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._set_script = None
+
+        # 指标
+        self.hits_total = 0
+        self.misses_total = 0
+        self.coalesced_total = 0
+        self.errors_total = 0
+
+    async def get_or_load(self, key: str, message_cls, loader: Callable[[], Awaitable[tuple]]):
+        """读取缓存；未命中时调用 loader 回源，loader 返回 (proto 消息, 是否可缓存)"""
+        if self.ttl <= 0:
+            message, _ = await loader()
+            return message
+
+        try:
+            redis = await get_redis()
+            data = await redis.get(key)
+            if data is not None:
+                self.hits_total += 1
+                return message_cls.FromString(data)
+        except Exception as e:
+            self.errors_total += 1
+            logger.warning(f"Profile cache read failed for {key}: {e}")
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses_total += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self.coalesced_total += 1
+        # 某个调用方被取消时不影响其他等待同一次回源的请求
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        # 失效后可能已有新的回源任务占用该键
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[tuple]]):
+        version_key = f"{key}:version"
+        try:
+            redis = await get_redis()
+            version = await redis.get(version_key) or b"0"
+        except Exception as e:
+            # 读不到版本号就不写缓存，直接回源
+            self.errors_total += 1
+            logger.warning(f"Profile cache version read failed for {key}: {e}")
+            message, _ = await loader()
+            return message
+
+        message, cacheable = await loader()
+
+        if cacheable:
+            try:
+                if self._set_script is None:
+                    self._set_script = redis.register_script(SET_IF_VERSION_UNCHANGED_SCRIPT)
+                await self._set_script(
+                    keys=[key, version_key],
+                    args=[message.SerializeToString(), version, self.ttl],
+                    client=redis
+                )
+            except Exception as e:
+                self.errors_total += 1
+                logger.warning(f"Profile cache write failed for {key}: {e}")
+        return message
+
+    async def invalidate(self, key: str):
+        """数据变更后调用：升级版本号并删除缓存，进行中的回源结果不再写入"""
+        self._inflight.pop(key, None)
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline()
+            pipe.incr(f"{key}:version")
+            pipe.expire(f"{key}:version", PROFILE_CACHE_VERSION_TTL)
+            pipe.delete(key)
+            await pipe.execute()
+        except Exception as e:
+            self.errors_total += 1
+            logger.warning(f"Profile cache invalidation failed for {key}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "inflight": len(self._inflight),
+            "hits_total": self.hits_total,
+            "misses_total": self.misses_total,
+            "coalesced_total": self.coalesced_total,
+            "errors_total": self.errors_total,
+        }
+
+
+# 全局实例
+profile_cache = ProtoCache()
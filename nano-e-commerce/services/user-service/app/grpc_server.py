@@ -1,6 +1,7 @@
 import grpc
 from app.proto import user_pb2_grpc, user_pb2
 from app.service import UserService
+from app.cache import profile_cache, USER_PROFILE_KEY, USER_ADDRESSES_KEY
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,9 +27,11 @@ class UserServicer(user_pb2_grpc.UserServiceServicer):
             response.message = message
             
             if success and user:
-                # 创建访问令牌
-                token = self.user_service.create_access_token(user.id)
-                response.token = token
+                # 签发访问令牌与刷新令牌
+                tokens = await self.user_service.issue_tokens(user.id)
+                response.token = tokens["access_token"]
+                response.refresh_token = tokens["refresh_token"]
+                response.expires_in = tokens["expires_in"]
                 
                 # 填充用户信息
                 response.user.id = user.id
@@ -50,7 +53,7 @@ class UserServicer(user_pb2_grpc.UserServiceServicer):
     async def Login(self, request, context):
         """用户登录"""
         try:
-            success, message, user, token = await self.user_service.login_user(
+            success, message, user, tokens = await self.user_service.login_user(
                 email=request.email,
                 password=request.password
             )
@@ -59,8 +62,10 @@ class UserServicer(user_pb2_grpc.UserServiceServicer):
             response.success = success
             response.message = message
             
-            if success and user and token:
-                response.token = token
+            if success and user and tokens:
+                response.token = tokens["access_token"]
+                response.refresh_token = tokens["refresh_token"]
+                response.expires_in = tokens["expires_in"]
                 
                 # 填充用户信息
                 response.user.id = user.id
@@ -79,25 +84,33 @@ class UserServicer(user_pb2_grpc.UserServiceServicer):
             context.set_details(str(e))
             return user_pb2.LoginResponse()
     
+    async def _load_user_response(self, user_id: int) -> tuple[user_pb2.GetUserResponse, bool]:
+        """查询数据库构造 GetUser 响应，返回 (响应, 是否可缓存)"""
+        success, message, user = await self.user_service.get_user_by_id(user_id)
+        
+        response = user_pb2.GetUserResponse()
+        response.success = success
+        response.message = message
+        
+        if success and user:
+            response.user.id = user.id
+            response.user.username = user.username
+            response.user.email = user.email
+            response.user.phone = user.phone or ""
+            response.user.avatar = user.avatar or ""
+            response.user.created_at = user.created_at
+            response.user.updated_at = user.updated_at
+        
+        return response, success
+    
     async def GetUser(self, request, context):
-        """获取用户信息"""
+        """获取用户信息（读穿透缓存）"""
         try:
-            success, message, user = await self.user_service.get_user_by_id(request.user_id)
-            
-            response = user_pb2.GetUserResponse()
-            response.success = success
-            response.message = message
-            
-            if success and user:
-                response.user.id = user.id
-                response.user.username = user.username
-                response.user.email = user.email
-                response.user.phone = user.phone or ""
-                response.user.avatar = user.avatar or ""
-                response.user.created_at = user.created_at
-                response.user.updated_at = user.updated_at
-            
-            return response
+            return await profile_cache.get_or_load(
+                USER_PROFILE_KEY.format(request.user_id),
+                user_pb2.GetUserResponse,
+                lambda: self._load_user_response(request.user_id)
+            )
             
         except Exception as e:
             logger.error(f"GetUser error: {e}")
@@ -139,7 +152,7 @@ class UserServicer(user_pb2_grpc.UserServiceServicer):
     async def ValidateToken(self, request, context):
         """验证Token"""
         try:
-            user_id = self.user_service.verify_token(request.token)
+            user_id = await self.user_service.verify_token(request.token)
             
             response = user_pb2.ValidateTokenResponse()
             
@@ -160,6 +173,40 @@ class UserServicer(user_pb2_grpc.UserServiceServicer):
             context.set_details(str(e))
             return user_pb2.ValidateTokenResponse()
     
+    async def RefreshToken(self, request, context):
+        """刷新Token"""
+        try:
+            success, message, tokens = await self.user_service.refresh_tokens(request.refresh_token)
+            
+            response = user_pb2.RefreshTokenResponse()
+            response.success = success
+            response.message = message
+            
+            if success and tokens:
+                response.token = tokens["access_token"]
+                response.refresh_token = tokens["refresh_token"]
+                response.expires_in = tokens["expires_in"]
+            
+            return response
+            
+        except Exception as e:
+            logger.error(f"RefreshToken error: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return user_pb2.RefreshTokenResponse()
+    
+    async def Logout(self, request, context):
+        """注销"""
+        try:
+            success, message = await self.user_service.logout(request.token)
+            return user_pb2.LogoutResponse(success=success, message=message)
+            
+        except Exception as e:
+            logger.error(f"Logout error: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return user_pb2.LogoutResponse()
+    
     async def AddAddress(self, request, context):
         """添加地址"""
         try:
@@ -201,32 +248,40 @@ class UserServicer(user_pb2_grpc.UserServiceServicer):
             context.set_details(str(e))
             return user_pb2.AddAddressResponse()
     
+    async def _load_addresses_response(self, user_id: int) -> tuple[user_pb2.GetAddressesResponse, bool]:
+        """查询数据库构造 GetAddresses 响应，返回 (响应, 是否可缓存)"""
+        success, message, addresses = await self.user_service.get_user_addresses(user_id)
+        
+        response = user_pb2.GetAddressesResponse()
+        response.success = success
+        response.message = message
+        
+        if success:
+            for address in addresses:
+                addr = response.addresses.add()
+                addr.id = address.id
+                addr.user_id = address.user_id
+                addr.name = address.name
+                addr.phone = address.phone
+                addr.province = address.province
+                addr.city = address.city
+                addr.district = address.district
+                addr.detail = address.detail
+                addr.postal_code = address.postal_code or ""
+                addr.is_default = address.is_default
+                addr.created_at = address.created_at
+                addr.updated_at = address.updated_at
+        
+        return response, success
+    
     async def GetAddresses(self, request, context):
-        """获取地址列表"""
+        """获取地址列表（读穿透缓存）"""
         try:
-            success, message, addresses = await self.user_service.get_user_addresses(request.user_id)
-            
-            response = user_pb2.GetAddressesResponse()
-            response.success = success
-            response.message = message
-            
-            if success:
-                for address in addresses:
-                    addr = response.addresses.add()
-                    addr.id = address.id
-                    addr.user_id = address.user_id
-                    addr.name = address.name
-                    addr.phone = address.phone
-                    addr.province = address.province
-                    addr.city = address.city
-                    addr.district = address.district
-                    addr.detail = address.detail
-                    addr.postal_code = address.postal_code or ""
-                    addr.is_default = address.is_default
-                    addr.created_at = address.created_at
-                    addr.updated_at = address.updated_at
-            
-            return response
+            return await profile_cache.get_or_load(
+                USER_ADDRESSES_KEY.format(request.user_id),
+                user_pb2.GetAddressesResponse,
+                lambda: self._load_addresses_response(request.user_id)
+            )
             
         except Exception as e:
             logger.error(f"GetAddresses error: {e}")
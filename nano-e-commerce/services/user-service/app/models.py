@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, BigInteger, Boolean, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, BigInteger, Boolean, Text, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -51,6 +51,11 @@ class Address(Base):
     # 关联用户
     user = relationship("User", back_populates="addresses")
 
+    __table_args__ = (
+        # 每个用户最多一个默认地址
+        Index('idx_addresses_user_default', 'user_id', unique=True, postgresql_where=text("is_default")),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
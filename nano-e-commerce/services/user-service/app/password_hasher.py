@@ -0,0 +1,264 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# 密码哈希进程池配置
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or os.cpu_count() or 1
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", str(PASSWORD_HASH_WORKERS * 8)))
+
+# 哈希策略：算法与成本（bcrypt 为 log2 轮数，pbkdf2_sha256 为迭代次数）
+# 修改后，旧参数的哈希会在用户下次登录成功时自动重新计算
+DEFAULT_HASH_COSTS = {"bcrypt": 12, "pbkdf2_sha256": 600000}
+PASSWORD_HASH_ALGORITHM = os.getenv("PASSWORD_HASH_ALGORITHM", "bcrypt")
+if PASSWORD_HASH_ALGORITHM not in DEFAULT_HASH_COSTS:
+    raise ValueError(f"Unsupported PASSWORD_HASH_ALGORITHM: {PASSWORD_HASH_ALGORITHM}")
+PASSWORD_HASH_COST = int(os.getenv("PASSWORD_HASH_COST", "0")) or DEFAULT_HASH_COSTS[PASSWORD_HASH_ALGORITHM]
+
+# 登录校验结果缓存（仅缓存成功的校验，0 表示关闭）
+PASSWORD_VERIFY_CACHE_TTL = float(os.getenv("PASSWORD_VERIFY_CACHE_TTL", "300"))  # 秒
+PASSWORD_VERIFY_CACHE_SIZE = int(os.getenv("PASSWORD_VERIFY_CACHE_SIZE", "10000"))
+
+PBKDF2_PREFIX = "$pbkdf2-sha256$"
+
+
+class PasswordHasherOverloaded(Exception):
+    """哈希队列已满，请求被拒绝"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _hash_password(password: bytes, algorithm: str, cost: int) -> str:
+    if algorithm == "bcrypt":
+        return bcrypt.hashpw(password, bcrypt.gensalt(cost)).decode("utf-8")
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password, salt, cost)
+    return f"{PBKDF2_PREFIX}{cost}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _check_password(password: bytes, hashed_password: str) -> bool:
+    """按哈希自身的格式校验，切换算法后旧哈希仍然可用"""
+    if hashed_password.startswith(PBKDF2_PREFIX):
+        cost, salt, digest = hashed_password[len(PBKDF2_PREFIX):].split("$")
+        expected = hashlib.pbkdf2_hmac("sha256", password, _b64decode(salt), int(cost))
+        return hmac.compare_digest(expected, _b64decode(digest))
+    return bcrypt.checkpw(password, hashed_password.encode("utf-8"))
+
+
+def needs_rehash(hashed_password: str, algorithm: str = PASSWORD_HASH_ALGORITHM,
+                 cost: int = PASSWORD_HASH_COST) -> bool:
+    """哈希的算法或成本与当前策略不一致时需要重新计算"""
+    if hashed_password.startswith(PBKDF2_PREFIX):
+        return algorithm != "pbkdf2_sha256" or hashed_password[len(PBKDF2_PREFIX):].split("$")[0] != str(cost)
+    # bcrypt 格式：$2b$12$...
+    return algorithm != "bcrypt" or hashed_password[4:6] != f"{cost:02d}"
+
+
+def _hash_in_worker(password: bytes, algorithm: str, cost: int) -> tuple[str, float, float]:
+    """在子进程中执行：返回 (哈希, 开始时间, 哈希耗时)"""
+    started_at = time.time()
+    hashed = _hash_password(password, algorithm, cost)
+    return hashed, started_at, time.time() - started_at
+
+
+def _verify_in_worker(password: bytes, hashed_password: str, algorithm: Optional[str] = None,
+                      cost: Optional[int] = None) -> tuple[tuple[bool, Optional[str]], float, float]:
+    """在子进程中执行：返回 ((是否匹配, 新哈希), 开始时间, 耗时)
+
+    指定了策略且校验成功、哈希参数已过时时，在同一次调用中按该策略重新哈希。
+    """
+    started_at = time.time()
+    matched = _check_password(password, hashed_password)
+    new_hash = None
+    if matched and algorithm and needs_rehash(hashed_password, algorithm, cost):
+        new_hash = _hash_password(password, algorithm, cost)
+    return (matched, new_hash), started_at, time.time() - started_at
+
+
+class VerificationCache:
+    """短期、有界的登录校验结果缓存
+
+    键为进程内随机密钥对 (用户ID, 密码哈希, 密码) 的 HMAC，不保存明文；
+    密码哈希参与计算，改密码或重新哈希后旧条目自然失效。
+    """
+
+    def __init__(self, ttl: float = PASSWORD_VERIFY_CACHE_TTL, max_size: int = PASSWORD_VERIFY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._secret = os.urandom(32)
+        self._entries: OrderedDict[bytes, float] = OrderedDict()  # key -> 过期时间
+        self.hits_total = 0
+        self.misses_total = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def _key(self, user_id: int, hashed_password: str, password: str) -> bytes:
+        message = b"\x00".join((str(user_id).encode(), hashed_password.encode("utf-8"), password.encode("utf-8")))
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def contains(self, user_id: int, hashed_password: str, password: str) -> bool:
+        if not self.enabled:
+            return False
+        key = self._key(user_id, hashed_password, password)
+        expires_at = self._entries.get(key)
+        if expires_at is None or expires_at < time.monotonic():
+            if expires_at is not None:
+                del self._entries[key]
+            self.misses_total += 1
+            return False
+        self._entries.move_to_end(key)
+        self.hits_total += 1
+        return True
+
+    def add(self, user_id: int, hashed_password: str, password: str):
+        if not self.enabled:
+            return
+        key = self._key(user_id, hashed_password, password)
+        self._entries[key] = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "max_size": self.max_size,
+            "size": len(self._entries),
+            "hits_total": self.hits_total,
+            "misses_total": self.misses_total,
+        }
+
+
+class PasswordHasher:
+    """把 bcrypt 计算放到进程池中执行，避免阻塞事件循环"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+                 algorithm: str = PASSWORD_HASH_ALGORITHM, cost: int = PASSWORD_HASH_COST):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.algorithm = algorithm
+        self.cost = cost
+        self._executor = None
+        self.verification_cache = VerificationCache()
+
+        # 指标
+        self.pending = 0  # 排队 + 执行中
+        self.completed_total = 0
+        self.rejected_total = 0
+        self.queue_wait_seconds_total = 0.0
+        self.hash_seconds_total = 0.0
+        self.queue_wait_seconds_max = 0.0
+        self.rehashed_total = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # 使用 spawn，避免 fork 带有 gRPC 线程和事件循环的进程
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected_total += 1
+            raise PasswordHasherOverloaded("密码校验请求过多，请稍后重试")
+
+        self.pending += 1
+        submitted_at = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started_at, hash_seconds = await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+        queue_wait = max(started_at - submitted_at, 0.0)
+        self.completed_total += 1
+        self.queue_wait_seconds_total += queue_wait
+        self.queue_wait_seconds_max = max(self.queue_wait_seconds_max, queue_wait)
+        self.hash_seconds_total += hash_seconds
+        return result
+
+    async def hash(self, password: str) -> str:
+        """按当前策略哈希密码"""
+        return await self._submit(_hash_in_worker, password.encode('utf-8'), self.algorithm, self.cost)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """验证密码（不使用缓存，不重新哈希）"""
+        matched, _ = await self._submit(_verify_in_worker, password.encode('utf-8'), hashed_password)
+        return matched
+
+    async def verify_and_update(self, user_id: int, password: str,
+                                hashed_password: str) -> tuple[bool, Optional[str]]:
+        """登录校验：返回 (是否匹配, 新哈希)
+
+        近期校验成功过的 (用户, 哈希, 密码) 直接命中缓存，跳过 KDF；
+        哈希参数与当前策略不一致时返回按新策略计算的哈希，由调用方持久化。
+        """
+        if self.verification_cache.contains(user_id, hashed_password, password):
+            return True, None
+
+        matched, new_hash = await self._submit(
+            _verify_in_worker, password.encode('utf-8'), hashed_password, self.algorithm, self.cost
+        )
+        if matched:
+            if new_hash:
+                self.rehashed_total += 1
+            self.verification_cache.add(user_id, new_hash or hashed_password, password)
+        return matched, new_hash
+
+    def warm_up(self):
+        """预先启动全部子进程，避免首批登录承担进程启动开销"""
+        for _ in range(self.workers):
+            self.executor.submit(time.time)
+
+    def stats(self) -> dict:
+        """进程池指标：排队等待时间与哈希计算时间分开统计"""
+        completed = self.completed_total or 1
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "algorithm": self.algorithm,
+            "cost": self.cost,
+            "pending": self.pending,
+            "queue_depth": max(self.pending - self.workers, 0),
+            "completed_total": self.completed_total,
+            "rejected_total": self.rejected_total,
+            "queue_wait_seconds_total": round(self.queue_wait_seconds_total, 6),
+            "queue_wait_seconds_avg": round(self.queue_wait_seconds_total / completed, 6),
+            "queue_wait_seconds_max": round(self.queue_wait_seconds_max, 6),
+            "hash_seconds_total": round(self.hash_seconds_total, 6),
+            "hash_seconds_avg": round(self.hash_seconds_total / completed, 6),
+            "rehashed_total": self.rehashed_total,
+            "verification_cache": self.verification_cache.stats(),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局实例
+password_hasher = PasswordHasher()
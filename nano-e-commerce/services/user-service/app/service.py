@@ -1,81 +1,178 @@
-import bcrypt
 import jwt
 import os
-from datetime import datetime, timedelta
+import time
+import uuid
+import logging
 from typing import Optional
-from sqlalchemy import select
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import User, Address
 from app.database import SessionLocal
+from app.password_hasher import password_hasher, PasswordHasherOverloaded
+from app.token_store import token_store
+from app.cache import profile_cache, USER_PROFILE_KEY, USER_ADDRESSES_KEY
 
 # JWT配置
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30天
+
+
+def load_key_set(value: str) -> dict:
+    """解析 JWT_KEYS（逗号分隔的 kid:secret），与 api-gateway 共用同一配置"""
+    keys = {}
+    for entry in value.split(","):
+        kid, _, secret = entry.strip().partition(":")
+        if kid and secret:
+            keys[kid] = secret
+    return keys
+
+
+# 轮换密钥：新密钥先加入 JWT_KEYS，再切换 JWT_ACTIVE_KID，旧令牌过期后移除旧密钥
+JWT_KEYS = load_key_set(os.getenv("JWT_KEYS", ""))
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", "")
+if JWT_ACTIVE_KID and JWT_ACTIVE_KID not in JWT_KEYS:
+    raise ValueError(f"JWT_ACTIVE_KID {JWT_ACTIVE_KID} not found in JWT_KEYS")
+# 访问令牌短期有效，长期登录依赖刷新令牌轮换
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+
+logger = logging.getLogger(__name__)
+
+# 唯一约束冲突时返回给用户的提示，按冲突字段区分
+REGISTER_CONFLICT_MESSAGES = {"username": "用户名已存在", "email": "邮箱已存在", "phone": "手机号已存在"}
+UPDATE_CONFLICT_MESSAGES = {"username": "用户名已被使用", "phone": "手机号已被使用"}
+
+
+def unique_violation_field(error: IntegrityError) -> Optional[str]:
+    """从唯一约束冲突中解析出冲突的 users 字段
+
+    约束名可能是 ORM 建的 ix_users_email，也可能是迁移脚本建的 users_email_key，
+    两者都包含字段名；取不到约束名时退回解析 "Key (email)=(...)" 错误详情。
+    """
+    cause = getattr(error.orig, "__cause__", None)
+    constraint_name = getattr(cause, "constraint_name", None) or ""
+    detail = getattr(cause, "detail", None) or str(error.orig)
+    for field in REGISTER_CONFLICT_MESSAGES:
+        if field in constraint_name or f"Key ({field})" in detail:
+            return field
+    return None
 
 class UserService:
     """用户服务业务逻辑"""
     
     @staticmethod
-    def hash_password(password: str) -> str:
-        """密码哈希"""
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return hashed.decode('utf-8')
+    async def hash_password(password: str) -> str:
+        """密码哈希（在进程池中执行）"""
+        return await password_hasher.hash(password)
     
     @staticmethod
-    def verify_password(password: str, hashed_password: str) -> bool:
-        """验证密码"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    async def verify_password(user_id: int, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """验证密码，返回 (是否匹配, 按当前策略重新计算的哈希)"""
+        return await password_hasher.verify_and_update(user_id, password, hashed_password)
+
+    @staticmethod
+    async def upgrade_password_hash(session: AsyncSession, user: User, new_hash: str):
+        """登录成功后用新参数的哈希替换旧哈希；失败不影响本次登录"""
+        try:
+            # 仅当哈希未被并发修改（如改密码）时才替换
+            await session.execute(
+                update(User)
+                .where(User.id == user.id, User.password_hash == user.password_hash)
+                .values(password_hash=new_hash, updated_at=int(time.time()))
+            )
+            await session.commit()
+            await session.refresh(user)
+            await profile_cache.invalidate(USER_PROFILE_KEY.format(user.id))
+        except Exception as e:
+            await session.rollback()
+            logger.warning(f"Failed to upgrade password hash for user {user.id}: {e}")
     
     @staticmethod
-    def create_access_token(user_id: int) -> str:
+    def create_access_token(user_id: int, jti: str, expire: int, session_id: str = None) -> str:
         """创建访问令牌"""
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        to_encode = {"user_id": user_id, "exp": expire}
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        to_encode = {"user_id": user_id, "exp": expire, "jti": jti}
+        if session_id:
+            to_encode["sid"] = session_id
+        # 配置了密钥集时用当前密钥签名，并在令牌头中写入 kid
+        headers = {"kid": JWT_ACTIVE_KID} if JWT_ACTIVE_KID else None
+        key = JWT_KEYS[JWT_ACTIVE_KID] if JWT_ACTIVE_KID else SECRET_KEY
+        encoded_jwt = jwt.encode(to_encode, key, algorithm=ALGORITHM, headers=headers)
         return encoded_jwt
     
     @staticmethod
-    def verify_token(token: str) -> Optional[int]:
-        """验证令牌并返回用户ID"""
+    def new_access_token_id() -> tuple[str, int]:
+        """生成访问令牌的 jti 与过期时间戳"""
+        return uuid.uuid4().hex, int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    async def issue_tokens(self, user_id: int) -> dict:
+        """登录/注册后签发访问令牌，并创建刷新令牌会话"""
+        jti, expire = self.new_access_token_id()
+        session_id, refresh_token = await token_store.create_session(user_id, jti, expire)
+        return {
+            "access_token": self.create_access_token(user_id, jti, expire, session_id),
+            "refresh_token": refresh_token,
+            "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        }
+
+    async def refresh_tokens(self, refresh_token: str) -> tuple[bool, str, Optional[dict]]:
+        """轮换刷新令牌并签发新的访问令牌"""
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            user_id: int = payload.get("user_id")
+            jti, expire = self.new_access_token_id()
+            user_id, new_refresh_token = await token_store.rotate_session(refresh_token, jti, expire)
             if user_id is None:
+                return False, "刷新令牌无效或已过期", None
+
+            session_id = new_refresh_token.partition(".")[0]
+            return True, "刷新成功", {
+                "access_token": self.create_access_token(user_id, jti, expire, session_id),
+                "refresh_token": new_refresh_token,
+                "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+            }
+        except Exception as e:
+            return False, f"刷新失败: {str(e)}", None
+
+    async def logout(self, token: str) -> tuple[bool, str]:
+        """注销：结束刷新令牌会话并吊销访问令牌"""
+        try:
+            payload = self.decode_token(token)
+            if payload is None:
+                return False, "令牌无效或已过期"
+
+            if payload.get("sid"):
+                await token_store.end_session(payload["sid"])
+            if payload.get("jti"):
+                await token_store.revoke_access_token(payload["jti"], int(payload["exp"]))
+            return True, "注销成功"
+        except Exception as e:
+            return False, f"注销失败: {str(e)}"
+
+    @staticmethod
+    def decode_token(token: str) -> Optional[dict]:
+        """验证令牌签名与有效期，返回载荷"""
+        try:
+            # 按令牌头中的 kid 选择密钥，没有 kid 的旧令牌使用 JWT_SECRET_KEY
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = SECRET_KEY if kid is None else JWT_KEYS.get(kid)
+            if key is None:
                 return None
-            return user_id
+            return jwt.decode(token, key, algorithms=[ALGORITHM])
         except jwt.PyJWTError:
             return None
+
+    async def verify_token(self, token: str) -> Optional[int]:
+        """验证令牌（含吊销检查）并返回用户ID"""
+        payload = self.decode_token(token)
+        if payload is None or await token_store.is_access_token_revoked(payload.get("jti")):
+            return None
+        return payload.get("user_id")
     
     async def register_user(self, username: str, email: str, password: str, phone: str = None) -> tuple[bool, str, Optional[User]]:
         """用户注册"""
-        async with SessionLocal() as session:
+        # 提交后不过期对象：INSERT ... RETURNING 已带回主键，无需再 refresh
+        async with SessionLocal(expire_on_commit=False) as session:
             try:
-                # 检查用户名是否已存在
-                result = await session.execute(
-                    select(User).where(User.username == username)
-                )
-                if result.scalar_one_or_none():
-                    return False, "用户名已存在", None
-                
-                # 检查邮箱是否已存在
-                result = await session.execute(
-                    select(User).where(User.email == email)
-                )
-                if result.scalar_one_or_none():
-                    return False, "邮箱已存在", None
-                
-                # 检查手机号是否已存在（如果提供）
-                if phone:
-                    result = await session.execute(
-                        select(User).where(User.phone == phone)
-                    )
-                    if result.scalar_one_or_none():
-                        return False, "手机号已存在", None
-                
-                # 创建新用户
-                hashed_password = self.hash_password(password)
+                # 直接插入，由唯一索引判断用户名/邮箱/手机号是否已存在
+                hashed_password = await self.hash_password(password)
                 new_user = User(
                     username=username,
                     email=email,
@@ -85,15 +182,23 @@ class UserService:
                 
                 session.add(new_user)
                 await session.commit()
-                await session.refresh(new_user)
                 
                 return True, "注册成功", new_user
                 
+            except IntegrityError as e:
+                await session.rollback()
+                field = unique_violation_field(e)
+                if field is None:
+                    return False, f"注册失败: {str(e)}", None
+                return False, REGISTER_CONFLICT_MESSAGES[field], None
+            except PasswordHasherOverloaded as e:
+                await session.rollback()
+                return False, str(e), None
             except Exception as e:
                 await session.rollback()
                 return False, f"注册失败: {str(e)}", None
     
-    async def login_user(self, email: str, password: str) -> tuple[bool, str, Optional[User], Optional[str]]:
+    async def login_user(self, email: str, password: str) -> tuple[bool, str, Optional[User], Optional[dict]]:
         """用户登录"""
         async with SessionLocal() as session:
             try:
@@ -110,14 +215,21 @@ class UserService:
                     return False, "账户已被禁用", None, None
                 
                 # 验证密码
-                if not self.verify_password(password, user.password_hash):
+                matched, new_hash = await self.verify_password(user.id, password, user.password_hash)
+                if not matched:
                     return False, "密码错误", None, None
+
+                # 哈希参数已过时，顺便升级
+                if new_hash:
+                    await self.upgrade_password_hash(session, user, new_hash)
                 
-                # 创建访问令牌
-                token = self.create_access_token(user.id)
+                # 签发访问令牌与刷新令牌
+                tokens = await self.issue_tokens(user.id)
                 
-                return True, "登录成功", user, token
+                return True, "登录成功", user, tokens
                 
+            except PasswordHasherOverloaded as e:
+                return False, str(e), None, None
             except Exception as e:
                 return False, f"登录失败: {str(e)}", None, None
     
@@ -140,7 +252,7 @@ class UserService:
     
     async def update_user(self, user_id: int, username: str = None, phone: str = None, avatar: str = None) -> tuple[bool, str, Optional[User]]:
         """更新用户信息"""
-        async with SessionLocal() as session:
+        async with SessionLocal(expire_on_commit=False) as session:
             try:
                 result = await session.execute(
                     select(User).where(User.id == user_id)
@@ -150,37 +262,59 @@ class UserService:
                 if not user:
                     return False, "用户不存在", None
                 
-                # 更新字段
+                # 更新字段，用户名/手机号是否已被其他用户使用由唯一索引判断
                 if username:
-                    # 检查用户名是否已被其他用户使用
-                    result = await session.execute(
-                        select(User).where(User.username == username, User.id != user_id)
-                    )
-                    if result.scalar_one_or_none():
-                        return False, "用户名已被使用", None
                     user.username = username
                 
                 if phone:
-                    # 检查手机号是否已被其他用户使用
-                    result = await session.execute(
-                        select(User).where(User.phone == phone, User.id != user_id)
-                    )
-                    if result.scalar_one_or_none():
-                        return False, "手机号已被使用", None
                     user.phone = phone
                 
                 if avatar:
                     user.avatar = avatar
                 
                 await session.commit()
-                await session.refresh(user)
+                await profile_cache.invalidate(USER_PROFILE_KEY.format(user_id))
                 
                 return True, "更新成功", user
                 
+            except IntegrityError as e:
+                await session.rollback()
+                field = unique_violation_field(e)
+                if field not in UPDATE_CONFLICT_MESSAGES:
+                    return False, f"更新失败: {str(e)}", None
+                return False, UPDATE_CONFLICT_MESSAGES[field], None
             except Exception as e:
                 await session.rollback()
                 return False, f"更新失败: {str(e)}", None
     
+    @staticmethod
+    async def set_default_address(session: AsyncSession, user_id: int, address_id: int) -> bool:
+        """单条语句切换默认地址，返回目标地址是否存在
+
+        取消旧默认放在 CTE 中，外层 UPDATE 通过子查询依赖它，保证旧默认先被清除；
+        若写成 SET is_default = (id = :new_id)，行的处理顺序不确定，
+        可能先置位新地址而触发 idx_addresses_user_default 唯一冲突。
+        """
+        now = int(time.time())
+        cleared = (
+            update(Address)
+            .where(Address.user_id == user_id, Address.is_default == True, Address.id != address_id)
+            .values(is_default=False, updated_at=now)
+            .returning(Address.id)
+            .cte("cleared")
+        )
+        result = await session.execute(
+            update(Address)
+            .where(
+                Address.id == address_id,
+                Address.user_id == user_id,
+                select(func.count()).select_from(cleared).scalar_subquery() >= 0
+            )
+            .values(is_default=True, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount > 0
+    
     async def add_address(self, user_id: int, name: str, phone: str, province: str, 
                          city: str, district: str, detail: str, postal_code: str = None,
                          is_default: bool = False) -> tuple[bool, str, Optional[Address]]:
@@ -194,18 +328,7 @@ class UserService:
                 if not result.scalar_one_or_none():
                     return False, "用户不存在", None
                 
-                # 如果设置为默认地址，先取消其他默认地址
-                if is_default:
-                    await session.execute(
-                        select(Address).where(Address.user_id == user_id, Address.is_default == True)
-                    )
-                    result = await session.execute(
-                        select(Address).where(Address.user_id == user_id, Address.is_default == True)
-                    )
-                    for addr in result.scalars():
-                        addr.is_default = False
-                
-                # 创建新地址
+                # 创建新地址（默认地址在插入后单独切换）
                 new_address = Address(
                     user_id=user_id,
                     name=name,
@@ -215,12 +338,16 @@ class UserService:
                     district=district,
                     detail=detail,
                     postal_code=postal_code,
-                    is_default=is_default
+                    is_default=False
                 )
                 
                 session.add(new_address)
+                if is_default:
+                    await session.flush()
+                    await self.set_default_address(session, user_id, new_address.id)
                 await session.commit()
                 await session.refresh(new_address)
+                await profile_cache.invalidate(USER_ADDRESSES_KEY.format(user_id))
                 
                 return True, "添加成功", new_address
                 
@@ -257,13 +384,9 @@ class UserService:
                 if not address:
                     return False, "地址不存在或无权限", None
                 
-                # 如果设置为默认地址，先取消其他默认地址
+                # 设置为默认地址时，单条语句切换默认
                 if is_default:
-                    result = await session.execute(
-                        select(Address).where(Address.user_id == user_id, Address.is_default == True, Address.id != address_id)
-                    )
-                    for addr in result.scalars():
-                        addr.is_default = False
+                    await self.set_default_address(session, user_id, address_id)
                 
                 # 更新字段
                 if name: address.name = name
@@ -273,10 +396,11 @@ class UserService:
                 if district: address.district = district
                 if detail: address.detail = detail
                 if postal_code: address.postal_code = postal_code
-                if is_default is not None: address.is_default = is_default
+                if is_default is False: address.is_default = False
                 
                 await session.commit()
                 await session.refresh(address)
+                await profile_cache.invalidate(USER_ADDRESSES_KEY.format(user_id))
                 
                 return True, "更新成功", address
                 
@@ -298,6 +422,7 @@ class UserService:
                 
                 await session.delete(address)
                 await session.commit()
+                await profile_cache.invalidate(USER_ADDRESSES_KEY.format(user_id))
                 
                 return True, "删除成功"
                 
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import os
+import secrets
+import time
+import logging
+from typing import Optional
+
+from app.database import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 刷新令牌有效期（每次轮换后重新计算）
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+# 已吊销访问令牌的 Bloom 过滤器参数，必须与 api-gateway 保持一致
+REVOCATION_BLOOM_BITS = int(os.getenv("REVOCATION_BLOOM_BITS", str(1 << 20)))
+REVOCATION_BLOOM_HASHES = int(os.getenv("REVOCATION_BLOOM_HASHES", "7"))
+# 清理已过期吊销记录并重建过滤器的间隔（秒）
+REVOCATION_PRUNE_INTERVAL = int(os.getenv("REVOCATION_PRUNE_INTERVAL", "300"))
+
+REFRESH_SESSION_KEY = "refresh_session:{}"
+# 有序集合：jti -> 访问令牌过期时间戳
+REVOKED_TOKENS_KEY = "revoked_access_tokens"
+# Redis 位图形式的 Bloom 过滤器，网关定期整体拉取
+REVOKED_BLOOM_KEY = "revoked_access_tokens:bloom"
+
+# 轮换刷新令牌：只有当前令牌可以换新；旧令牌被重放时视为泄露，整个会话作废
+# KEYS[1] 会话键；ARGV: 提交的令牌哈希、新令牌哈希、新 jti、新访问令牌过期时间、会话 TTL
+ROTATE_REFRESH_TOKEN_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'token_hash')
+if not current then
+    return {0}
+end
+if current ~= ARGV[1] then
+    local session = redis.call('HMGET', KEYS[1], 'access_jti', 'access_exp')
+    redis.call('DEL', KEYS[1])
+    return {-1, session[1], session[2]}
+end
+local user_id = redis.call('HGET', KEYS[1], 'user_id')
+redis.call('HSET', KEYS[1], 'token_hash', ARGV[2], 'access_jti', ARGV[3], 'access_exp', ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return {1, user_id}
+"""
+
+
+def bloom_offsets(token_id: str, bits: int = REVOCATION_BLOOM_BITS,
+                  hashes: int = REVOCATION_BLOOM_HASHES) -> list[int]:
+    """计算 jti 在 Bloom 过滤器中的位偏移（双重哈希）"""
+    digest = hashlib.sha256(token_id.encode("utf-8")).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:16], "big") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def build_bloom_filter(token_ids, bits: int = REVOCATION_BLOOM_BITS) -> bytes:
+    """按 Redis 位图的位序（字节内高位在前）构建过滤器"""
+    data = bytearray((bits + 7) // 8)
+    for token_id in token_ids:
+        for offset in bloom_offsets(token_id, bits):
+            data[offset >> 3] |= 0x80 >> (offset & 7)
+    return bytes(data)
+
+
+def _hash_refresh_secret(secret: str) -> str:
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class TokenStore:
+    """刷新令牌会话与访问令牌吊销列表（Redis）"""
+
+    def __init__(self):
+        self._rotate_script = None
+
+    async def create_session(self, user_id: int, access_jti: str, access_exp: int) -> tuple[str, str]:
+        """创建登录会话，返回 (会话ID, 刷新令牌)
+
+        刷新令牌格式为 "<会话ID>.<随机串>"，Redis 中只保存随机串的哈希。
+        """
+        session_id = secrets.token_urlsafe(12)
+        secret = secrets.token_urlsafe(32)
+        redis = await get_redis()
+        key = REFRESH_SESSION_KEY.format(session_id)
+        pipe = redis.pipeline()
+        pipe.hset(key, mapping={
+            "user_id": user_id,
+            "token_hash": _hash_refresh_secret(secret),
+            "access_jti": access_jti,
+            "access_exp": access_exp,
+        })
+        pipe.expire(key, REFRESH_TOKEN_EXPIRE_DAYS * 86400)
+        await pipe.execute()
+        return session_id, f"{session_id}.{secret}"
+
+    async def rotate_session(self, refresh_token: str, access_jti: str,
+                             access_exp: int) -> tuple[Optional[int], Optional[str]]:
+        """用刷新令牌换取新刷新令牌，返回 (用户ID, 新刷新令牌)；令牌无效时返回 (None, None)"""
+        session_id, _, secret = refresh_token.partition(".")
+        if not session_id or not secret:
+            return None, None
+
+        redis = await get_redis()
+        if self._rotate_script is None:
+            self._rotate_script = redis.register_script(ROTATE_REFRESH_TOKEN_SCRIPT)
+
+        new_secret = secrets.token_urlsafe(32)
+        result = await self._rotate_script(
+            keys=[REFRESH_SESSION_KEY.format(session_id)],
+            args=[_hash_refresh_secret(secret), _hash_refresh_secret(new_secret), access_jti,
+                  access_exp, REFRESH_TOKEN_EXPIRE_DAYS * 86400],
+            client=redis
+        )
+
+        if result[0] == -1:
+            # 已轮换过的令牌被重放：会话已删除，再吊销该会话当前的访问令牌
+            logger.warning(f"Refresh token reuse detected, revoking session {session_id}")
+            if result[1] and result[2]:
+                await self.revoke_access_token(_decode(result[1]), int(result[2]))
+            return None, None
+        if result[0] != 1:
+            return None, None
+        return int(result[1]), f"{session_id}.{new_secret}"
+
+    async def end_session(self, session_id: str):
+        """注销会话：删除刷新令牌并吊销会话当前的访问令牌"""
+        redis = await get_redis()
+        key = REFRESH_SESSION_KEY.format(session_id)
+        pipe = redis.pipeline()
+        pipe.hmget(key, "access_jti", "access_exp")
+        pipe.delete(key)
+        (access_jti, access_exp), _ = await pipe.execute()
+        if access_jti and access_exp:
+            await self.revoke_access_token(_decode(access_jti), int(access_exp))
+
+    async def revoke_access_token(self, jti: str, exp: int):
+        """吊销访问令牌直到其过期，并写入 Bloom 过滤器"""
+        if exp <= time.time():
+            return
+        redis = await get_redis()
+        # 先写有序集合再置位，保证重建过滤器时不会漏掉
+        pipe = redis.pipeline(transaction=False)
+        pipe.zadd(REVOKED_TOKENS_KEY, {jti: exp})
+        for offset in bloom_offsets(jti):
+            pipe.setbit(REVOKED_BLOOM_KEY, offset, 1)
+        await pipe.execute()
+
+    async def is_access_token_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            return False
+        redis = await get_redis()
+        return await redis.zscore(REVOKED_TOKENS_KEY, jti) is not None
+
+    async def prune_revoked_tokens(self) -> int:
+        """删除已过期的吊销记录并重建 Bloom 过滤器，返回当前吊销数量"""
+        redis = await get_redis()
+        await redis.zremrangebyscore(REVOKED_TOKENS_KEY, "-inf", time.time())
+        snapshot = {_decode(jti) for jti in await redis.zrange(REVOKED_TOKENS_KEY, 0, -1)}
+
+        tmp_key = f"{REVOKED_BLOOM_KEY}:rebuild"
+        await redis.set(tmp_key, build_bloom_filter(snapshot))
+        await redis.rename(tmp_key, REVOKED_BLOOM_KEY)
+
+        # 重建期间新增的吊销可能只写进了旧过滤器，补写一次
+        latest = {_decode(jti) for jti in await redis.zrange(REVOKED_TOKENS_KEY, 0, -1)}
+        missed = latest - snapshot
+        if missed:
+            pipe = redis.pipeline(transaction=False)
+            for jti in missed:
+                for offset in bloom_offsets(jti):
+                    pipe.setbit(REVOKED_BLOOM_KEY, offset, 1)
+            await pipe.execute()
+        return len(latest)
+
+
+# 全局实例
+token_store = TokenStore()
+
+
+async def sweep_revoked_tokens():
+    """定期清理过期的吊销记录，保持 Bloom 过滤器的误判率"""
+    while True:
+        try:
+            count = await token_store.prune_revoked_tokens()
+            logger.info(f"Revocation filter rebuilt with {count} revoked tokens")
+        except Exception as e:
+            logger.error(f"Error pruning revoked tokens: {e}")
+        await asyncio.sleep(REVOCATION_PRUNE_INTERVAL)
@@ -0,0 +1,105 @@
+"""登录风暴压测：验证密码哈希吞吐随 CPU 核数扩展。
+
+默认直接压测进程池（无需数据库），依次使用 1、2、4 … 个 worker 并发执行
+bcrypt 校验并输出吞吐：
+
+    python benchmarks/login_storm.py --requests 200
+
+也可以通过 gRPC 压测运行中的 user-service 的 Login 接口：
+
+    python benchmarks/login_storm.py --grpc localhost:50051 --email john@example.com --password secret
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+from app.password_hasher import PasswordHasher
+
+
+def worker_counts(max_workers: int) -> list[int]:
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+    return counts
+
+
+async def storm_hasher(workers: int, requests: int, password: str, hashed: str) -> tuple[float, dict]:
+    """对进程池发起 requests 次并发校验，返回 (每秒校验次数, 进程池指标)"""
+    hasher = PasswordHasher(workers=workers, max_queue=requests)
+    hasher.warm_up()
+    # 等待子进程启动完成
+    await asyncio.gather(*(hasher.verify(password, hashed) for _ in range(workers)))
+
+    started_at = time.perf_counter()
+    results = await asyncio.gather(*(hasher.verify(password, hashed) for _ in range(requests)))
+    elapsed = time.perf_counter() - started_at
+    assert all(results)
+
+    stats = hasher.stats()
+    hasher.shutdown()
+    return requests / elapsed, stats
+
+
+async def storm_grpc(target: str, requests: int, concurrency: int, email: str, password: str):
+    """通过 gRPC 对 Login 接口发起并发登录"""
+    import grpc
+    from app.proto import user_pb2, user_pb2_grpc
+
+    async with grpc.aio.insecure_channel(target) as channel:
+        stub = user_pb2_grpc.UserServiceStub(channel)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def login():
+            async with semaphore:
+                started_at = time.perf_counter()
+                response = await stub.Login(user_pb2.LoginRequest(email=email, password=password))
+                latencies.append(time.perf_counter() - started_at)
+                return response.success
+
+        started_at = time.perf_counter()
+        results = await asyncio.gather(*(login() for _ in range(requests)))
+        elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    print(f"{requests} logins, concurrency={concurrency}: {requests / elapsed:.1f} logins/s, "
+          f"succeeded={sum(results)}, p50={latencies[len(latencies) // 2] * 1000:.1f}ms, "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="user-service 登录风暴压测")
+    parser.add_argument("--requests", type=int, default=200, help="每轮登录次数")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="进程池最大 worker 数")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost（仅进程池模式）")
+    parser.add_argument("--grpc", help="user-service gRPC 地址，指定后压测 Login 接口")
+    parser.add_argument("--concurrency", type=int, default=64, help="gRPC 模式下的并发数")
+    parser.add_argument("--email", default="john@example.com")
+    parser.add_argument("--password", default="password123")
+    args = parser.parse_args()
+
+    if args.grpc:
+        await storm_grpc(args.grpc, args.requests, args.concurrency, args.email, args.password)
+        return
+
+    hashed = bcrypt.hashpw(args.password.encode('utf-8'), bcrypt.gensalt(args.rounds)).decode('utf-8')
+    baseline = None
+    for workers in worker_counts(args.max_workers):
+        throughput, stats = await storm_hasher(workers, args.requests, args.password, hashed)
+        baseline = baseline or throughput
+        print(f"workers={workers:>3}  {throughput:8.1f} logins/s  speedup x{throughput / baseline:5.2f}  "
+              f"avg_hash={stats['hash_seconds_avg'] * 1000:6.1f}ms  "
+              f"avg_queue_wait={stats['queue_wait_seconds_avg'] * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
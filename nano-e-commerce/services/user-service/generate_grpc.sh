@@ -5,13 +5,15 @@ source ../../venv/bin/activate
 
 # 生成所有服务的gRPC文件
 SERVICES=("user-service" "product-service" "cart-service" "order-service" "payment-service" "store-service")
-PROTOS=("user" "product" "cart" "order" "payment" "store")
+# 每个服务的 proto 列表，空格分隔；第一个是服务自身的 proto，其余为它调用的下游服务
+PROTOS=("user" "product" "cart" "order product" "payment" "store product")
 
 echo "Generating gRPC files for all services..."
 
 for i in "${!SERVICES[@]}"; do
     SERVICE=${SERVICES[$i]}
-    PROTO=${PROTOS[$i]}
+    SERVICE_PROTOS=(${PROTOS[$i]})
+    PROTO=${SERVICE_PROTOS[0]}
     
     echo "Generating gRPC files for $SERVICE..."
     
@@ -20,11 +22,13 @@ for i in "${!SERVICES[@]}"; do
     
     # 生成gRPC文件
     cd "../$SERVICE"
-    python -m grpc_tools.protoc \
-        -I../../shared/proto \
-        --python_out=app/proto \
-        --grpc_python_out=app/proto \
-        "../../shared/proto/$PROTO.proto"
+    for P in "${SERVICE_PROTOS[@]}"; do
+        python -m grpc_tools.protoc \
+            -I../../shared/proto \
+            --python_out=app/proto \
+            --grpc_python_out=app/proto \
+            "../../shared/proto/$P.proto"
+    done
     
     # 创建__init__.py
     echo "# 导入生成的gRPC文件
@@ -7,8 +7,14 @@ import uvloop
 import os
 import logging
 
+from instrumentation import MetricsInterceptor, GRPC_SERVER_OPTIONS, instrument_app, monitor_event_loop_lag
+from instrumentation.blocking import detect_blocking_calls
+from instrumentation.tracing import server_interceptors, setup_tracing
 from app.grpc_server import UserServicer
 from app.database import init_db
+from app.password_hasher import password_hasher
+from app.token_store import sweep_revoked_tokens
+from app.cache import profile_cache
 from app.proto import user_pb2_grpc
 
 # 配置日志
@@ -23,9 +29,12 @@ async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时初始化数据库
     await init_db()
+    # 预热密码哈希进程池
+    password_hasher.warm_up()
     logger.info("User service started")
     yield
     # 关闭时清理资源
+    password_hasher.shutdown()
     logger.info("User service shutting down")
 
 # 创建FastAPI应用（用于健康检查）
@@ -36,11 +45,27 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Prometheus 指标：HTTP 中间件和 /metrics
+instrument_app(app)
+
+# 链路追踪：延续网关传来的 trace，并记录 Redis/SQL span
+setup_tracing("user-service")
+
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
     return {"status": "healthy", "service": "user-service"}
 
+@app.get("/stats/password-hasher")
+async def password_hasher_stats():
+    """密码哈希进程池指标"""
+    return password_hasher.stats()
+
+@app.get("/stats/profile-cache")
+async def profile_cache_stats():
+    """用户资料/地址缓存指标"""
+    return profile_cache.stats()
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -48,7 +73,11 @@ async def root():
 
 async def serve_grpc():
     """启动gRPC服务器"""
-    server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.aio.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        interceptors=[*server_interceptors(), MetricsInterceptor()],
+        options=GRPC_SERVER_OPTIONS
+    )
     user_pb2_grpc.add_UserServiceServicer_to_server(UserServicer(), server)
     
     listen_addr = '0.0.0.0:50051'
@@ -80,10 +109,13 @@ async def main():
     # 使用uvloop提升性能
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     
-    # 并发启动gRPC和HTTP服务器
+    # 并发启动gRPC和HTTP服务器，以及吊销列表清理、事件循环延迟监测和阻塞调用检测任务
     await asyncio.gather(
         serve_grpc(),
-        serve_http()
+        serve_http(),
+        sweep_revoked_tokens(),
+        monitor_event_loop_lag(),
+        detect_blocking_calls()
     )
 
 if __name__ == "__main__":
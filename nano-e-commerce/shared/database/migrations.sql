@@ -141,4 +141,10 @@ CREATE TRIGGER update_products_updated_at BEFORE UPDATE ON products FOR EACH ROW
 CREATE TRIGGER update_cart_items_updated_at BEFORE UPDATE ON cart_items FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_orders_updated_at BEFORE UPDATE ON orders FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_payments_updated_at BEFORE UPDATE ON payments FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
-CREATE TRIGGER update_refunds_updated_at BEFORE UPDATE ON refunds FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
\ No newline at end of file
+CREATE TRIGGER update_refunds_updated_at BEFORE UPDATE ON refunds FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- 每个用户最多一个默认地址：先清理历史上重复的默认地址（保留 id 最大的一条）
+UPDATE addresses a SET is_default = false
+WHERE a.is_default
+  AND EXISTS (SELECT 1 FROM addresses b WHERE b.user_id = a.user_id AND b.is_default AND b.id > a.id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_addresses_user_default ON addresses(user_id) WHERE is_default;
@@ -0,0 +1,120 @@
+"""Idempotency keys for create RPCs, shared by the order and payment services.
+
+Copied into each image next to ``app/`` (see the service Dockerfiles) and put
+on PYTHONPATH by ``scripts/dev-start-local.sh``. Each service keeps its own key
+table; the model must have ``id``, ``user_id``, ``idempotency_key``,
+``request_hash``, ``response``, ``expires_at`` columns and a unique index on
+``(user_id, idempotency_key)``.
+
+A request carrying a key first looks the key up with ``get()`` and replays the
+stored response if there is one. Otherwise ``claim()`` inserts the key row in
+the same transaction as the write; a concurrent retry blocks on the unique
+index and then fails with IntegrityError, after which it looks the key up
+again and replays the winner's response. ``sweep_expired_keys()`` purges
+expired rows in the background.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import and_, delete, func, select
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+IDEMPOTENCY_SWEEP_INTERVAL = int(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", "300"))  # seconds
+IDEMPOTENCY_SWEEP_BATCH_SIZE = int(os.getenv("IDEMPOTENCY_SWEEP_BATCH_SIZE", "1000"))
+
+
+def hash_request(request) -> str:
+    """Fingerprint a request without its key, so a key reused with a different payload can be rejected"""
+    payload = type(request)()
+    payload.CopyFrom(request)
+    payload.ClearField("idempotency_key")
+    return hashlib.sha256(payload.SerializeToString(deterministic=True)).hexdigest()
+
+
+class IdempotencyKeys:
+    """Claim, look up and purge the rows of one idempotency key table"""
+
+    def __init__(self, model, ttl_hours: int = IDEMPOTENCY_KEY_TTL_HOURS):
+        self.model = model
+        self.ttl_hours = ttl_hours
+
+    async def get(self, db, user_id: int, key: str) -> Optional[object]:
+        """Look up a live key (single unique-index lookup)"""
+        model = self.model
+        result = await db.execute(
+            select(model).where(
+                and_(
+                    model.user_id == user_id,
+                    model.idempotency_key == key,
+                    model.expires_at > func.now()
+                )
+            )
+        )
+        return result.scalar_one_or_none()
+
+    async def claim(self, db, user_id: int, key: str, request_hash: str):
+        """Insert the key row inside the current transaction.
+
+        A concurrent retry with the same key blocks on the unique index until
+        this transaction finishes and then fails with IntegrityError.
+        """
+        model = self.model
+        # Drop an expired row for the same key so it can be reused
+        await db.execute(
+            delete(model).where(
+                and_(
+                    model.user_id == user_id,
+                    model.idempotency_key == key,
+                    model.expires_at <= func.now()
+                )
+            )
+        )
+        record = model(
+            user_id=user_id,
+            idempotency_key=key,
+            request_hash=request_hash,
+            expires_at=func.now() + timedelta(hours=self.ttl_hours)
+        )
+        db.add(record)
+        await db.flush()
+        return record
+
+    async def purge_expired(self, db, batch_size: int = IDEMPOTENCY_SWEEP_BATCH_SIZE) -> int:
+        """Delete expired keys in batches, committing after each batch"""
+        model = self.model
+        total_deleted = 0
+        while True:
+            expired_ids = (
+                select(model.id)
+                .where(model.expires_at <= func.now())
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = await db.execute(
+                delete(model)
+                .where(model.id.in_(expired_ids))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            total_deleted += result.rowcount
+            if result.rowcount < batch_size:
+                return total_deleted
+
+
+async def sweep_expired_keys(keys: IdempotencyKeys, session_factory, interval: int = IDEMPOTENCY_SWEEP_INTERVAL):
+    """Periodically purge expired idempotency keys"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                deleted = await keys.purge_expired(db)
+            if deleted:
+                logger.info(f"Purged {deleted} expired idempotency keys")
+        except Exception as e:
+            logger.error(f"Error purging idempotency keys: {e}")
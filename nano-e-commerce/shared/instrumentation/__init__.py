@@ -0,0 +1,295 @@
+"""Metrics and tracing instrumentation shared by the gateway and every service.
+
+Copied into each image next to ``app/`` (see the service Dockerfiles) and put
+on PYTHONPATH by ``scripts/dev-start-local.sh``. Metrics are served from the
+service's existing FastAPI app at ``GET /metrics``:
+
+- ``instrument_app(app)``: HTTP RED metrics middleware plus the /metrics route
+- ``MetricsInterceptor``: gRPC server interceptor with per-method RED metrics
+- ``GRPC_SERVER_OPTIONS``: keepalive and connection-age options for gRPC servers
+- ``instrumentation.db.InstrumentedAsyncPool``: SQLAlchemy pool class recording
+  checkout wait time (kept separate because api-gateway has no database)
+- ``InstrumentedRedis``: redis.asyncio client recording per-command latency
+- ``monitor_event_loop_lag()``: background loop publishing event loop lag
+- ``instrumentation.blocking.detect_blocking_calls()``: opt-in watchdog logging
+  the stack of calls that block the event loop
+- ``instrumentation.tracing``: opt-in OpenTelemetry tracing with W3C trace context
+
+When a server runs several worker processes, set ``PROMETHEUS_MULTIPROC_DIR``
+so /metrics aggregates every worker (prometheus_client multiprocess mode).
+"""
+import asyncio
+import glob
+import os
+import time
+
+import grpc
+import redis.asyncio as redis
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+)
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+from redis.asyncio.client import Pipeline
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Shared directory for per-process metric files; unset for single-process servers
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# gRPC server options for every service: accept the gateway's keepalive pings
+# on idle connections, and recycle connections so round_robin clients
+# re-resolve DNS and find new pods
+GRPC_MAX_CONNECTION_AGE_MS = int(os.getenv("GRPC_MAX_CONNECTION_AGE_MS", "300000"))
+GRPC_MAX_CONNECTION_AGE_GRACE_MS = int(os.getenv("GRPC_MAX_CONNECTION_AGE_GRACE_MS", "120000"))
+GRPC_SERVER_OPTIONS = [
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_ping_interval_without_data_ms", 10000),
+    ("grpc.max_connection_age_ms", GRPC_MAX_CONNECTION_AGE_MS),
+    ("grpc.max_connection_age_grace_ms", GRPC_MAX_CONNECTION_AGE_GRACE_MS),
+]
+
+# How often the event loop lag probe wakes up
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))  # seconds
+
+# Pool checkouts and Redis round trips are mostly sub-millisecond
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+GRPC_REQUESTS = Counter(
+    "grpc_server_requests_total", "gRPC requests handled", ["method"]
+)
+GRPC_ERRORS = Counter(
+    "grpc_server_errors_total", "gRPC requests that ended with a non-OK status", ["method", "code"]
+)
+GRPC_LATENCY = Histogram(
+    "grpc_server_request_duration_seconds", "gRPC request latency", ["method"]
+)
+GRPC_IN_FLIGHT = Gauge(
+    "grpc_server_in_flight_requests", "gRPC requests being handled", ["method"],
+    multiprocess_mode="livesum"
+)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_ERRORS = Counter(
+    "http_request_errors_total", "HTTP requests answered with a 5xx status", ["method", "route"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled", ["method"],
+    multiprocess_mode="livesum"
+)
+
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds", "Redis command round trip time", ["command"], buckets=FAST_BUCKETS
+)
+REDIS_ERRORS = Counter(
+    "redis_command_errors_total", "Redis commands that raised", ["command"]
+)
+
+EVENT_LOOP_LAG = Gauge(
+    "event_loop_lag_seconds", "How late the event loop lag probe last woke up"
+)
+EVENT_LOOP_LAG_HISTOGRAM = Histogram(
+    "event_loop_lag_distribution_seconds", "Event loop lag probe delays", buckets=FAST_BUCKETS
+)
+
+
+class MetricsInterceptor(grpc.aio.ServerInterceptor):
+    """Records request count, non-OK statuses, latency and in-flight requests per gRPC method"""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        method = handler_call_details.method
+        if handler.unary_unary:
+            return grpc.unary_unary_rpc_method_handler(
+                self._wrap_unary(method, handler.unary_unary),
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        if handler.unary_stream:
+            return grpc.unary_stream_rpc_method_handler(
+                self._wrap_stream(method, handler.unary_stream),
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        # Client-streaming methods are not used; leave them uninstrumented
+        return handler
+
+    def _wrap_unary(self, method, behavior):
+        async def wrapper(request, context):
+            start = self._start(method)
+            code = None
+            try:
+                return await behavior(request, context)
+            except Exception:
+                code = grpc.StatusCode.UNKNOWN
+                raise
+            finally:
+                self._finish(method, context, start, code)
+        return wrapper
+
+    def _wrap_stream(self, method, behavior):
+        async def wrapper(request, context):
+            start = self._start(method)
+            code = None
+            try:
+                async for response in behavior(request, context):
+                    yield response
+            except Exception:
+                code = grpc.StatusCode.UNKNOWN
+                raise
+            finally:
+                self._finish(method, context, start, code)
+        return wrapper
+
+    @staticmethod
+    def _start(method) -> float:
+        GRPC_REQUESTS.labels(method).inc()
+        GRPC_IN_FLIGHT.labels(method).inc()
+        return time.perf_counter()
+
+    @staticmethod
+    def _finish(method, context, start: float, code):
+        GRPC_LATENCY.labels(method).observe(time.perf_counter() - start)
+        GRPC_IN_FLIGHT.labels(method).dec()
+        # A status set on the context (set_code or abort) wins over the exception default
+        code = context.code() or code
+        if code is not None and code != grpc.StatusCode.OK:
+            GRPC_ERRORS.labels(method, getattr(code, "name", str(code))).inc()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording HTTP RED metrics labelled by route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.labels(method).dec()
+            # The router stores the matched route in the scope; templates keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            if status >= 500:
+                HTTP_ERRORS.labels(method, route).inc()
+
+
+# Custom collectors report live state of the process answering the scrape
+_process_collectors = []
+
+
+def register_collector(collector):
+    """Register a custom collector, also under multiprocess mode"""
+    REGISTRY.register(collector)
+    _process_collectors.append(collector)
+
+
+def reset_multiprocess_metrics():
+    """Delete metric files left by a previous run; call in the parent before starting workers"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+
+
+def mark_worker_dead():
+    """Drop this process's live gauges (in-flight requests) when it shuts down"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        mark_process_dead(os.getpid(), PROMETHEUS_MULTIPROC_DIR)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    # A fresh registry per scrape, as prometheus_client requires in multiprocess mode
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, PROMETHEUS_MULTIPROC_DIR)
+    for collector in _process_collectors:
+        registry.register(collector)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_app(app):
+    """Add the HTTP metrics middleware and the /metrics route to a FastAPI app"""
+    app.add_middleware(MetricsMiddleware)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+
+
+def _command_name(args) -> str:
+    if not args:
+        return "UNKNOWN"
+    name = args[0]
+    if isinstance(name, bytes):
+        name = name.decode("utf-8", "replace")
+    # Multi-word commands ("CLIENT SETNAME") keep only the first word
+    return str(name).split(" ", 1)[0].upper()
+
+
+class InstrumentedPipeline(Pipeline):
+    """Pipeline whose execute() round trip is recorded as a single PIPELINE command"""
+
+    async def execute(self, raise_on_error: bool = True):
+        command = "MULTI" if self.is_transaction else "PIPELINE"
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except Exception:
+            REDIS_ERRORS.labels(command).inc()
+            raise
+        finally:
+            REDIS_LATENCY.labels(command).observe(time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.Redis):
+    """redis.asyncio client recording latency and errors per command"""
+
+    async def execute_command(self, *args, **options):
+        command = _command_name(args)
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            REDIS_ERRORS.labels(command).inc()
+            raise
+        finally:
+            REDIS_LATENCY.labels(command).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL):
+    """Sleep for `interval` repeatedly and publish how late each wake-up was"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
@@ -0,0 +1,142 @@
+"""Watchdog that catches blocking calls on the asyncio event loop.
+
+A daemon thread schedules a no-op on the loop every BLOCKING_CHECK_INTERVAL
+seconds. If the loop does not run it within BLOCKING_THRESHOLD, the thread
+samples the loop thread's current stack with ``sys._current_frames()``, waits
+for the loop to come back, and records how long it was stuck. The probe costs
+one ``call_soon_threadsafe`` per interval, unlike asyncio debug mode, so it can
+stay on in production.
+
+Stacks are logged at most once per BLOCKING_LOG_INTERVAL per call site; every
+occurrence is counted in the ``event_loop_blocked_*`` metrics.
+"""
+import asyncio
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from typing import Optional
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: started by detect_blocking_calls() only when enabled
+BLOCKING_DETECTOR_ENABLED = os.getenv("BLOCKING_DETECTOR_ENABLED", "false").lower() == "true"
+BLOCKING_THRESHOLD = float(os.getenv("BLOCKING_THRESHOLD", "0.1"))  # seconds
+BLOCKING_CHECK_INTERVAL = float(os.getenv("BLOCKING_CHECK_INTERVAL", "0.25"))  # seconds
+BLOCKING_LOG_INTERVAL = float(os.getenv("BLOCKING_LOG_INTERVAL", "60"))  # seconds per call site
+BLOCKING_STACK_DEPTH = int(os.getenv("BLOCKING_STACK_DEPTH", "30"))
+
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total", "Times the event loop stayed blocked past the threshold", ["location"]
+)
+EVENT_LOOP_BLOCKED_DURATION = Histogram(
+    "event_loop_blocked_seconds", "How long the event loop stayed blocked once past the threshold",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+# Frames from these directories are skipped when naming the blocking call site
+_LIBRARY_PATHS = tuple(
+    os.path.normpath(path) + os.sep
+    for path in {sysconfig.get_paths()["stdlib"], sysconfig.get_paths()["purelib"],
+                 sysconfig.get_paths()["platlib"]}
+)
+
+
+def _location(stack: traceback.StackSummary) -> str:
+    """Innermost application frame as "file:function", else the innermost frame"""
+    for frame in reversed(stack):
+        filename = os.path.normpath(frame.filename)
+        if not filename.startswith(_LIBRARY_PATHS) and "site-packages" not in filename:
+            return f"{os.path.relpath(filename)}:{frame.name}"
+    if stack:
+        return f"{os.path.basename(stack[-1].filename)}:{stack[-1].name}"
+    return "unknown"
+
+
+class BlockingDetector:
+    """Watchdog thread reporting event loop stalls with the stack that caused them"""
+
+    def __init__(self, threshold: float = BLOCKING_THRESHOLD, interval: float = BLOCKING_CHECK_INTERVAL,
+                 log_interval: float = BLOCKING_LOG_INTERVAL, stack_depth: int = BLOCKING_STACK_DEPTH):
+        self.threshold = threshold
+        self.interval = interval
+        self.log_interval = log_interval
+        self.stack_depth = stack_depth
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._logged = {}  # location -> (last logged at, occurrences not logged since)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Watch `loop`; must be called from the thread running it"""
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="blocking-detector", daemon=True)
+        self._thread.start()
+        logger.info(f"Blocking call detector started (threshold {self.threshold}s)")
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            ran = threading.Event()
+            try:
+                self._loop.call_soon_threadsafe(ran.set)
+            except RuntimeError:
+                # Loop closed
+                return
+            start = time.monotonic()
+            if ran.wait(self.threshold):
+                continue
+
+            # Still blocked: sample the stack now, while the offending call is on it
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.extract_stack(frame, limit=self.stack_depth) if frame is not None else None
+            del frame
+            while not ran.wait(self.interval):
+                if self._stop.is_set():
+                    return
+            self._report(stack, time.monotonic() - start)
+
+    def _report(self, stack: Optional[traceback.StackSummary], blocked: float):
+        stack = stack or traceback.StackSummary()
+        location = _location(stack)
+        EVENT_LOOP_BLOCKED.labels(location).inc()
+        EVENT_LOOP_BLOCKED_DURATION.observe(blocked)
+
+        now = time.monotonic()
+        last_logged, suppressed = self._logged.get(location, (None, 0))
+        if last_logged is not None and now - last_logged < self.log_interval:
+            self._logged[location] = (last_logged, suppressed + 1)
+            return
+        self._logged[location] = (now, 0)
+        logger.warning(
+            f"Event loop blocked for {blocked:.3f}s at {location}"
+            f" ({suppressed} similar stalls not logged)\n{''.join(stack.format())}"
+        )
+
+
+# Global detector instance
+blocking_detector = BlockingDetector()
+
+
+async def detect_blocking_calls(enabled: bool = BLOCKING_DETECTOR_ENABLED):
+    """Run the blocking call detector for as long as this task runs, if enabled"""
+    if not enabled:
+        return
+    blocking_detector.start(asyncio.get_running_loop())
+    try:
+        await asyncio.Event().wait()
+    finally:
+        blocking_detector.stop()
@@ -0,0 +1,53 @@
+"""Database pool and statement instrumentation, for the services that have a database"""
+import time
+import weakref
+
+from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from instrumentation import FAST_BUCKETS
+from instrumentation.tracing import TRACING_ENABLED
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a database connection", buckets=FAST_BUCKETS
+)
+DB_POOL_CHECKOUT_ERRORS = Counter(
+    "db_pool_checkout_errors_total", "Database connection checkouts that failed or timed out"
+)
+
+# Live pools; engine.dispose() replaces the pool, so the gauge reads whatever exists now
+_pools = weakref.WeakSet()
+
+Gauge(
+    "db_pool_checked_out_connections", "Database connections currently checked out"
+).set_function(lambda: sum(pool.checkedout() for pool in list(_pools)))
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Async engine pool that records how long each checkout waited.
+
+    Pass as ``create_async_engine(..., poolclass=InstrumentedAsyncPool)``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _pools.add(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            DB_POOL_CHECKOUT_ERRORS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def trace_engine(engine: AsyncEngine):
+    """Record a span per SQL statement executed through `engine` when tracing is enabled"""
+    if not TRACING_ENABLED:
+        return
+    SQLAlchemyInstrumentor().instrument(engine=engine.sync_engine)
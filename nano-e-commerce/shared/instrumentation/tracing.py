@@ -0,0 +1,107 @@
+"""Distributed tracing with W3C trace context (OpenTelemetry).
+
+The gateway starts a span per HTTP request; ``traceparent`` travels to the
+services in gRPC metadata through the client interceptors and is picked up by
+the server interceptors, so one trace covers gateway → gRPC → Redis/Postgres.
+
+Tracing is off unless TRACING_EXPORTER is set:
+
+- ``otlp``: batch export to an OTLP/gRPC collector (standard
+  ``OTEL_EXPORTER_OTLP_*`` variables, e.g. ``OTEL_EXPORTER_OTLP_ENDPOINT``)
+- ``jsonl``: one JSON span per line appended to TRACING_JSONL_PATH
+
+Traces are sampled at the gateway with TRACING_SAMPLE_RATIO and services
+follow the caller's decision. Unsampled requests only carry the header.
+"""
+import logging
+import os
+import threading
+from typing import Optional, Sequence
+
+from opentelemetry import trace
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.instrumentation.grpc import aio_client_interceptors, aio_server_interceptor
+from opentelemetry.instrumentation.redis import RedisInstrumentor
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "").lower()  # "", "otlp" or "jsonl"
+TRACING_ENABLED = TRACING_EXPORTER in ("otlp", "jsonl")
+# Fraction of new traces recorded; 1% keeps the overhead negligible
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "0.01"))
+TRACING_JSONL_PATH = os.getenv("TRACING_JSONL_PATH", "traces.jsonl")
+
+# HTTP endpoints polled by Prometheus and health checks are never traced
+TRACING_EXCLUDED_URLS = "health,metrics"
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str = TRACING_JSONL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with self._lock:
+                self._file.write(lines)
+                self._file.flush()
+        except OSError as e:
+            logger.warning(f"Failed to write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+def _exporter() -> SpanExporter:
+    if TRACING_EXPORTER == "jsonl":
+        return JsonLinesSpanExporter()
+    # Imported here so the jsonl mode works without a collector client configured
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    return OTLPSpanExporter()
+
+
+def setup_tracing(service_name: str, app=None) -> Optional[TracerProvider]:
+    """Install the tracer provider and trace Redis (and `app`'s HTTP requests, if given)"""
+    if not TRACING_ENABLED:
+        return None
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    # Spans are exported from a background thread, off the event loop
+    provider.add_span_processor(BatchSpanProcessor(_exporter()))
+    trace.set_tracer_provider(provider)
+
+    RedisInstrumentor().instrument(tracer_provider=provider)
+    if app is not None:
+        FastAPIInstrumentor.instrument_app(
+            app, tracer_provider=provider, excluded_urls=TRACING_EXCLUDED_URLS
+        )
+    logger.info(f"Tracing enabled ({TRACING_EXPORTER}, sample ratio {TRACING_SAMPLE_RATIO})")
+    return provider
+
+
+def server_interceptors() -> list:
+    """Interceptors continuing the caller's trace in a gRPC server; put them first"""
+    if not TRACING_ENABLED:
+        return []
+    return [aio_server_interceptor()]
+
+
+def client_interceptors() -> list:
+    """Interceptors injecting the current trace context into outgoing gRPC metadata"""
+    if not TRACING_ENABLED:
+        return []
+    return aio_client_interceptors()